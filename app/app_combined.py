@@ -9,6 +9,7 @@ import os
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import io
 
 # Setup paths
@@ -20,8 +21,10 @@ if PROJECT_ROOT not in sys.path:
 # Imports
 from src.inference import NERPredictor
 from src import config as ner_config
-from src.patient_extraction.manual_extractor import extract_single_patient
+from src.patient_extraction.manual_extractor import extract_single_patient, predict_segments, extract_patients
 from src.patient_extraction.gemini_splitter import split_text_with_gemini
+from src.patient_extraction.local_splitter import split_text_locally
+from src.patient_extraction.segment_alignment import align_segments, entities_in_span
 from src.patient_extraction.entity_structures import PatientRecord
 
 # Import render_entities từ utils
@@ -363,42 +366,77 @@ def auto_mode_tab(predictor: NERPredictor):
         if not user_text.strip():
             st.warning("Vui lòng nhập văn bản cần xử lý")
         else:
-            # Step 1: Split with Gemini (sử dụng API key built-in)
-            with st.spinner("Đang sử dụng Gemini AI để tách văn bản..."):
-                try:
-                    segments, metadata = split_text_with_gemini(
-                        text=user_text,
-                        api_key=GEMINI_API_KEY,  # Sử dụng API key đã cấu hình sẵn
-                        return_metadata=True
+            # Step 1: NER toàn văn bản (chạy nền); tách theo PATIENT_ID tại chỗ, chỉ gọi Gemini khi cấu trúc
+            # không rõ ràng (GEMINI_SPECULATIVE_SPLIT: gọi Gemini ngay cùng lúc với NER, tốn request cho mọi văn bản)
+            split_pool = ThreadPoolExecutor(max_workers=2)
+            ner_future = split_pool.submit(predictor.predict, user_text)
+            
+            def submit_gemini():
+                return split_pool.submit(
+                    split_text_with_gemini,
+                    text=user_text,
+                    api_key=GEMINI_API_KEY,  # Sử dụng API key đã cấu hình sẵn
+                    return_metadata=True
+                )
+            
+            gemini_future = None
+            if not ner_config.LOCAL_SPLITTER_ENABLED or ner_config.GEMINI_SPECULATIVE_SPLIT:
+                gemini_future = submit_gemini()
+            segments = None
+            if ner_config.LOCAL_SPLITTER_ENABLED:
+                with st.spinner("Đang tách văn bản theo mã bệnh nhân..."):
+                    segments, metadata = split_text_locally(
+                        user_text, predictor, entities=ner_future.result(), return_metadata=True
                     )
-                    st.session_state.auto_text_segments = segments
-                    
-                    with st.expander("📊 Thông tin tách văn bản"):
-                        st.write(f"- **Số đoạn:** {metadata['num_segments']}")
-                        st.write(f"- **Độ dài gốc:** {metadata['original_length']} ký tự")
-                        if 'error' in metadata:
-                            st.warning(f"⚠️ Có lỗi: {metadata['error']}")
-                    
-                except Exception as e:
-                    st.error(f" Lỗi khi gọi Gemini API: {e}")
-                    st.stop()
             
-            # Step 2: Process each segment and auto-add to list
-            patient_records = []
+            if segments is None:
+                with st.spinner("Đang sử dụng Gemini AI để tách văn bản..."):
+                    try:
+                        segments, metadata = (gemini_future or submit_gemini()).result()
+                    except Exception as e:
+                        split_pool.shutdown(wait=False)
+                        st.error(f" Lỗi khi gọi Gemini API: {e}")
+                        st.stop()
+            
+            with st.spinner("Đang chạy NER..."):
+                document_entities = ner_future.result()
+            split_pool.shutdown(wait=False)
+            
+            # Gán entities của toàn văn bản cho từng đoạn theo vị trí trong văn bản gốc
+            spans = align_segments(user_text, segments)
+            ner_results_list = [entities_in_span(document_entities, *span) if span else None for span in spans]
+            segments = [user_text[span[0]:span[1]] if span else segment for segment, span in zip(segments, spans)]
+            st.session_state.auto_text_segments = segments
+            
+            with st.expander("📊 Thông tin tách văn bản"):
+                st.write(f"- **Số đoạn:** {metadata['num_segments']}")
+                st.write(f"- **Độ dài gốc:** {metadata['original_length']} ký tự")
+                st.write(f"- **Phương pháp:** {'PATIENT_ID (tại chỗ)' if metadata.get('method') == 'local' else 'Gemini AI'}")
+                if 'error' in metadata:
+                    st.warning(f"⚠️ Có lỗi: {metadata['error']}")
+            
+            # Step 2: NER cho các đoạn không căn được về văn bản gốc (predict_batch), rồi trích xuất
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for i, segment in enumerate(segments):
-                progress = (i + 1) / len(segments)
-                progress_bar.progress(progress)
-                status_text.text(f"Đang xử lý {i+1}/{len(segments)}...")
-                
-                # Run NER
-                ner_results = predictor.predict(segment)
-                
-                # Extract patient and auto-add to list
-                record = extract_single_patient(ner_results, segment)
-                patient_records.append(record)
+            pending = [i for i, ner_results in enumerate(ner_results_list) if ner_results is None]
+            if pending:
+                status_text.text(f"Đang chạy NER cho {len(pending)} đoạn...")
+                for i, ner_results in zip(pending, predict_segments(predictor, [segments[i] for i in pending])):
+                    ner_results_list[i] = ner_results
+            progress_bar.progress(0.5)
+            
+            status_text.text(f"Đang trích xuất thông tin {len(segments)} bệnh nhân...")
+            results = extract_patients(ner_results_list, segments)
+            progress_bar.progress(1.0)
+            
+            # Đoạn bị lỗi được bỏ qua, các đoạn khác vẫn được thêm vào danh sách
+            patient_records = []
+            for i, result in enumerate(results, 1):
+                if isinstance(result, Exception):
+                    st.warning(f"⚠️ Lỗi khi xử lý đoạn {i}: {result}")
+                else:
+                    patient_records.append(result)
             
             progress_bar.empty()
             status_text.empty()
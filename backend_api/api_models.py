@@ -4,7 +4,7 @@ Pydantic models cho request/response của API endpoints
 """
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Union
 
 
 class HealthCheckResponse(BaseModel):
@@ -13,6 +13,10 @@ class HealthCheckResponse(BaseModel):
     model_loaded: bool
     vncorenlp_available: bool
     gemini_configured: bool
+    inference_queue: Optional[Dict[str, int]] = None
+    micro_batching: Optional[Dict[str, Any]] = None
+    model_workers: Optional[Dict[str, Any]] = None
+    jobs: Optional[Dict[str, int]] = None
     timestamp: str
 
 
@@ -27,6 +31,7 @@ class EntityResponse(BaseModel):
     tag: str
     start: int
     end: int
+    confidence: Optional[float] = None
 
 
 class NERPredictResponse(BaseModel):
@@ -37,6 +42,31 @@ class NERPredictResponse(BaseModel):
     error: Optional[str] = None
 
 
+class NERStreamChunk(BaseModel):
+    """Một sự kiện SSE của endpoint streaming: entities của một khối văn bản vừa xử lý xong"""
+    entities: List[EntityResponse]
+    processed_chars: int
+    total_chars: int
+
+
+class BatchDocument(BaseModel):
+    """Một văn bản trong request predict-batch"""
+    id: Union[int, str] = Field(..., description="Mã văn bản, được trả lại cùng kết quả")
+    text: str = Field(..., description="Văn bản cần phân tích")
+
+
+class NERBatchRequest(BaseModel):
+    """Request cho bulk prediction (JSON; hoặc upload NDJSON mỗi dòng một BatchDocument)"""
+    documents: List[BatchDocument]
+
+
+class NERBatchResult(BaseModel):
+    """Một dòng NDJSON của predict-batch: kết quả của một văn bản"""
+    id: Union[int, str]
+    entities: List[EntityResponse] = []
+    error: Optional[str] = None
+
+
 class PatientRecordResponse(BaseModel):
     """Response cho thông tin bệnh nhân"""
     patient_id: Optional[str] = None
@@ -88,3 +118,22 @@ class AutoExtractResponse(BaseModel):
     patients: List[PatientSegmentResponse]
     processing_time: float
     error: Optional[str] = None
+
+
+class JobSubmitResponse(BaseModel):
+    """Response khi gửi job bất đồng bộ"""
+    job_id: str
+    kind: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    """Trạng thái và tiến độ (0-1 theo từng giai đoạn) của một job"""
+    job_id: str
+    kind: str
+    status: str = Field(..., description="queued / running / done / failed")
+    stage: Optional[str] = Field(None, description="Giai đoạn đang chạy")
+    progress: Dict[str, float]
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
@@ -0,0 +1,128 @@
+# backend_api/batcher.py
+"""
+Micro-batching cho các request NER đồng thời
+Gom văn bản của nhiều request trong vài mili giây (hoặc tới khi đủ số token tối đa) rồi chạy
+một lần NERPredictor.predict_batch (một batch có padding) thay cho nhiều batch chỉ có một câu
+"""
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from backend_api.executor import BoundedExecutor
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token của văn bản (số từ tách theo khoảng trắng, mỗi âm tiết ~ 1 token)"""
+    return len(text.split())
+
+
+class MicroBatcher:
+    """
+    Bộ lập lịch micro-batch chạy trên event loop của server
+
+    Request đầu tiên mở một batch; batch được gửi đi khi đã chờ max_wait_ms, hoặc đủ max_texts
+    văn bản, hoặc tổng số token ước lượng đạt max_tokens. Mỗi batch chạy trong BoundedExecutor,
+    nên vẫn bị giới hạn bởi hàng đợi suy luận (QueueFullError cho mọi request của batch).
+    """
+
+    def __init__(self, predict_batch: Callable, executor: BoundedExecutor,
+                 max_wait_ms: float, max_texts: int, max_tokens: int):
+        """
+        Args:
+            predict_batch: Hàm predict_batch(texts, return_trace=True) -> (results, trace)
+            executor: Executor chạy các batch
+            max_wait_ms: Thời gian tối đa giữ batch mở để chờ thêm request (mili giây)
+            max_texts: Số văn bản tối đa mỗi batch
+            max_tokens: Tổng số token ước lượng tối đa mỗi batch
+        """
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.max_wait_ms = max_wait_ms
+        self.max_texts = max_texts
+        self.max_tokens = max_tokens
+        self._queue = None
+        self._collector = None
+        self._dispatching = set()
+
+        # Số liệu theo dõi
+        self.batch_size_histogram = Counter()
+        self.num_batches = 0
+        self.num_requests = 0
+        self.total_wait = 0.0
+
+    async def submit(self, text: str) -> Tuple[List[Dict[str, Any]], Any]:
+        """
+        Dự đoán entity cho một văn bản trong micro-batch tiếp theo
+
+        Returns:
+            Tuple (entities, trace) - trace là InferenceTrace của cả batch
+
+        Raises:
+            QueueFullError: Nếu executor từ chối batch
+        """
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> None:
+        """Vòng lặp gom request thành batch và gửi đi (không chờ batch trước chạy xong)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            num_tokens = estimate_tokens(batch[0][0])
+            deadline = loop.time() + self.max_wait_ms / 1000
+
+            while len(batch) < self.max_texts and num_tokens < self.max_tokens:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                num_tokens += estimate_tokens(item[0])
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        """Chạy một batch trong executor và trả kết quả cho từng request"""
+        dispatch_time = time.perf_counter()
+        self.num_batches += 1
+        self.num_requests += len(batch)
+        self.batch_size_histogram[len(batch)] += 1
+        self.total_wait += sum(dispatch_time - enqueued for _, _, enqueued in batch)
+
+        try:
+            results, trace = await self.executor.run(self.predict_batch, [text for text, _, _ in batch],
+                                                     return_trace=True)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), entities in zip(batch, results):
+            if not future.done():  # Request có thể đã bị hủy (client ngắt kết nối)
+                future.set_result((entities, trace))
+
+    def stats(self) -> Dict[str, Any]:
+        """Cấu hình và số liệu của micro-batching (histogram kích thước batch, thời gian chờ)"""
+        return {
+            "max_wait_ms": self.max_wait_ms,
+            "max_texts": self.max_texts,
+            "max_tokens": self.max_tokens,
+            "batches": self.num_batches,
+            "requests": self.num_requests,
+            "mean_batch_size": self.num_requests / self.num_batches if self.num_batches else 0.0,
+            "mean_wait_ms": self.total_wait * 1000 / self.num_requests if self.num_requests else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items()))
+        }
@@ -0,0 +1,85 @@
+# backend_api/executor.py
+"""
+Executor có giới hạn hàng đợi cho các tác vụ suy luận (blocking) của Backend API
+Chạy NER ngoài event loop và từ chối request mới khi hàng đợi đã đầy (backpressure)
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class QueueFullError(Exception):
+    """Hàng đợi của executor đã đầy, request nên được thử lại sau"""
+    pass
+
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor giới hạn tổng số tác vụ đang chạy + đang chờ
+
+    Tối đa max_workers tác vụ chạy song song và queue_depth tác vụ chờ; tác vụ vượt quá
+    bị từ chối ngay bằng QueueFullError thay vì xếp hàng làm tăng độ trễ của mọi request.
+    """
+
+    def __init__(self, max_workers: int, queue_depth: int, thread_name_prefix: str = "inference"):
+        """
+        Args:
+            max_workers: Số luồng chạy tác vụ
+            queue_depth: Số tác vụ tối đa được chờ khi mọi luồng đều bận
+            thread_name_prefix: Tiền tố tên luồng
+        """
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_depth)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Chạy fn(*args, **kwargs) trong executor và chờ kết quả mà không chặn event loop
+
+        Raises:
+            QueueFullError: Nếu đã có max_workers + queue_depth tác vụ đang chạy hoặc đang chờ
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(f"Hàng đợi suy luận đã đầy ({self.max_workers + self.queue_depth} tác vụ)")
+
+        with self._lock:
+            self._pending += 1
+
+        def task():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(task)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, int]:
+        """Số tác vụ đang chạy/chờ và số request đã bị từ chối"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "pending": self._pending,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Dừng executor (gọi khi server tắt)"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,263 @@
+# backend_api/jobs.py
+"""
+Job bất đồng bộ cho văn bản rất lớn
+Request được lưu vào SQLite và trả job id ngay; worker (asyncio task trong server) xử lý lần lượt,
+cập nhật tiến độ từng giai đoạn để client poll / stream, và lưu kết quả. Job đang chạy khi server
+dừng được đưa lại vào hàng đợi khi khởi động lại.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("ner_api")
+
+# Trạng thái của job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Lưu job trong một file SQLite (request, trạng thái, tiến độ, kết quả)
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Đường dẫn file SQLite (thư mục được tạo nếu chưa có)
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    def create(self, kind: str, request: Dict[str, Any], stages: List[str], job_id: str = None) -> Dict[str, Any]:
+        """Tạo job mới ở trạng thái queued, tiến độ 0 cho mọi giai đoạn (job_id mặc định là uuid mới)"""
+        now = time.time()
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, stage, progress, request, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, None, json.dumps({stage: 0.0 for stage in stages}),
+                 json.dumps(request, ensure_ascii=False), now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Đọc một job (kèm request và kết quả nếu with_result=True)"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row, with_result) if row else None
+
+    def update(self, job_id: str, **fields) -> None:
+        """Cập nhật các cột của job (progress / result được chuyển sang JSON)"""
+        for key in ("progress", "result"):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Lấy job queued cũ nhất và chuyển sang running (None nếu hàng đợi rỗng)"""
+        with self._lock, self._conn:
+            while True:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                # Điều kiện status = queued tránh hai tiến trình server cùng nhận một job
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    (RUNNING, time.time(), row["id"], QUEUED)
+                ).rowcount
+                if claimed:
+                    return self._to_dict(row, with_result=True)
+
+    def requeue_interrupted(self) -> int:
+        """Đưa các job đang running (server bị dừng giữa chừng) trở lại hàng đợi"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (QUEUED, time.time(), RUNNING)
+            ).rowcount
+
+    def purge(self, older_than: float) -> int:
+        """Xóa các job đã kết thúc (done / failed) cũ hơn older_than giây"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, time.time() - older_than)
+            ).rowcount
+
+    def count(self, status: str) -> int:
+        """Số job ở một trạng thái"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row, with_result: bool) -> Dict[str, Any]:
+        job = {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "progress": json.loads(row["progress"]),
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+        if with_result:
+            job["request"] = json.loads(row["request"])
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+
+# handler(request, report, secrets) -> result (dict, lưu dạng JSON); report(stage, fraction) là coroutine
+JobHandler = Callable[[Dict[str, Any], Callable[[str, float], Awaitable[None]], Dict[str, Any]],
+                      Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    """
+    Hàng đợi job chạy trên event loop của server
+
+    Mỗi loại job (kind) đăng ký danh sách giai đoạn và một handler async. Handler nhận request,
+    coroutine report(stage, fraction) để cập nhật tiến độ và secrets (ví dụ API key - chỉ giữ trong bộ
+    nhớ, không ghi vào SQLite). Mọi thao tác với JobStore (SQLite, blocking) chạy trong threadpool,
+    không chặn event loop.
+    """
+
+    def __init__(self, store: JobStore, num_workers: int = 1, retention_seconds: float = None):
+        """
+        Args:
+            store: JobStore lưu job
+            num_workers: Số job được xử lý đồng thời
+            retention_seconds: Xóa job đã kết thúc cũ hơn số giây này khi khởi động (None = giữ lại)
+        """
+        self.store = store
+        self.num_workers = num_workers
+        self.retention_seconds = retention_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._stages: Dict[str, List[str]] = {}
+        self._secrets: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    def register(self, kind: str, stages: List[str], handler: JobHandler) -> None:
+        """Đăng ký một loại job"""
+        self._handlers[kind] = handler
+        self._stages[kind] = stages
+
+    async def submit(self, kind: str, request: Dict[str, Any], secrets: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Lưu job mới vào hàng đợi và trả về thông tin job (gồm job_id)"""
+        # Secrets được đăng ký trước khi job vào hàng đợi, để worker nhận job luôn thấy chúng
+        job_id = uuid.uuid4().hex
+        if secrets:
+            self._secrets[job_id] = secrets
+        try:
+            job = await run_in_threadpool(self.store.create, kind, request, self._stages[kind], job_id)
+        except Exception:
+            self._secrets.pop(job_id, None)
+            raise
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Đọc một job (xem JobStore.get)"""
+        return await run_in_threadpool(self.store.get, job_id, with_result)
+
+    async def start(self) -> None:
+        """Khởi động các worker (gọi trong startup event của server)"""
+        requeued = await run_in_threadpool(self.store.requeue_interrupted)
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted job(s)")
+        if self.retention_seconds is not None:
+            purged = await run_in_threadpool(self.store.purge, self.retention_seconds)
+            if purged:
+                logger.info(f"Purged {purged} old job(s)")
+
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self) -> None:
+        """Dừng các worker; job đang chạy sẽ được chạy lại khi server khởi động lại"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def stats(self) -> Dict[str, int]:
+        """Số job theo trạng thái"""
+        def count_all():
+            return {status: self.store.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+        return await run_in_threadpool(count_all)
+
+    async def _worker(self) -> None:
+        """Lấy job queued cũ nhất và chạy handler tương ứng"""
+        while True:
+            job = await run_in_threadpool(self.store.claim_next)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Thức dậy khi có job mới, hoặc định kỳ (job do tiến trình khác thêm vào)
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """Chạy một job và lưu kết quả / lỗi"""
+        job_id = job["job_id"]
+        progress = job["progress"]
+        start_time = time.time()
+        logger.info(f"Job {job_id} ({job['kind']}) started")
+
+        async def report(stage: str, fraction: float) -> None:
+            progress[stage] = round(min(max(fraction, 0.0), 1.0), 4)
+            await run_in_threadpool(self.store.update, job_id, stage=stage, progress=dict(progress))
+
+        try:
+            result = await self._handlers[job["kind"]](job["request"], report, self._secrets.get(job_id, {}))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            await run_in_threadpool(self.store.update, job_id, status=FAILED, error=str(e))
+        else:
+            await run_in_threadpool(self.store.update, job_id, status=DONE, stage=None,
+                                    progress={stage: 1.0 for stage in progress}, result=result)
+            logger.info(f"Job {job_id} done in {time.time() - start_time:.2f} seconds")
+        self._secrets.pop(job_id, None)
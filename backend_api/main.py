@@ -6,13 +6,21 @@ Cung cấp REST API endpoints để xử lý NER và trích xuất thông tin b
 
 import sys
 import os
+import json
+import asyncio
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 import time
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend_api.executor import BoundedExecutor, QueueFullError
+from backend_api.batcher import MicroBatcher
+from backend_api.worker_pool import WorkerPoolPredictor
+from backend_api.jobs import JobStore, JobManager, DONE, FAILED
 
 # Import logging utilities
 from backend_api.logger import (
@@ -43,23 +51,31 @@ except ImportError:
     print("To use .env file: pip install python-dotenv")
 
 # Import models từ src
-from src.inference import NERPredictor
+from src.inference import NERPredictor, InferenceTrace
 from src import config as ner_config
-from src.patient_extraction.manual_extractor import extract_single_patient
-from src.patient_extraction.gemini_splitter import split_text_with_gemini
+from src.patient_extraction.manual_extractor import extract_single_patient, predict_segments, extract_patients
+from src.patient_extraction.gemini_splitter import split_text_with_gemini, close as close_gemini_clients
+from src.patient_extraction.local_splitter import split_text_locally
+from src.patient_extraction.segment_alignment import align_segments, entities_in_span
 
 # Import API models
 from backend_api.api_models import (
     HealthCheckResponse,
     NERPredictRequest,
     NERPredictResponse,
+    NERStreamChunk,
+    NERBatchRequest,
+    NERBatchResult,
+    BatchDocument,
     EntityResponse,
     ManualExtractRequest,
     ManualExtractResponse,
     PatientRecordResponse,
     AutoExtractRequest,
     AutoExtractResponse,
-    PatientSegmentResponse
+    PatientSegmentResponse,
+    JobSubmitResponse,
+    JobStatusResponse
 )
 
 
@@ -81,32 +97,351 @@ app.add_middleware(
 
 
 # Global variables để cache model
-ner_predictor: Optional[NERPredictor] = None
+ner_predictor: Optional[NERPredictor] = None  # hoặc WorkerPoolPredictor khi API_MODEL_WORKERS > 0
+predict_batcher: Optional[MicroBatcher] = None
+job_manager: Optional[JobManager] = None
 gemini_api_key_env: Optional[str] = None
 
 # Setup logger
 api_logger = setup_logger("ner_api", "logs/ner_api.log")
 
+# Executor cho suy luận NER (blocking) - giới hạn hàng đợi để không chặn event loop
+inference_executor = BoundedExecutor(
+    max_workers=ner_config.API_MODEL_WORKERS or ner_config.API_INFERENCE_WORKERS,
+    queue_depth=ner_config.API_QUEUE_DEPTH
+)
+
+
+async def run_inference(fn, *args, **kwargs):
+    """
+    Chạy tác vụ blocking (NER) trong inference executor
+    
+    Raises:
+        HTTPException 429 (kèm Retry-After) nếu hàng đợi suy luận đã đầy
+    """
+    try:
+        return await inference_executor.run(fn, *args, **kwargs)
+    except QueueFullError as e:
+        raise server_busy(e)
+
+
+async def predict_text(text: str):
+    """
+    NER cho một văn bản: gom vào micro-batch với các request đồng thời nếu được bật
+    
+    Returns:
+        Tuple (entities, trace)
+    """
+    if predict_batcher is None:
+        return await run_inference(ner_predictor.predict, text, show_debug=False, return_trace=True)
+    try:
+        return await predict_batcher.submit(text)
+    except QueueFullError as e:
+        raise server_busy(e)
+
+
+def server_busy(error: Exception) -> HTTPException:
+    """HTTP 429 kèm Retry-After khi hàng đợi suy luận đã đầy"""
+    api_logger.warning(f"Rejecting request: {error}")
+    return HTTPException(
+        status_code=429,
+        detail="Server đang quá tải. Vui lòng thử lại sau.",
+        headers={"Retry-After": str(ner_config.API_RETRY_AFTER_SECONDS)}
+    )
+
+
+async def run_inference_waiting(fn, *args, **kwargs):
+    """
+    Như run_inference() nhưng chờ và thử lại khi hàng đợi suy luận đầy
+    (cho tác vụ bulk / job nền: nên chờ thay vì thất bại)
+    """
+    while True:
+        try:
+            return await inference_executor.run(fn, *args, **kwargs)
+        except QueueFullError:
+            await asyncio.sleep(ner_config.API_RETRY_AFTER_SECONDS)
+
+
+def to_entity_responses(entities_raw) -> List[EntityResponse]:
+    """Convert entities của NERPredictor sang EntityResponse"""
+    return [
+        EntityResponse(
+            text=e['text'],
+            tag=e['tag'],
+            start=e['start'],
+            end=e['end'],
+            confidence=e.get('confidence')
+        )
+        for e in entities_raw
+    ]
+
+
+def to_patient_response(patient_record) -> PatientRecordResponse:
+    """Convert PatientRecord sang PatientRecordResponse - LẤY TRỰC TIẾP TỪ OBJECT"""
+    return PatientRecordResponse(
+        patient_id=patient_record.patient_id,
+        name=patient_record.name,
+        age=patient_record.age,
+        gender=patient_record.gender,
+        job=patient_record.job,
+        locations=patient_record.locations,  # List[str]
+        organizations=patient_record.organizations,  # List[str]
+        symptoms_and_diseases=patient_record.symptoms_and_diseases,  # List[str]
+        transportations=patient_record.transportations,  # List[str]
+        dates=patient_record.dates,  # Dict[str, List[str]]
+        confidence=patient_record.confidence,
+        warnings=patient_record.warnings  # List[str]
+    )
+
+
+async def split_patients(text: str, api_key: str, run=run_inference,
+                         report=None) -> Tuple[List[str], List[Optional[list]]]:
+    """
+    Tách văn bản nhiều bệnh nhân và gán entities của toàn văn bản cho từng segment
+    
+    NER chạy một lần trên toàn văn bản. Splitter cục bộ theo PATIENT_ID dùng kết quả đó để tách;
+    chỉ gọi Gemini khi cấu trúc không rõ ràng (nếu tắt splitter cục bộ, NER chạy song song với Gemini).
+    Với GEMINI_SPECULATIVE_SPLIT, Gemini được gọi ngay cùng lúc với NER để rút ngắn trường hợp không
+    rõ ràng - request vẫn chạy hết (tốn quota) kể cả khi tách cục bộ thành công, kết quả khi đó bị bỏ.
+    Mỗi segment được căn về vị trí trong văn bản gốc để lấy entities theo offset thay vì NER lại.
+    
+    Args:
+        text: Văn bản cần tách
+        api_key: Gemini API key (dùng khi phải gọi Gemini)
+        run: Hàm chạy NER trong inference executor (run_inference hoặc run_inference_waiting)
+        report: Coroutine report(stage, fraction) cập nhật tiến độ job - giai đoạn "split" và
+            "segment" (căn segment về văn bản gốc); None nếu không phải job
+        
+    Returns:
+        Tuple (text_segments, ner_results) - ner_results[i] là entities của segment i (vị trí tính
+        trên segment), None nếu segment không căn được về văn bản gốc (cần chạy NER riêng)
+    """
+    ner_task = asyncio.ensure_future(run(ner_predictor.predict, text, show_debug=False))
+    gemini_task = None
+    if not ner_config.LOCAL_SPLITTER_ENABLED or ner_config.GEMINI_SPECULATIVE_SPLIT:
+        api_logger.info("Calling Gemini API to split text (alongside document NER)...")
+        gemini_task = asyncio.ensure_future(run_in_threadpool(split_text_with_gemini, text, api_key))
+    try:
+        text_segments = None
+        if ner_config.LOCAL_SPLITTER_ENABLED:
+            text_segments = split_text_locally(text, ner_predictor, entities=await ner_task)
+            if text_segments is not None:
+                api_logger.info(f"Local split result: {len(text_segments)} segment(s)")
+                if gemini_task is not None:
+                    api_logger.info("Speculative Gemini request is still running, its result will be discarded")
+        
+        if text_segments is None:
+            if gemini_task is None:
+                api_logger.info("Calling Gemini API to split text...")
+                gemini_task = asyncio.ensure_future(run_in_threadpool(split_text_with_gemini, text, api_key))
+            text_segments = await gemini_task
+            
+            if not text_segments:
+                api_logger.warning("Gemini returned empty segments, using fallback (original text)")
+                text_segments = [text]  # Fallback
+            
+            api_logger.info(f"Gemini split result: {len(text_segments)} segment(s)")
+        
+        entities = await ner_task
+    finally:
+        # Hủy task chỉ bỏ việc chờ kết quả; lời gọi đang chạy trong threadpool vẫn chạy tới khi xong
+        for task in (ner_task, gemini_task):
+            if task is not None and not task.done():
+                task.cancel()
+    if report:
+        await report("split", 1.0)
+    
+    segments = []
+    ner_results = []
+    for segment_text, span in zip(text_segments, align_segments(text, text_segments)):
+        if span is None:
+            segments.append(segment_text)
+            ner_results.append(None)
+        else:
+            segments.append(text[span[0]:span[1]])
+            ner_results.append(entities_in_span(entities, *span))
+    if report:
+        await report("segment", 1.0)
+    
+    num_aligned = sum(result is not None for result in ner_results)
+    api_logger.info(f"Reused document NER for {num_aligned}/{len(segments)} segment(s)")
+    return segments, ner_results
+
+
+async def process_segments(text_segments: List[str], ner_results: List[Optional[list]] = None,
+                           run=run_inference, report=None) -> List[PatientSegmentResponse]:
+    """
+    NER + trích xuất thông tin bệnh nhân cho các segment của Auto Mode
+    
+    Segment chưa có entities chạy NER theo nhóm API_BATCH_GROUP_SIZE segment bằng predict_batch,
+    trích xuất chạy ngoài event loop. Kết quả giữ thứ tự segment; segment lỗi được bỏ qua.
+    
+    Args:
+        text_segments: Các segment (mỗi segment một bệnh nhân)
+        ner_results: Entities đã có của từng segment (None = cần chạy NER), xem split_patients()
+        run: Hàm chạy NER trong inference executor (run_inference hoặc run_inference_waiting)
+        report: Coroutine report(stage, fraction) cập nhật tiến độ job (None nếu không phải job)
+    """
+    num_segments = len(text_segments)
+    group_size = ner_config.API_BATCH_GROUP_SIZE
+    ner_results = list(ner_results) if ner_results is not None else [None] * num_segments
+    
+    # NER cho các segment chưa có entities
+    pending = [index for index, result in enumerate(ner_results) if result is None]
+    if pending:
+        api_logger.info(f"Running NER on {len(pending)} segment(s)...")
+    for start in range(0, len(pending), group_size):
+        group = pending[start:start + group_size]
+        results = await run(predict_segments, ner_predictor, [text_segments[index] for index in group])
+        for index, result in zip(group, results):
+            ner_results[index] = result
+        if report:
+            await report("ner", (start + len(group)) / len(pending))
+    if report:
+        await report("ner", 1.0)
+    
+    # Trích xuất patient info (ngoài event loop)
+    api_logger.info(f"Extracting patient info from {num_segments} segment(s)...")
+    patient_records = await run_in_threadpool(extract_patients, ner_results, text_segments)
+    if report:
+        await report("extract", 1.0)
+    
+    patients_data = []
+    for idx, (segment_text, entities_raw, patient_record) in enumerate(
+            zip(text_segments, ner_results, patient_records), start=1):
+        log_separator(api_logger, f"SEGMENT {idx}/{num_segments}")
+        api_logger.info(f"Segment {idx} length: {len(segment_text)} characters")
+        api_logger.info(f"Full segment text:")
+        api_logger.info(f"{segment_text}")
+        api_logger.info(f"--- End of segment text ---")
+        
+        if isinstance(patient_record, Exception):
+            api_logger.error(f"Error processing segment {idx}: {patient_record}", exc_info=patient_record)
+            continue
+        
+        log_entities(api_logger, entities_raw, max_entities=15)
+        log_patient_record(api_logger, patient_record)
+        
+        patients_data.append(PatientSegmentResponse(
+            patient_index=idx,
+            original_text=segment_text,
+            entities=to_entity_responses(entities_raw),
+            patient_record=to_patient_response(patient_record)
+        ))
+        api_logger.info(f"Segment {idx} processed successfully")
+    
+    return patients_data
+
+
+async def run_predict_job(job_request, report, secrets):
+    """
+    Job NER cho văn bản lớn: chạy predict_iter theo từng khối câu, tiến độ giai đoạn "ner"
+    theo số ký tự đã xử lý (gồm cả tách từ VnCoreNLP của từng khối)
+    
+    Returns:
+        Dict theo NERPredictResponse
+    """
+    if ner_predictor is None:
+        raise RuntimeError("Model chưa được load")
+    
+    start_time = time.time()
+    text = job_request["text"]
+    trace = InferenceTrace()
+    blocks = ner_predictor.predict_iter(text, trace=trace)
+    entities = []
+    while True:
+        block = await run_inference_waiting(next, blocks, None)
+        if block is None:
+            break
+        entities_raw, processed_chars = block
+        entities.extend(to_entity_responses(entities_raw))
+        await report("ner", processed_chars / len(text))
+    api_logger.info(f"NER job trace: {trace.summary()}")
+    
+    return NERPredictResponse(
+        success=True,
+        entities=entities,
+        processing_time=time.time() - start_time
+    ).model_dump()
+
+
+async def run_extract_auto_job(job_request, report, secrets):
+    """
+    Job Auto Mode: NER toàn văn bản và tách theo bệnh nhân (giai đoạn "split", PATIENT_ID hoặc Gemini),
+    căn segment về văn bản gốc để dùng lại entities ("segment"), NER cho segment không căn được
+    ("ner") và trích xuất ("extract") từng segment
+    
+    Returns:
+        Dict theo AutoExtractResponse
+    """
+    if ner_predictor is None:
+        raise RuntimeError("Model chưa được load")
+    
+    # API key của request chỉ giữ trong bộ nhớ; job chạy lại sau khi restart dùng GEMINI_API_KEY
+    api_key = secrets.get("gemini_api_key") or gemini_api_key_env
+    if not api_key:
+        raise RuntimeError("Gemini API key không được cung cấp")
+    
+    start_time = time.time()
+    text = job_request["text"]
+    log_separator(api_logger, "AUTO EXTRACT JOB")
+    api_logger.info(f"Input text length: {len(text)} characters")
+    
+    await report("split", 0.0)
+    text_segments, ner_results = await split_patients(text, api_key, run=run_inference_waiting, report=report)
+    
+    patients_data = await process_segments(text_segments, ner_results, run=run_inference_waiting, report=report)
+    
+    processing_time = time.time() - start_time
+    api_logger.info(f"Auto extraction job completed: {len(patients_data)} patient(s) in {processing_time:.2f} seconds")
+    log_separator(api_logger)
+    
+    return AutoExtractResponse(
+        success=True,
+        num_patients=len(patients_data),
+        patients=patients_data,
+        processing_time=processing_time
+    ).model_dump()
+
 
 def load_model():
     """Load NER model vào memory"""
-    global ner_predictor
+    global ner_predictor, predict_batcher
     
     if ner_predictor is not None:
         return ner_predictor
     
     try:
         print("Đang tải mô hình NER...")
-        predictor = NERPredictor(
-            model_path=ner_config.MODEL_OUTPUT_DIR,
-            use_word_segmentation=True
-        )
+        if ner_config.API_MODEL_WORKERS > 0:
+            print(f"Khởi động {ner_config.API_MODEL_WORKERS} worker process...")
+            predictor = WorkerPoolPredictor(
+                model_path=ner_config.MODEL_OUTPUT_DIR,
+                num_workers=ner_config.API_MODEL_WORKERS,
+                use_word_segmentation=True,
+                sentence_cache=ner_config.API_SENTENCE_CACHE
+            )
+        else:
+            predictor = NERPredictor(
+                model_path=ner_config.MODEL_OUTPUT_DIR,
+                use_word_segmentation=True,
+                verbose=False,
+                sentence_cache=ner_config.API_SENTENCE_CACHE
+            )
         
         if predictor.model is None:
             raise Exception("Model không thể load được")
         
         print("Mô hình đã được tải thành công!")
         ner_predictor = predictor
+        if ner_config.MICROBATCH_ENABLED:
+            predict_batcher = MicroBatcher(
+                predictor.predict_batch,
+                inference_executor,
+                max_wait_ms=ner_config.MICROBATCH_MAX_WAIT_MS,
+                max_texts=ner_config.MICROBATCH_MAX_TEXTS,
+                max_tokens=ner_config.MICROBATCH_MAX_TOKENS
+            )
         return predictor
     
     except Exception as e:
@@ -121,6 +456,21 @@ def load_gemini_key():
     return gemini_api_key_env
 
 
+async def start_job_manager():
+    """Mở job store (SQLite) và khởi động worker xử lý job bất đồng bộ"""
+    global job_manager
+    
+    manager = JobManager(
+        JobStore(ner_config.API_JOBS_DB),
+        num_workers=ner_config.API_JOB_WORKERS,
+        retention_seconds=ner_config.API_JOB_RETENTION_HOURS * 3600
+    )
+    manager.register("predict", ["ner"], run_predict_job)
+    manager.register("extract_auto", ["split", "segment", "ner", "extract"], run_extract_auto_job)
+    await manager.start()
+    job_manager = manager
+
+
 # Load model khi khởi động server
 @app.on_event("startup")
 async def startup_event():
@@ -132,11 +482,23 @@ async def startup_event():
     try:
         load_model()
         load_gemini_key()
+        await start_job_manager()
         print("\nServer sẵn sàng!")
     except Exception as e:
         print(f"\nCảnh báo: Server khởi động nhưng có lỗi: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Dừng job worker, inference executor (và các worker process), đóng client Gemini khi server tắt"""
+    if job_manager is not None:
+        await job_manager.stop()
+    inference_executor.shutdown(wait=False)
+    if isinstance(ner_predictor, WorkerPoolPredictor):
+        ner_predictor.shutdown()
+    close_gemini_clients()
+
+
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
@@ -149,9 +511,16 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/api/health",
+            "cache_stats": "/api/cache/stats",
             "predict": "/api/ner/predict",
+            "predict_stream": "/api/ner/predict-stream",
+            "predict_batch": "/api/ner/predict-batch",
             "extract_manual": "/api/ner/extract-manual",
-            "extract_auto": "/api/ner/extract-auto"
+            "extract_auto": "/api/ner/extract-auto",
+            "jobs": "/api/jobs/{predict|extract-auto}",
+            "job_status": "/api/jobs/{job_id}",
+            "job_events": "/api/jobs/{job_id}/events",
+            "job_result": "/api/jobs/{job_id}/result"
         }
     }
 
@@ -164,8 +533,9 @@ async def health_check():
     model_loaded = ner_predictor is not None and ner_predictor.model is not None
     vncorenlp_ok = False
     
-    if ner_predictor and ner_predictor.text_processor:
-        vncorenlp_ok = ner_predictor.text_processor.is_available()
+    if ner_predictor:
+        # use_word_segmentation bị tắt khi VnCoreNLP không khả dụng
+        vncorenlp_ok = ner_predictor.use_word_segmentation
     
     gemini_ok = gemini_api_key_env is not None
     
@@ -174,10 +544,28 @@ async def health_check():
         model_loaded=model_loaded,
         vncorenlp_available=vncorenlp_ok,
         gemini_configured=gemini_ok,
+        inference_queue=inference_executor.stats(),
+        micro_batching=predict_batcher.stats() if predict_batcher else None,
+        model_workers=ner_predictor.stats() if isinstance(ner_predictor, WorkerPoolPredictor) else None,
+        jobs=await job_manager.stats() if job_manager else None,
         timestamp=datetime.now().isoformat()
     )
 
 
+@app.get("/api/cache/stats", tags=["Health"])
+async def cache_stats():
+    """
+    Thống kê bộ nhớ đệm kết quả NER theo văn bản và theo câu
+    (hit/miss/eviction, số phần tử, dung lượng) để theo dõi. None nếu cache tắt.
+    """
+    if ner_predictor is None:
+        return {"result_cache": None, "sentence_cache": None}
+    return {
+        "result_cache": ner_predictor.result_cache.stats() if ner_predictor.result_cache else None,
+        "sentence_cache": ner_predictor.sentence_cache.stats() if ner_predictor.sentence_cache else None
+    }
+
+
 @app.post("/api/ner/predict", response_model=NERPredictResponse, tags=["NER"])
 async def predict_ner(request: NERPredictRequest):
     """
@@ -210,18 +598,11 @@ async def predict_ner(request: NERPredictRequest):
             )
         
         # Chạy NER
-        entities_raw = ner_predictor.predict(text, show_debug=False)
+        entities_raw, trace = await predict_text(text)
+        api_logger.info(f"NER trace: {trace.summary()}")
         
         # Convert sang EntityResponse format
-        entities = [
-            EntityResponse(
-                text=e['text'],
-                tag=e['tag'],
-                start=e['start'],
-                end=e['end']
-            )
-            for e in entities_raw
-        ]
+        entities = to_entity_responses(entities_raw)
         
         processing_time = time.time() - start_time
         
@@ -242,6 +623,167 @@ async def predict_ner(request: NERPredictRequest):
         )
 
 
+@app.post("/api/ner/predict-stream", tags=["NER"])
+async def predict_ner_stream(request: NERPredictRequest):
+    """
+    Endpoint NER dạng streaming (Server-Sent Events) cho văn bản dài
+    
+    Entities được gửi dần theo từng khối câu (sự kiện "entities", dữ liệu NERStreamChunk) ngay khi
+    khối đó xử lý xong, để Extension có thể highlight phần đầu trang trước khi cả văn bản xong.
+    Kết thúc bằng sự kiện "done" (tổng số entities, thời gian xử lý) hoặc "error".
+    
+    Args:
+        request: Chứa text cần phân tích
+        
+    Returns:
+        StreamingResponse (text/event-stream)
+    """
+    if ner_predictor is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model chưa được load. Vui lòng khởi động lại server."
+        )
+    
+    # Validate input
+    text = request.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Văn bản rỗng")
+    
+    if len(text) > 500000:
+        raise HTTPException(
+            status_code=400,
+            detail="Văn bản quá dài (> 500,000 ký tự). Vui lòng rút ngắn."
+        )
+    
+    start_time = time.time()
+    trace = InferenceTrace()
+    blocks = ner_predictor.predict_iter(text, trace=trace)
+    # Khối đầu tiên chạy trước khi trả response để request bị từ chối nhận đúng mã 429
+    first_block = await run_inference(next, blocks, None)
+    
+    async def event_stream():
+        # Mỗi khối chạy trong inference executor, không chặn event loop
+        num_entities = 0
+        block = first_block
+        try:
+            while block is not None:
+                entities_raw, processed_chars = block
+                num_entities += len(entities_raw)
+                chunk = NERStreamChunk(
+                    entities=to_entity_responses(entities_raw),
+                    processed_chars=processed_chars,
+                    total_chars=len(text)
+                )
+                yield f"event: entities\ndata: {chunk.model_dump_json()}\n\n"
+                block = await inference_executor.run(next, blocks, None)
+            
+            api_logger.info(f"NER stream trace: {trace.summary()}")
+            done = {"num_entities": num_entities, "processing_time": time.time() - start_time}
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        except QueueFullError as e:
+            api_logger.warning(f"NER stream interrupted: {e}")
+            error = {'error': str(e), 'retry_after': ner_config.API_RETRY_AFTER_SECONDS}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+        except Exception as e:
+            api_logger.error(f"Error in NER stream: {str(e)}", exc_info=True)
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/ner/predict-batch", tags=["NER"])
+async def predict_ner_batch(request: Request):
+    """
+    Endpoint NER cho nhiều văn bản (bulk), trả về NDJSON
+    
+    Body là JSON dạng NERBatchRequest ({"documents": [{"id": ..., "text": ...}]}), hoặc upload
+    NDJSON (Content-Type: application/x-ndjson) với mỗi dòng một {"id": ..., "text": ...}.
+    Các văn bản được sắp xếp theo độ dài và chạy theo nhóm API_BATCH_GROUP_SIZE văn bản bằng
+    predict_batch; mỗi văn bản xong được trả về ngay một dòng NERBatchResult (theo thứ tự xử lý,
+    không theo thứ tự gửi lên).
+    
+    Returns:
+        StreamingResponse (application/x-ndjson)
+    """
+    if ner_predictor is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model chưa được load. Vui lòng khởi động lại server."
+        )
+    
+    # Đọc danh sách văn bản
+    try:
+        if request.headers.get("content-type", "").startswith(("application/x-ndjson", "application/jsonl")):
+            body = (await request.body()).decode("utf-8")
+            documents = [BatchDocument.model_validate_json(line) for line in body.splitlines() if line.strip()]
+        else:
+            documents = NERBatchRequest.model_validate(await request.json()).documents
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Request không hợp lệ: {e}")
+    
+    if len(documents) > ner_config.API_BATCH_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Quá nhiều văn bản (> {ner_config.API_BATCH_MAX_DOCUMENTS:,}). Vui lòng chia nhỏ request."
+        )
+    
+    # Văn bản không hợp lệ được trả lỗi riêng, không làm hỏng cả request
+    invalid = []
+    valid = []
+    for document in documents:
+        text = document.text.strip()
+        if not text:
+            invalid.append(NERBatchResult(id=document.id, error="Văn bản rỗng"))
+        elif len(text) > 500000:
+            invalid.append(NERBatchResult(id=document.id, error="Văn bản quá dài (> 500,000 ký tự)"))
+        else:
+            valid.append((document.id, text))
+    
+    valid.sort(key=lambda item: len(item[1]))
+    group_size = ner_config.API_BATCH_GROUP_SIZE
+    groups = [valid[i:i + group_size] for i in range(0, len(valid), group_size)]
+    api_logger.info(f"Batch request: {len(documents)} documents ({len(invalid)} invalid), {len(groups)} group(s)")
+    
+    async def predict_group(group):
+        """Chạy một nhóm; chờ và thử lại khi hàng đợi suy luận đầy (job bulk nên chờ thay vì thất bại)"""
+        results, trace = await run_inference_waiting(
+            ner_predictor.predict_batch, [text for _, text in group], return_trace=True
+        )
+        api_logger.info(f"NER batch trace: {trace.summary()}")
+        return results
+    
+    # Nhóm đầu tiên chạy trước khi trả response để request bị từ chối nhận đúng mã 429
+    first_results = await run_inference(
+        ner_predictor.predict_batch, [text for _, text in groups[0]]
+    ) if groups else []
+    
+    async def result_lines():
+        for result in invalid:
+            yield result.model_dump_json() + "\n"
+        
+        for index, group in enumerate(groups):
+            try:
+                results = first_results if index == 0 else await predict_group(group)
+            except Exception as e:
+                api_logger.error(f"Error in batch group {index + 1}: {str(e)}", exc_info=True)
+                for doc_id, _ in group:
+                    yield NERBatchResult(id=doc_id, error=str(e)).model_dump_json() + "\n"
+                continue
+            
+            for (doc_id, _), entities_raw in zip(group, results):
+                result = NERBatchResult(
+                    id=doc_id,
+                    entities=to_entity_responses(entities_raw)
+                )
+                yield result.model_dump_json() + "\n"
+    
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+
 @app.post("/api/ner/extract-manual", response_model=ManualExtractResponse, tags=["Extraction"])
 async def extract_manual(request: ManualExtractRequest):
     """
@@ -281,7 +823,8 @@ async def extract_manual(request: ManualExtractRequest):
         
         # Bước 1: Chạy NER
         api_logger.info("Running NER prediction...")
-        entities_raw = ner_predictor.predict(text, show_debug=False)
+        entities_raw, trace = await predict_text(text)
+        api_logger.info(f"NER trace: {trace.summary()}")
         log_entities(api_logger, entities_raw, max_entities=20)
         
         # Bước 2: Trích xuất patient record
@@ -290,31 +833,10 @@ async def extract_manual(request: ManualExtractRequest):
         log_patient_record(api_logger, patient_record)
         
         # Convert entities sang response format
-        entities = [
-            EntityResponse(
-                text=e['text'],
-                tag=e['tag'],
-                start=e['start'],
-                end=e['end']
-            )
-            for e in entities_raw
-        ]
+        entities = to_entity_responses(entities_raw)
         
         # Convert patient record sang response format - LẤY TRỰC TIẾP TỪ OBJECT
-        patient_response = PatientRecordResponse(
-            patient_id=patient_record.patient_id,
-            name=patient_record.name,
-            age=patient_record.age,
-            gender=patient_record.gender,
-            job=patient_record.job,
-            locations=patient_record.locations,  # List[str]
-            organizations=patient_record.organizations,  # List[str]
-            symptoms_and_diseases=patient_record.symptoms_and_diseases,  # List[str]
-            transportations=patient_record.transportations,  # List[str]
-            dates=patient_record.dates,  # Dict[str, List[str]]
-            confidence=patient_record.confidence,
-            warnings=patient_record.warnings  # List[str]
-        )
+        patient_response = to_patient_response(patient_record)
         
         processing_time = time.time() - start_time
         
@@ -387,79 +909,13 @@ async def extract_auto(request: AutoExtractRequest):
                 detail="Văn bản quá dài (> 1,000,000 ký tự)"
             )
         
-        # Bước 1: Tách văn bản với Gemini
-        api_logger.info("Step 1: Calling Gemini API to split text...")
-        text_segments = split_text_with_gemini(text, api_key)
-        
-        if not text_segments:
-            api_logger.warning("Gemini returned empty segments, using fallback (original text)")
-            text_segments = [text]  # Fallback
-        
-        api_logger.info(f"Gemini split result: {len(text_segments)} segment(s)")
+        # Bước 1: Tách văn bản theo bệnh nhân (PATIENT_ID, hoặc Gemini)
+        api_logger.info("Step 1: Splitting text by patient...")
+        text_segments, ner_results = await split_patients(text, api_key)
         
         # Bước 2: Xử lý từng segment
         api_logger.info("Step 2: Processing each segment with NER + Extraction...")
-        patients_data = []
-        
-        for idx, segment_text in enumerate(text_segments, start=1):
-            try:
-                log_separator(api_logger, f"SEGMENT {idx}/{len(text_segments)}")
-                api_logger.info(f"Segment {idx} length: {len(segment_text)} characters")
-                api_logger.info(f"Full segment text:")
-                api_logger.info(f"{segment_text}")
-                api_logger.info(f"--- End of segment text ---")
-                
-                # NER cho segment
-                api_logger.info(f"Running NER on segment {idx}...")
-                entities_raw = ner_predictor.predict(segment_text, show_debug=False)
-                log_entities(api_logger, entities_raw, max_entities=15)
-                
-                # Trích xuất patient info
-                api_logger.info(f"Extracting patient info from segment {idx}...")
-                patient_record = extract_single_patient(entities_raw, segment_text)
-                log_patient_record(api_logger, patient_record)
-                
-                # Convert entities
-                entities = [
-                    EntityResponse(
-                        text=e['text'],
-                        tag=e['tag'],
-                        start=e['start'],
-                        end=e['end']
-                    )
-                    for e in entities_raw
-                ]
-                
-                # Convert patient record - LẤY TRỰC TIẾP TỪ OBJECT
-                patient_response = PatientRecordResponse(
-                    patient_id=patient_record.patient_id,
-                    name=patient_record.name,
-                    age=patient_record.age,
-                    gender=patient_record.gender,
-                    job=patient_record.job,
-                    locations=patient_record.locations,  # List[str]
-                    organizations=patient_record.organizations,  # List[str]
-                    symptoms_and_diseases=patient_record.symptoms_and_diseases,  # List[str]
-                    transportations=patient_record.transportations,  # List[str]
-                    dates=patient_record.dates,  # Dict[str, List[str]]
-                    confidence=patient_record.confidence,
-                    warnings=patient_record.warnings  # List[str]
-                )
-                
-                # Tạo segment response
-                segment_response = PatientSegmentResponse(
-                    patient_index=idx,
-                    original_text=segment_text,
-                    entities=entities,
-                    patient_record=patient_response
-                )
-                
-                patients_data.append(segment_response)
-                api_logger.info(f"Segment {idx} processed successfully")
-                
-            except Exception as segment_error:
-                api_logger.error(f"Error processing segment {idx}: {segment_error}", exc_info=True)
-                continue
+        patients_data = await process_segments(text_segments, ner_results)
         
         processing_time = time.time() - start_time
         
@@ -486,6 +942,155 @@ async def extract_auto(request: AutoExtractRequest):
         )
 
 
+# ============================================================================
+# JOB ENDPOINTS (văn bản rất lớn, xử lý bất đồng bộ)
+# ============================================================================
+
+def get_job_manager() -> JobManager:
+    """JobManager đang chạy (HTTP 503 nếu chưa khởi động)"""
+    if job_manager is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Job worker chưa được khởi động. Vui lòng khởi động lại server."
+        )
+    return job_manager
+
+
+async def get_job(job_id: str, with_result: bool = False) -> dict:
+    """Đọc job theo id (HTTP 404 nếu không tồn tại)"""
+    job = await get_job_manager().get(job_id, with_result=with_result)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy job {job_id}")
+    return job
+
+
+@app.post("/api/jobs/predict", response_model=JobSubmitResponse, status_code=202, tags=["Jobs"])
+async def submit_predict_job(request: NERPredictRequest):
+    """
+    Gửi job NER bất đồng bộ (như /api/ner/predict), trả về job_id ngay
+    
+    Args:
+        request: Chứa text cần phân tích
+        
+    Returns:
+        JobSubmitResponse - theo dõi bằng /api/jobs/{job_id} hoặc /api/jobs/{job_id}/events
+    """
+    manager = get_job_manager()
+    
+    text = request.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Văn bản rỗng")
+    
+    if len(text) > 500000:
+        raise HTTPException(
+            status_code=400,
+            detail="Văn bản quá dài (> 500,000 ký tự). Vui lòng rút ngắn."
+        )
+    
+    job = await manager.submit("predict", {"text": text})
+    api_logger.info(f"Job {job['job_id']} (predict) queued: {len(text)} characters")
+    return JobSubmitResponse(job_id=job["job_id"], kind=job["kind"], status=job["status"])
+
+
+@app.post("/api/jobs/extract-auto", response_model=JobSubmitResponse, status_code=202, tags=["Jobs"])
+async def submit_extract_auto_job(request: AutoExtractRequest):
+    """
+    Gửi job Auto Mode bất đồng bộ (như /api/ner/extract-auto), trả về job_id ngay
+    
+    API key trong request không được lưu vào job store: nếu server khởi động lại trước khi job
+    chạy xong, job dùng GEMINI_API_KEY của server.
+    
+    Args:
+        request: Chứa text có thể có nhiều bệnh nhân và optional API key
+        
+    Returns:
+        JobSubmitResponse
+    """
+    manager = get_job_manager()
+    
+    if not (request.gemini_api_key or gemini_api_key_env):
+        raise HTTPException(
+            status_code=400,
+            detail="Gemini API key không được cung cấp. Vui lòng set GEMINI_API_KEY environment variable hoặc truyền vào request."
+        )
+    
+    text = request.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Văn bản rỗng")
+    
+    if len(text) > 1000000:
+        raise HTTPException(
+            status_code=400,
+            detail="Văn bản quá dài (> 1,000,000 ký tự)"
+        )
+    
+    secrets = {"gemini_api_key": request.gemini_api_key} if request.gemini_api_key else None
+    job = await manager.submit("extract_auto", {"text": text}, secrets=secrets)
+    api_logger.info(f"Job {job['job_id']} (extract_auto) queued: {len(text)} characters")
+    return JobSubmitResponse(job_id=job["job_id"], kind=job["kind"], status=job["status"])
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatusResponse, tags=["Jobs"])
+async def job_status(job_id: str):
+    """
+    Trạng thái và tiến độ của job (poll)
+    """
+    return JobStatusResponse(**await get_job(job_id))
+
+
+@app.get("/api/jobs/{job_id}/events", tags=["Jobs"])
+async def job_events(job_id: str):
+    """
+    Tiến độ của job dạng Server-Sent Events
+    
+    Gửi sự kiện "progress" (JobStatusResponse) mỗi khi tiến độ thay đổi, kết thúc bằng sự kiện
+    "done" hoặc "failed" (JobStatusResponse cuối cùng). Kết quả lấy bằng /api/jobs/{job_id}/result.
+    
+    Returns:
+        StreamingResponse (text/event-stream)
+    """
+    job = await get_job(job_id)
+    
+    async def event_stream():
+        current = job
+        last_update = None
+        while True:
+            status = JobStatusResponse(**current)
+            if current["status"] in (DONE, FAILED):
+                yield f"event: {current['status']}\ndata: {status.model_dump_json()}\n\n"
+                return
+            if current["updated_at"] != last_update:
+                last_update = current["updated_at"]
+                yield f"event: progress\ndata: {status.model_dump_json()}\n\n"
+            await asyncio.sleep(0.5)
+            current = await job_manager.get(job_id)
+            if current is None:
+                yield f"event: failed\ndata: {json.dumps({'error': 'Job đã bị xóa'})}\n\n"
+                return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/jobs/{job_id}/result", tags=["Jobs"])
+async def job_result(job_id: str):
+    """
+    Kết quả của job đã xong: NERPredictResponse (predict) hoặc AutoExtractResponse (extract_auto)
+    
+    HTTP 409 nếu job chưa xong hoặc đã thất bại (kèm trạng thái và lỗi).
+    """
+    job = await get_job(job_id, with_result=True)
+    if job["status"] != DONE:
+        raise HTTPException(
+            status_code=409,
+            detail={"status": job["status"], "stage": job["stage"], "error": job["error"]}
+        )
+    return job["result"]
+
+
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
@@ -0,0 +1,290 @@
+# backend_api/worker_pool.py
+"""
+Pool tiến trình (pre-fork) chạy suy luận NER cho Backend API
+Model được tải một lần trong tiến trình API, trọng số được chuyển sang shared memory rồi fork ra
+N tiến trình worker dùng chung một bản trọng số; request được gửi tới worker qua multiprocessing.Queue
+(mỗi worker một hàng đợi, giới hạn số tác vụ chưa xong của mỗi worker)
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+
+from src.inference import NERPredictor, InferenceTrace
+from src import config as ner_config
+from backend_api.executor import QueueFullError
+
+logger = logging.getLogger("ner_api")
+
+# Chu kỳ (giây) luồng đọc kết quả kiểm tra worker còn sống
+_HEALTH_CHECK_INTERVAL = 1.0
+
+
+def _worker_main(predictor: NERPredictor, tasks, results, worker_index: int, num_threads: int,
+                 model_path: str, use_word_segmentation: bool, compiled: bool) -> None:
+    """
+    Vòng lặp của một tiến trình worker: nhận (request_id, method, args, kwargs) từ tasks,
+    gọi phương thức tương ứng của predictor và gửi kết quả về results
+    """
+    torch.set_num_threads(num_threads)
+
+    # Phiên ONNX Runtime, đồ thị TorchScript và JVM của VnCoreNLP không dùng chung được qua fork
+    if predictor.backend == "onnx":
+        predictor.model = predictor._load_onnx_session(model_path)
+    elif compiled:
+        predictor._compile_buckets()
+    predictor.init_word_segmentation(use_word_segmentation)
+
+    results.put((None, "ready", {
+        "worker": worker_index,
+        "pid": os.getpid(),
+        "use_word_segmentation": predictor.use_word_segmentation
+    }))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, method, args, kwargs = task
+        try:
+            if method == "predict_iter":
+                trace = InferenceTrace()
+                for item in predictor.predict_iter(*args, trace=trace, **kwargs):
+                    results.put((request_id, "item", item))
+                results.put((request_id, "end", trace))
+            else:
+                results.put((request_id, "result", getattr(predictor, method)(*args, **kwargs)))
+        except Exception as e:
+            results.put((request_id, "error", f"{type(e).__name__}: {e}"))
+
+
+class WorkerPoolPredictor:
+    """
+    Thay thế NERPredictor trong Backend API, chuyển predict / predict_batch / predict_iter
+    tới các tiến trình worker
+
+    Các lời gọi là blocking (giống NERPredictor) và an toàn khi gọi từ nhiều luồng; mỗi tác vụ
+    được gửi tới worker còn sống có ít tác vụ chưa xong nhất. Một tác vụ chiếm chỗ của worker cho tới
+    khi worker trả kết quả (kể cả khi người gọi đã hết thời gian chờ), nên hàng đợi của worker không
+    vượt quá max_in_flight; khi mọi worker đã đầy, lời gọi bị từ chối bằng QueueFullError.
+    Worker chết được phát hiện định kỳ và các tác vụ của nó thất bại ngay.
+    Bộ nhớ đệm kết quả nằm riêng trong từng worker.
+    """
+
+    def __init__(self, model_path: str, num_workers: int, use_word_segmentation: bool = True,
+                 sentence_cache: bool = False, timeout: float = None, max_in_flight: int = None):
+        """
+        Args:
+            model_path: Thư mục model
+            num_workers: Số tiến trình worker
+            use_word_segmentation: Worker dùng VnCoreNLP để tách từ hay không
+            sentence_cache: Bật cache theo câu trong từng worker (xem NERPredictor)
+            timeout: Thời gian chờ tối đa (giây) cho một tác vụ (mặc định API_WORKER_TIMEOUT_SECONDS)
+            max_in_flight: Số tác vụ chưa xong tối đa của mỗi worker (mặc định API_WORKER_MAX_IN_FLIGHT)
+        """
+        self.num_workers = num_workers
+        self.timeout = ner_config.API_WORKER_TIMEOUT_SECONDS if timeout is None else timeout
+        self.max_in_flight = ner_config.API_WORKER_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        # Caches của từng worker không truy cập được từ tiến trình API
+        self.result_cache = None
+        self.sentence_cache = None
+        self.use_word_segmentation = False
+        self.worker_info: Dict[int, Dict[str, Any]] = {}
+        self._workers = []
+        self._request_ids = itertools.count()
+        # request_id -> [worker, nơi nhận kết quả (None khi người gọi đã bỏ chờ)]
+        self._pending: Dict[int, List[Any]] = {}
+        self._in_flight = [0] * num_workers
+        self._dead = set()
+        self._lock = threading.Lock()
+
+        # Tải model một lần trong tiến trình API. Không chạy forward, không khởi tạo VnCoreNLP và
+        # không compile trước khi fork (thread pool của OpenMP / JVM không dùng được sau fork).
+        predictor = NERPredictor(model_path, use_word_segmentation=False, verbose=False, compiled=False,
+                                 sentence_cache=sentence_cache)
+        self.model = predictor.model
+        if predictor.model is None:
+            return
+        if predictor.backend == "onnx":
+            predictor.model = None  # Mỗi worker tự tạo phiên ONNX Runtime
+        else:
+            predictor.model.share_memory()
+
+        context = multiprocessing.get_context("fork")
+        self._tasks = [context.Queue() for _ in range(num_workers)]
+        self._results = context.Queue()
+        num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        self._workers = [
+            context.Process(
+                target=_worker_main,
+                args=(predictor, self._tasks[index], self._results, index, num_threads,
+                      model_path, use_word_segmentation, ner_config.INFERENCE_COMPILED),
+                name=f"ner-worker-{index}",
+                daemon=True
+            )
+            for index in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        # Chờ mọi worker sẵn sàng rồi mới bắt đầu luồng đọc kết quả
+        for _ in self._workers:
+            _, _, info = self._results.get(timeout=self.timeout)
+            self.worker_info[info["worker"]] = info
+        self.use_word_segmentation = all(info["use_word_segmentation"] for info in self.worker_info.values())
+
+        self._reader = threading.Thread(target=self._read_results, name="ner-worker-results", daemon=True)
+        self._reader.start()
+
+    def predict(self, *args, **kwargs):
+        """Như NERPredictor.predict(), chạy trong một worker"""
+        return self._call("predict", args, kwargs)
+
+    def predict_batch(self, *args, **kwargs):
+        """Như NERPredictor.predict_batch(), chạy trong một worker"""
+        return self._call("predict_batch", args, kwargs)
+
+    def predict_iter(self, text: str, trace: InferenceTrace = None, **kwargs) -> Iterator:
+        """Như NERPredictor.predict_iter(): các khối được worker gửi về ngay khi xử lý xong"""
+        items = queue.Queue()
+        request_id = self._submit("predict_iter", (text,), kwargs, items)
+        try:
+            while True:
+                kind, payload = items.get(timeout=self.timeout)
+                if kind == "item":
+                    yield payload
+                elif kind == "end":
+                    if trace is not None:
+                        trace.__dict__.update(payload.__dict__)
+                    return
+                else:
+                    raise RuntimeError(f"Worker error: {payload}")
+        finally:
+            self._abandon(request_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Trạng thái các worker (pid, còn sống hay không) và số tác vụ đang chờ kết quả"""
+        with self._lock:
+            pending = len(self._pending)
+            in_flight = list(self._in_flight)
+        return {
+            "workers": [
+                {**self.worker_info.get(index, {}), "alive": worker.is_alive(), "in_flight": in_flight[index]}
+                for index, worker in enumerate(self._workers)
+            ],
+            "pending": pending
+        }
+
+    def shutdown(self) -> None:
+        """Dừng các worker"""
+        if not self._workers:
+            return
+        for tasks in self._tasks:
+            tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._results.put(None)
+
+    def _call(self, method: str, args: tuple, kwargs: Dict[str, Any]):
+        """Gửi một tác vụ và chờ kết quả"""
+        future = Future()
+        request_id = self._submit(method, args, kwargs, future)
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            self._abandon(request_id)
+
+    def _submit(self, method: str, args: tuple, kwargs: Dict[str, Any], receiver) -> int:
+        """
+        Đăng ký nơi nhận kết quả (Future hoặc Queue) và đưa tác vụ vào hàng đợi của worker
+        còn sống có ít tác vụ chưa xong nhất
+
+        Raises:
+            QueueFullError: Nếu mọi worker đã có max_in_flight tác vụ chưa xong
+            RuntimeError: Nếu không còn worker nào sống
+        """
+        with self._lock:
+            alive = [index for index in range(len(self._workers)) if index not in self._dead]
+            if not alive:
+                raise RuntimeError("Không còn worker nào hoạt động")
+            worker = min(alive, key=self._in_flight.__getitem__)
+            if self._in_flight[worker] >= self.max_in_flight:
+                raise QueueFullError(f"Mọi worker đều đang bận ({self.max_in_flight} tác vụ mỗi worker)")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = [worker, receiver]
+            self._in_flight[worker] += 1
+        self._tasks[worker].put((request_id, method, args, kwargs))
+        return request_id
+
+    def _abandon(self, request_id: int) -> None:
+        """Người gọi không chờ nữa; tác vụ vẫn giữ chỗ của worker cho tới khi worker trả kết quả"""
+        with self._lock:
+            if request_id in self._pending:
+                self._pending[request_id][1] = None
+
+    def _finish(self, request_id: int) -> Optional[Any]:
+        """Giải phóng chỗ của tác vụ đã xong; trả về nơi nhận kết quả (None nếu không còn ai chờ)"""
+        with self._lock:
+            worker, receiver = self._pending.pop(request_id, (None, None))
+            if worker is not None:
+                self._in_flight[worker] -= 1
+        return receiver
+
+    def _check_workers(self) -> None:
+        """Đánh dấu worker đã chết và cho các tác vụ chưa xong của nó thất bại ngay"""
+        failed = []
+        with self._lock:
+            for index, worker in enumerate(self._workers):
+                if index in self._dead or worker.is_alive():
+                    continue
+                self._dead.add(index)
+                logger.error(f"Model worker {index} (pid {worker.pid}) died with exit code {worker.exitcode}")
+                for request_id, (task_worker, receiver) in list(self._pending.items()):
+                    if task_worker == index:
+                        del self._pending[request_id]
+                        failed.append(receiver)
+                self._in_flight[index] = 0
+        for receiver in failed:
+            self._deliver(receiver, "error", "worker process died")
+
+    def _read_results(self) -> None:
+        """Luồng nhận kết quả từ worker và chuyển tới Future / Queue của từng tác vụ"""
+        last_check = time.monotonic()
+        while True:
+            if time.monotonic() - last_check >= _HEALTH_CHECK_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                message = self._results.get(timeout=_HEALTH_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            if message is None:
+                break
+            request_id, kind, payload = message
+            if kind == "item":
+                with self._lock:
+                    receiver = self._pending.get(request_id, [None, None])[1]
+            else:
+                receiver = self._finish(request_id)
+            self._deliver(receiver, kind, payload)
+
+    @staticmethod
+    def _deliver(receiver, kind: str, payload: Any) -> None:
+        """Chuyển một kết quả tới Future / Queue (bỏ qua nếu người gọi đã hết thời gian chờ)"""
+        if receiver is None:
+            return
+        if isinstance(receiver, Future):
+            if kind == "result":
+                receiver.set_result(payload)
+            else:
+                receiver.set_exception(RuntimeError(f"Worker error: {payload}"))
+        else:
+            receiver.put((kind, payload))
@@ -86,3 +86,195 @@ VNCORENLP_MODELS_DIR = os.path.join(BASE_PROJECT_DIR, 'vncorenlp_models')
 # Annotators cần thiết cho VnCoreNLP (chỉ cần word segmentation)
 VNCORENLP_ANNOTATORS = ['wseg']
 
+
+# --- 6. Cấu hình Inference ---
+# Số chuỗi (câu/chunk) tối đa trong một batch khi chạy model ở chế độ suy luận.
+# Các chuỗi được sắp xếp theo độ dài và padding động trong từng batch.
+INFERENCE_BATCH_SIZE = 16
+
+# Số ký tự tối đa tìm kiếm thêm khi căn một từ đã segment về văn bản gốc
+# (chỉ dùng khi VnCoreNLP chuẩn hóa ký tự khiến không khớp trực tiếp).
+ALIGNMENT_LOOKAHEAD = 64
+
+# Ngưỡng độ tin cậy (xác suất softmax trung bình của các token) tối thiểu để giữ một entity.
+# 0.0 nghĩa là giữ lại tất cả entity.
+MIN_ENTITY_CONFIDENCE = 0.0
+
+# Bước trượt (số tokens) giữa các cửa sổ khi chia một câu dài hơn max_length.
+# Vùng chồng lấn giữa hai cửa sổ liên tiếp là max_length - WINDOW_STRIDE tokens; logits của
+# token nằm trong vùng chồng lấn được lấy trung bình. Stride nhỏ hơn: chính xác hơn ở ranh giới
+# cửa sổ nhưng phải chạy nhiều cửa sổ hơn.
+WINDOW_STRIDE = 190
+
+# In thông tin tiến trình (banner, số token, số chunk...) ra console khi dự đoán.
+# Tắt (False) khi chạy trong server để không tốn thời gian ghi console trên mỗi request.
+INFERENCE_VERBOSE = True
+
+# Backend chạy model khi suy luận: "pytorch", "onnx" (ONNX Runtime trên CPU) hoặc "int8"
+# (PyTorch với các lớp Linear lượng tử hóa động int8, chạy trên CPU).
+# Backend "onnx" cần file ONNX_MODEL_FILE trong thư mục model (tạo bằng `python src/export_onnx.py`).
+# Backend "int8" cần file QUANTIZED_MODEL_FILE (tạo bằng `python src/quantize.py`).
+INFERENCE_BACKEND = "pytorch"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_OPSET = 17
+# Số luồng intra-op của ONNX Runtime (0 = để ONNX Runtime tự chọn theo số nhân CPU)
+ONNX_INTRA_OP_THREADS = 0
+# Sai lệch logits tối đa cho phép giữa backend ONNX và PyTorch khi kiểm tra tương đương
+ONNX_PARITY_TOLERANCE = 1e-3
+
+# File model int8 (lưu cạnh checkpoint fp32) và mức giảm F1 (micro, seqeval) tối đa cho phép
+# so với model fp32. Nếu F1 giảm nhiều hơn, src/quantize.py sẽ không ghi file int8.
+QUANTIZED_MODEL_FILE = "model_int8.pt"
+QUANTIZATION_MAX_F1_DROP = 0.01
+
+# Chế độ compiled (TorchScript) cho backend "pytorch" / "int8": khi khởi động, model được trace
+# và warm-up một lần cho mỗi độ dài trong COMPILE_LENGTH_BUCKETS; mỗi batch được padding lên
+# bucket nhỏ nhất chứa nó để dùng lại đồ thị đã trace thay vì chạy đồ thị eager với mọi độ dài.
+# Batch dài hơn bucket lớn nhất chạy ở chế độ eager.
+INFERENCE_COMPILED = False
+COMPILE_LENGTH_BUCKETS = [32, 64, 128, 256]
+
+# Bộ nhớ đệm LRU kết quả của NERPredictor, khóa theo văn bản + model + tham số dự đoán.
+# Giới hạn theo số kết quả, dung lượng ước lượng (byte) và thời gian sống (giây, None = không hết hạn).
+# RESULT_CACHE_MAX_ENTRIES = 0 để tắt.
+RESULT_CACHE_MAX_ENTRIES = 1024
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 3600
+
+# Bộ nhớ đệm theo câu (NERPredictor(sentence_cache=True), mặc định tắt): với văn bản dài từ
+# SENTENCE_CACHE_MIN_CHARS ký tự, mỗi câu được dự đoán độc lập và kết quả được dùng lại cho các câu lặp lại
+# giữa các bản tin (tiêu đề, câu mẫu thông báo ca bệnh...). Văn bản ngắn hơn luôn được dự đoán nguyên văn bản.
+# So sánh F1 với cách dự đoán mặc định: python src/evaluate.py --sentence-cache-report
+SENTENCE_CACHE_MIN_CHARS = 2000
+SENTENCE_CACHE_REPORT_DOC_SENTENCES = 30
+SENTENCE_CACHE_MAX_ENTRIES = 50000
+SENTENCE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+SENTENCE_CACHE_TTL = None
+
+# Kích thước (số ký tự) tối đa của một khối câu khi dự đoán dạng streaming (NERPredictor.predict_iter,
+# endpoint SSE): mỗi khối được tách từ, chạy model và trả entity ngay khi xong.
+STREAM_BLOCK_CHARS = 2000
+
+# Tách văn bản nhiều bệnh nhân tại chỗ trước khi gọi Gemini: câu mở đầu bằng PATIENT_ID mới ("BN101, ...",
+# "Bệnh nhân 567: ...") bắt đầu một đoạn. Gemini chỉ được gọi khi cấu trúc không rõ ràng (không có
+# PATIENT_ID, PATIENT_ID có độ tin cậy < LOCAL_SPLITTER_MIN_CONFIDENCE, thông tin xen kẽ).
+LOCAL_SPLITTER_ENABLED = True
+LOCAL_SPLITTER_MIN_CONFIDENCE = 0.8
+# Gọi Gemini ngay cùng lúc với NER toàn văn bản (thay vì chỉ khi tách cục bộ không rõ ràng): trường hợp
+# không rõ ràng nhanh hơn, nhưng MỌI văn bản đều tốn một request Gemini (không hủy được khi đã gửi).
+GEMINI_SPECULATIVE_SPLIT = False
+
+# Chế độ tách văn bản với Gemini: "boundaries" - Gemini chỉ trả về khoảng câu [đầu, cuối] của từng bệnh nhân
+# trên văn bản đã đánh số câu, các đoạn được cắt tại chỗ từ văn bản gốc (ít token đầu ra, đoạn luôn là chuỗi
+# con của văn bản gốc); "full_text" - Gemini chép lại toàn bộ văn bản theo từng khối ---PATIENT_n---.
+GEMINI_SPLIT_MODE = "boundaries"
+
+# Client Gemini (REST API): một client dùng lâu dài cho mỗi API key, giữ tối đa GEMINI_POOL_SIZE kết nối
+# keep-alive; mỗi request có timeout và được thử lại tối đa GEMINI_MAX_RETRIES lần khi lỗi mạng / 429 / 5xx.
+# GEMINI_API_ENDPOINT có thể trỏ tới server giả lập cục bộ khi kiểm thử.
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "https://generativelanguage.googleapis.com")
+GEMINI_TIMEOUT_SECONDS = 60
+GEMINI_MAX_RETRIES = 2
+GEMINI_POOL_SIZE = 4
+# Số client (API key) dùng chung được giữ lại; client dùng ít gần đây nhất bị đóng khi vượt quá
+GEMINI_CLIENT_CACHE_SIZE = 8
+
+# Cache kết quả tách theo nội dung văn bản (bản tin gửi lại không gọi Gemini): trong bộ nhớ tối đa
+# GEMINI_CACHE_MAX_ENTRIES văn bản, và trên đĩa trong GEMINI_CACHE_DIR nếu được đặt (None = tắt).
+GEMINI_CACHE_MAX_ENTRIES = 256
+GEMINI_CACHE_DIR = None
+
+# Văn bản dài hơn GEMINI_WINDOW_CHARS ký tự (chế độ "boundaries") được chia thành các cửa sổ câu chồng lên
+# nhau GEMINI_WINDOW_OVERLAP_SENTENCES câu, gửi song song (tối đa GEMINI_MAX_PARALLEL_WINDOWS request)
+# rồi ghép ranh giới bệnh nhân giữa các cửa sổ (cần chồng lấn ít nhất 1 câu để nối bệnh nhân vắt qua biên cửa sổ).
+GEMINI_WINDOW_CHARS = 30000
+GEMINI_WINDOW_OVERLAP_SENTENCES = 4
+GEMINI_MAX_PARALLEL_WINDOWS = 4
+
+
+# --- 7. Cấu hình Distillation (Student model cho CPU) ---
+# Thư mục lưu student model (cùng định dạng save_pretrained, NERPredictor tải trực tiếp được)
+STUDENT_MODEL_OUTPUT_DIR = os.path.join(BASE_PROJECT_DIR, 'models/phobert-ner-covid-student')
+
+# Văn bản bản tin không có nhãn dùng thêm khi distillation (mỗi dòng một câu, chưa tách từ).
+# Bỏ qua nếu file không tồn tại.
+UNLABELED_TEXT_FILE = os.path.join(BASE_PROJECT_DIR, 'data/raw/unlabeled_bulletins.txt')
+
+# File cache logits của teacher (tính một lần, tự tính lại khi teacher hoặc dữ liệu thay đổi)
+TEACHER_LOGITS_CACHE = os.path.join(BASE_PROJECT_DIR, 'models/cache/teacher_logits.pt')
+
+# Kiến trúc student. STUDENT_HIDDEN_SIZE = None: giữ hidden size của teacher và khởi tạo các
+# layer của student từ các layer cách đều của teacher; nếu nhỏ hơn, student được khởi tạo ngẫu nhiên.
+STUDENT_NUM_LAYERS = 4
+STUDENT_HIDDEN_SIZE = None
+STUDENT_NUM_ATTENTION_HEADS = None
+STUDENT_INTERMEDIATE_SIZE = None
+
+# Nhiệt độ làm mềm logits và trọng số của loss khớp logits teacher
+# (1 - DISTILL_ALPHA là trọng số của cross-entropy với nhãn thật)
+DISTILL_TEMPERATURE = 2.0
+DISTILL_ALPHA = 0.7
+DISTILL_EPOCHS = 10
+DISTILL_LEARNING_RATE = 1e-4
+
+# Số câu test dùng để đo độ trễ (predict() từng câu trên CPU) khi so sánh model trong evaluate.py
+LATENCY_SAMPLE_SIZE = 200
+
+
+# --- 8. Cấu hình Early Exit ---
+# Các encoder layer (đánh số từ 1) có exit head; PhoBERT-base có 12 layer.
+EARLY_EXIT_LAYERS = [3, 6, 9]
+EARLY_EXIT_HEADS_FILE = "exit_heads.pt"
+
+# Ngưỡng độ tin cậy (xác suất softmax lớn nhất) mà mọi token của cửa sổ phải đạt để dừng sớm.
+# None: tắt early exit, luôn chạy toàn bộ các layer.
+EARLY_EXIT_THRESHOLD = None
+
+# Huấn luyện exit heads (backbone đã fine-tune được giữ nguyên)
+EARLY_EXIT_EPOCHS = 3
+EARLY_EXIT_LEARNING_RATE = 1e-3
+
+# Các ngưỡng được so sánh trong báo cáo `python src/evaluate.py --early-exit-report`
+EARLY_EXIT_REPORT_THRESHOLDS = [0.8, 0.9, 0.95, 0.99]
+
+
+# --- 9. Cấu hình Backend API ---
+# Số luồng chạy suy luận NER song song và số request được chờ khi mọi luồng đều bận.
+# Request vượt quá nhận HTTP 429 kèm header Retry-After (giây) thay vì xếp hàng vô hạn.
+API_INFERENCE_WORKERS = 2
+API_QUEUE_DEPTH = 8
+API_RETRY_AFTER_SECONDS = 5
+
+# Bật cache theo câu (NERPredictor(sentence_cache=True)) cho model của API. Chỉ áp dụng cho văn bản dài;
+# mặc định tắt vì mỗi câu được dự đoán không có ngữ cảnh (kiểm tra F1 bằng evaluate.py --sentence-cache-report).
+API_SENTENCE_CACHE = False
+
+# Số tiến trình worker chạy suy luận (0 = chạy trong tiến trình API). Khi > 0, model được tải một lần,
+# trọng số đặt trong shared memory rồi fork ra các worker (chỉ trên hệ điều hành hỗ trợ fork);
+# số luồng dispatch của API bằng số worker. Mỗi tác vụ phải xong trong API_WORKER_TIMEOUT_SECONDS giây.
+# Mỗi worker nhận tối đa API_WORKER_MAX_IN_FLIGHT tác vụ chưa xong (kể cả tác vụ mà người gọi đã hết thời
+# gian chờ); khi mọi worker đã đầy, request nhận HTTP 429.
+API_MODEL_WORKERS = 0
+API_WORKER_TIMEOUT_SECONDS = 300
+API_WORKER_MAX_IN_FLIGHT = 2
+
+# Micro-batching cho /api/ner/predict và /api/ner/extract-manual: văn bản của các request đồng thời
+# được gom trong tối đa MICROBATCH_MAX_WAIT_MS mili giây (hoặc tới khi đủ MICROBATCH_MAX_TEXTS văn bản /
+# MICROBATCH_MAX_TOKENS token ước lượng) rồi chạy chung một lần predict_batch.
+MICROBATCH_ENABLED = True
+MICROBATCH_MAX_WAIT_MS = 5
+MICROBATCH_MAX_TEXTS = 32
+MICROBATCH_MAX_TOKENS = 4096
+
+# /api/ner/predict-batch: số văn bản tối đa mỗi request và số văn bản mỗi lần gọi predict_batch
+# (các văn bản được sắp xếp theo độ dài trước khi chia nhóm để padding ít nhất).
+API_BATCH_MAX_DOCUMENTS = 10000
+API_BATCH_GROUP_SIZE = 64
+
+# Job bất đồng bộ (/api/jobs/...) cho văn bản rất lớn: request được lưu trong file SQLite API_JOBS_DB
+# (job đang chạy khi server dừng sẽ chạy lại khi khởi động), API_JOB_WORKERS job được xử lý đồng thời.
+# Job đã kết thúc cũ hơn API_JOB_RETENTION_HOURS giờ bị xóa khi server khởi động.
+API_JOBS_DB = os.path.join(BASE_PROJECT_DIR, 'data/jobs/ner_jobs.sqlite3')
+API_JOB_WORKERS = 1
+API_JOB_RETENTION_HOURS = 72
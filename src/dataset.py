@@ -100,3 +100,83 @@ class NerDataset(torch.utils.data.Dataset):
             "attention_mask": torch.tensor(attention_mask, dtype=torch.long),
             "labels": torch.tensor(final_target_tags, dtype=torch.long)
         }
+
+
+class UnlabeledTextDataset(NerDataset):
+    """
+    Dataset cho văn bản không có nhãn (ví dụ các bản tin COVID-19), dùng khi distillation.
+    Mỗi dòng của file là một câu. Nhãn của mọi token là -100 nên các câu này chỉ đóng góp
+    vào loss khớp logits của teacher.
+    """
+    def __init__(self, file_path, tokenizer, max_len, tags_to_ids, segment_fn=None):
+        """
+        Hàm khởi tạo.
+
+        Args:
+            file_path (str): Đường dẫn đến file văn bản (mỗi dòng một câu).
+            tokenizer: Tokenizer của Hugging Face (ví dụ: PhoBERT tokenizer).
+            max_len (int): Độ dài tối đa của chuỗi sau khi token hóa.
+            tags_to_ids (dict): Bảng map từ tên nhãn sang ID.
+            segment_fn (callable): Hàm tách từ áp dụng cho từng dòng (ví dụ VnCoreNLP).
+                Bỏ qua nếu văn bản đã được tách từ.
+        """
+        self.segment_fn = segment_fn
+        super().__init__(file_path, tokenizer, max_len, tags_to_ids)
+
+    def _read_data(self):
+        """
+        Đọc file văn bản, tách từ (nếu có segment_fn) và tạo nhãn giả 'O' cho từng từ.
+        """
+        if not os.path.exists(self.file_path):
+            raise FileNotFoundError(f"File không được tìm thấy tại: {self.file_path}")
+
+        sentences = []
+        with open(self.file_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if self.segment_fn is not None:
+                    line = self.segment_fn(line)
+                sentences.append(line.split())
+        tags = [['O'] * len(words) for words in sentences]
+        return sentences, tags
+
+    def __getitem__(self, index):
+        """
+        Lấy một mẫu dữ liệu; toàn bộ nhãn được thay bằng -100.
+        """
+        item = super().__getitem__(index)
+        item['labels'] = torch.full_like(item['labels'], self.subword_tag_id)
+        return item
+
+
+class DistillationDataset(torch.utils.data.Dataset):
+    """
+    Ghép một dataset (NerDataset / UnlabeledTextDataset) với logits của teacher đã tính sẵn.
+    """
+    def __init__(self, dataset, teacher_logits):
+        """
+        Hàm khởi tạo.
+
+        Args:
+            dataset: Dataset gốc trả về input_ids, attention_mask, labels.
+            teacher_logits (list): Logits của teacher cho từng câu, mỗi phần tử có dạng
+                (số token thật x số nhãn) - không gồm phần padding.
+        """
+        self.dataset = dataset
+        self.teacher_logits = teacher_logits
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        """
+        Lấy một mẫu dữ liệu kèm 'teacher_logits' đã padding về max_len.
+        """
+        item = dict(self.dataset[index])
+        logits = self.teacher_logits[index].float()
+        padded = torch.zeros((item['input_ids'].shape[0], logits.shape[1]))
+        padded[:logits.shape[0]] = logits
+        item['teacher_logits'] = padded
+        return item
@@ -0,0 +1,100 @@
+# src/early_exit.py
+#
+# Module này định nghĩa các classifier phụ (exit heads) đặt sau một số encoder layer
+# của mô hình token classification. Khi suy luận, NERPredictor có thể dừng ở layer đầu
+# tiên mà mọi token đều đạt ngưỡng độ tin cậy, thay vì chạy hết toàn bộ các layer.
+
+import os
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+import config
+
+
+class EarlyExitHeads(nn.Module):
+    """
+    Tập các classifier phụ, mỗi classifier nhận hidden states sau một encoder layer.
+    """
+    def __init__(self, hidden_size: int, num_labels: int, exit_layers: List[int], dropout: float = 0.1):
+        """
+        Hàm khởi tạo.
+
+        Args:
+            hidden_size (int): Kích thước hidden state của model.
+            num_labels (int): Số nhãn.
+            exit_layers (List[int]): Các layer đặt exit head (đánh số từ 1, sau layer thứ k).
+            dropout (float): Tỉ lệ dropout trước lớp Linear.
+        """
+        super().__init__()
+        self.hidden_size = hidden_size
+        self.num_labels = num_labels
+        self.exit_layers = sorted(exit_layers)
+        self.heads = nn.ModuleDict({
+            str(layer): nn.Sequential(nn.Dropout(dropout), nn.Linear(hidden_size, num_labels))
+            for layer in self.exit_layers
+        })
+
+    def forward(self, layer: int, hidden_states: torch.Tensor) -> torch.Tensor:
+        """
+        Tính logits từ hidden states sau layer `layer`.
+
+        Args:
+            layer (int): Số thứ tự layer (phải nằm trong exit_layers).
+            hidden_states (torch.Tensor): Hidden states (batch x độ dài x hidden_size).
+
+        Returns:
+            torch.Tensor: Logits (batch x độ dài x num_labels).
+        """
+        return self.heads[str(layer)](hidden_states)
+
+    def save(self, model_dir: str, signature: Dict[str, List[int]]) -> str:
+        """
+        Lưu exit heads cạnh checkpoint của model.
+
+        Args:
+            model_dir (str): Thư mục model.
+            signature (Dict[str, List[int]]): Chữ ký các file trọng số của model mà heads được huấn luyện trên đó.
+
+        Returns:
+            str: Đường dẫn file đã lưu.
+        """
+        path = os.path.join(model_dir, config.EARLY_EXIT_HEADS_FILE)
+        torch.save({
+            'hidden_size': self.hidden_size,
+            'num_labels': self.num_labels,
+            'exit_layers': self.exit_layers,
+            'state_dict': self.state_dict(),
+            'checkpoint_signature': signature
+        }, path)
+        return path
+
+    @classmethod
+    def load(cls, model_dir: str, signature: Dict[str, List[int]]) -> Optional["EarlyExitHeads"]:
+        """
+        Tải exit heads đã lưu trong thư mục model.
+
+        Args:
+            model_dir (str): Thư mục model.
+            signature (Dict[str, List[int]]): Chữ ký các file trọng số hiện tại của model.
+
+        Returns:
+            EarlyExitHeads ở chế độ eval, hoặc None nếu chưa có file hoặc file đã cũ so với model.
+        """
+        path = os.path.join(model_dir, config.EARLY_EXIT_HEADS_FILE)
+        if not os.path.exists(path):
+            print(f"Cảnh báo: Không tìm thấy {path}. Early exit bị vô hiệu hóa.")
+            print("Huấn luyện exit heads bằng lệnh: python src/train.py --early-exit")
+            return None
+
+        saved = torch.load(path, map_location="cpu")
+        if saved['checkpoint_signature'] != signature:
+            print(f"Cảnh báo: {path} đã cũ so với checkpoint của model. Early exit bị vô hiệu hóa.")
+            print("Huấn luyện lại exit heads bằng lệnh: python src/train.py --early-exit")
+            return None
+
+        heads = cls(saved['hidden_size'], saved['num_labels'], saved['exit_layers'])
+        heads.load_state_dict(saved['state_dict'])
+        heads.eval()
+        return heads
@@ -5,16 +5,76 @@
 # 1. Tải mô hình và tokenizer đã được huấn luyện tốt nhất.
 # 2. Tải và chuẩn bị dữ liệu từ file test.
 # 3. Chạy suy luận (inference) và tính toán các chỉ số (metrics).
+#
+# Với `--compare`, script so sánh nhiều model (ví dụ teacher và student sau distillation):
+# F1 trên tập test, số tham số và độ trễ predict() trên từng câu.
+# Với `--early-exit-report`, script mô phỏng early exit (xem src/train.py --early-exit) trên
+# tập test với nhiều ngưỡng độ tin cậy: độ sâu trung bình, F1 và độ lệch so với model đầy đủ.
+# Với `--sentence-cache-report`, script ghép các câu test thành văn bản dài và so sánh F1 (theo entity)
+# của NERPredictor mặc định với NERPredictor(sentence_cache=True), vốn dự đoán từng câu không có ngữ cảnh.
 
+import os
+import sys
+import time
+import argparse
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 from transformers import AutoTokenizer, AutoModelForTokenClassification
 from tqdm import tqdm
-from seqeval.metrics import classification_report
+from seqeval.metrics import classification_report, f1_score
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import các module tự định nghĩa
 import config
 from dataset import NerDataset
+from early_exit import EarlyExitHeads
+
+def predict_tags(model, dataloader, device):
+    """
+    Chạy model trên toàn bộ dataloader và chuyển kết quả sang dạng nhãn cho seqeval.
+
+    Args:
+        model: Mô hình token classification (fp32 hoặc đã lượng tử hóa).
+        dataloader (DataLoader): DataLoader của NerDataset.
+        device (torch.device): Thiết bị chạy model.
+
+    Returns:
+        tuple: (all_labels, all_preds) - danh sách nhãn thật và nhãn dự đoán của từng câu,
+        đã bỏ các sub-word (chỉ giữ token đầu của mỗi từ).
+    """
+    all_preds = []
+    all_labels = []
+
+    with torch.no_grad(): # Không cần tính gradient khi đánh giá
+        for batch in tqdm(dataloader, desc="Evaluating on Test Set"):
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+            labels = batch['labels'].to(device)
+
+            outputs = model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                labels=labels
+            )
+
+            logits = outputs.logits
+            predictions = torch.argmax(logits, dim=-1).cpu().numpy()
+            true_labels = labels.cpu().numpy()
+
+            # Chuyển đổi ID sang Tag và xử lý subword để so sánh
+            for i in range(len(true_labels)):
+                pred_tags = [config.IDS_TO_TAGS[p] for p, l in zip(predictions[i], true_labels[i]) if l != config.SUBWORD_TAG_ID]
+                label_tags = [config.IDS_TO_TAGS[l] for l in true_labels[i] if l != config.SUBWORD_TAG_ID]
+                
+                # Đảm bảo độ dài bằng nhau sau khi loại bỏ subword
+                min_len = min(len(pred_tags), len(label_tags))
+                all_preds.append(pred_tags[:min_len])
+                all_labels.append(label_tags[:min_len])
+
+    return all_labels, all_preds
+
 
 def run_evaluation():
     """Hàm chính để chạy toàn bộ quá trình đánh giá."""
@@ -49,40 +109,283 @@ def run_evaluation():
     test_dataloader = DataLoader(test_dataset, batch_size=config.VALID_BATCH_SIZE)
 
     # --- 4. Chạy Đánh giá ---
-    all_preds = []
+    all_labels, all_preds = predict_tags(model, test_dataloader, device)
+
+    # --- 5. In Kết quả ---
+    report = classification_report(all_labels, all_preds, digits=4)
+    print("\n--- Final Evaluation Report on Test Set ---")
+    print(report)
+
+
+def measure_latency(model_dir, texts):
+    """
+    Đo độ trễ predict() (toàn bộ pipeline suy luận) trên từng câu.
+
+    Returns:
+        tuple: (độ trễ trung bình, độ trễ p95) tính bằng mili giây.
+    """
+    from src.inference import NERPredictor
+
+    # Dữ liệu test đã được tách từ nên không cần VnCoreNLP
+    # Tắt bộ nhớ đệm kết quả để mọi lần gọi đều chạy model
+    predictor = NERPredictor(model_dir, use_word_segmentation=False, verbose=False, result_cache=False)
+    predictor.predict(texts[0])  # Warm-up
+
+    timings = []
+    for text in tqdm(texts, desc="Measuring latency"):
+        start = time.perf_counter()
+        predictor.predict(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.mean(timings)), float(np.percentile(timings, 95))
+
+
+def run_comparison(model_dirs):
+    """
+    So sánh F1 và độ trễ của nhiều model trên tập test (ví dụ teacher và student).
+
+    Args:
+        model_dirs (list): Danh sách thư mục model (định dạng save_pretrained).
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+
+    rows = []
+    for model_dir in model_dirs:
+        print(f"\nLoading model from: {model_dir}")
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(model_dir)
+            model = AutoModelForTokenClassification.from_pretrained(model_dir)
+            model.to(device)
+            model.eval()
+        except OSError:
+            print(f"Lỗi: Không tìm thấy model tại '{model_dir}', bỏ qua.")
+            continue
+
+        test_dataset = NerDataset(
+            file_path=config.TEST_FILE,
+            tokenizer=tokenizer,
+            max_len=config.MAX_LEN,
+            tags_to_ids=config.TAGS_TO_IDS
+        )
+        test_dataloader = DataLoader(test_dataset, batch_size=config.VALID_BATCH_SIZE)
+        all_labels, all_preds = predict_tags(model, test_dataloader, device)
+
+        texts = [" ".join(words) for words in test_dataset.sentences[:config.LATENCY_SAMPLE_SIZE]]
+        mean_ms, p95_ms = measure_latency(model_dir, texts)
+
+        rows.append({
+            'model': os.path.basename(os.path.normpath(model_dir)),
+            'params': sum(p.numel() for p in model.parameters()),
+            'f1': f1_score(all_labels, all_preds),
+            'mean_ms': mean_ms,
+            'p95_ms': p95_ms
+        })
+
+    if not rows:
+        return
+
+    # --- F1 / Latency Trade-off (so với model đầu tiên) ---
+    baseline = rows[0]
+    print("\n--- F1 / Latency Trade-off on Test Set ---")
+    print(f"{'Model':<32} {'Params':>9} {'F1':>8} {'ΔF1':>8} {'Mean ms':>9} {'p95 ms':>9} {'Speedup':>8}")
+    for row in rows:
+        print(f"{row['model']:<32} {row['params'] / 1e6:>8.1f}M {row['f1']:>8.4f} "
+              f"{row['f1'] - baseline['f1']:>+8.4f} {row['mean_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{baseline['mean_ms'] / row['mean_ms']:>7.2f}x")
+
+
+def run_early_exit_report(thresholds):
+    """
+    Mô phỏng early exit trên tập test với từng ngưỡng độ tin cậy.
+
+    Mỗi câu dừng ở exit layer đầu tiên mà mọi token (theo attention mask) có xác suất
+    nhãn cao nhất >= ngưỡng, giống NERPredictor khi mỗi batch chỉ có một câu.
+
+    Args:
+        thresholds (list): Các ngưỡng cần so sánh.
+    """
+    from src.inference import checkpoint_signature
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+
+    print(f"Loading model from: {config.MODEL_OUTPUT_DIR}")
+    tokenizer = AutoTokenizer.from_pretrained(config.MODEL_OUTPUT_DIR)
+    model = AutoModelForTokenClassification.from_pretrained(config.MODEL_OUTPUT_DIR)
+    model.to(device)
+    model.eval()
+
+    heads = EarlyExitHeads.load(config.MODEL_OUTPUT_DIR, checkpoint_signature(config.MODEL_OUTPUT_DIR))
+    if heads is None:
+        return
+    heads.to(device)
+    num_layers = model.config.num_hidden_layers
+
+    test_dataset = NerDataset(
+        file_path=config.TEST_FILE,
+        tokenizer=tokenizer,
+        max_len=config.MAX_LEN,
+        tags_to_ids=config.TAGS_TO_IDS
+    )
+    test_dataloader = DataLoader(test_dataset, batch_size=config.VALID_BATCH_SIZE)
+
+    # Với mỗi câu: nhãn dự đoán và độ tin cậy nhỏ nhất của từng exit layer (và của model đầy đủ)
+    layers = heads.exit_layers + [num_layers]
+    sentence_preds = []   # list[dict[layer -> list[tag]]]
+    sentence_min_conf = []  # list[dict[layer -> float]]
     all_labels = []
 
-    with torch.no_grad(): # Không cần tính gradient khi đánh giá
-        for batch in tqdm(test_dataloader, desc="Evaluating on Test Set"):
+    with torch.no_grad():
+        for batch in tqdm(test_dataloader, desc="Evaluating exit heads"):
             input_ids = batch['input_ids'].to(device)
             attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
+            true_labels = batch['labels'].numpy()
 
-            outputs = model(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                labels=labels
-            )
+            outputs = model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+            layer_logits = {layer: heads(layer, outputs.hidden_states[layer]) for layer in heads.exit_layers}
+            layer_logits[num_layers] = outputs.logits
 
-            logits = outputs.logits
-            predictions = torch.argmax(logits, dim=-1).cpu().numpy()
-            true_labels = labels.cpu().numpy()
+            token_mask = attention_mask.bool()
+            layer_preds = {}
+            layer_conf = {}
+            for layer, logits in layer_logits.items():
+                confidence, predictions = torch.softmax(logits, dim=-1).max(dim=-1)
+                confidence = confidence.masked_fill(~token_mask, 1.0)
+                layer_preds[layer] = predictions.cpu().numpy()
+                layer_conf[layer] = confidence.min(dim=-1).values.cpu().numpy()
 
-            # Chuyển đổi ID sang Tag và xử lý subword để so sánh
             for i in range(len(true_labels)):
-                pred_tags = [config.IDS_TO_TAGS[p] for p, l in zip(predictions[i], true_labels[i]) if l != config.SUBWORD_TAG_ID]
-                label_tags = [config.IDS_TO_TAGS[l] for l in true_labels[i] if l != config.SUBWORD_TAG_ID]
-                
-                # Đảm bảo độ dài bằng nhau sau khi loại bỏ subword
-                min_len = min(len(pred_tags), len(label_tags))
-                all_preds.append(pred_tags[:min_len])
-                all_labels.append(label_tags[:min_len])
+                keep = true_labels[i] != config.SUBWORD_TAG_ID
+                all_labels.append([config.IDS_TO_TAGS[l] for l in true_labels[i][keep]])
+                sentence_preds.append({layer: [config.IDS_TO_TAGS[p] for p in layer_preds[layer][i][keep]]
+                                       for layer in layers})
+                sentence_min_conf.append({layer: float(layer_conf[layer][i]) for layer in layers})
 
-    # --- 5. In Kết quả ---
-    report = classification_report(all_labels, all_preds, digits=4)
-    print("\n--- Final Evaluation Report on Test Set ---")
-    print(report)
+    full_preds = [preds[num_layers] for preds in sentence_preds]
+    full_f1 = f1_score(all_labels, full_preds)
+    total_tags = sum(len(tags) for tags in full_preds)
+
+    print("\n--- Early Exit Report on Test Set ---")
+    print(f"Exit layers: {heads.exit_layers} (model has {num_layers} layers), {len(all_labels)} câu")
+    print(f"{'Threshold':>9} {'Avg depth':>10} {'Exited':>8} {'F1':>8} {'ΔF1':>8} {'Tag agree':>10}")
+    print(f"{'full':>9} {num_layers:>10.2f} {0:>8.1%} {full_f1:>8.4f} {0:>+8.4f} {1:>10.4%}")
+    for threshold in thresholds:
+        exit_depths = []
+        exit_preds = []
+        for preds, min_conf in zip(sentence_preds, sentence_min_conf):
+            layer = next((l for l in heads.exit_layers if min_conf[l] >= threshold), num_layers)
+            exit_depths.append(layer)
+            exit_preds.append(preds[layer])
+
+        f1 = f1_score(all_labels, exit_preds)
+        same_tags = sum(a == b for pred, full in zip(exit_preds, full_preds) for a, b in zip(pred, full))
+        exited = sum(depth < num_layers for depth in exit_depths) / max(len(exit_depths), 1)
+        print(f"{threshold:>9} {np.mean(exit_depths):>10.2f} {exited:>8.1%} {f1:>8.4f} "
+              f"{f1 - full_f1:>+8.4f} {same_tags / max(total_tags, 1):>10.4%}")
+
+
+def bio_entity_spans(words, tags):
+    """
+    Chuyển nhãn BIO của một câu đã tách từ sang các entity theo vị trí ký tự trong " ".join(words).
+
+    Returns:
+        set: Các tuple (start, end, tag).
+    """
+    spans = set()
+    offset = 0
+    current = None  # [start, end, tag]
+    for word, tag in zip(words, tags):
+        start, end = offset, offset + len(word)
+        offset = end + 1
+        if tag.startswith('I-') and current is not None and current[2] == tag[2:]:
+            current[1] = end
+            continue
+        if current is not None:
+            spans.add(tuple(current))
+        current = [start, end, tag[2:]] if tag != 'O' else None
+    if current is not None:
+        spans.add(tuple(current))
+    return spans
+
+
+def run_sentence_cache_report(doc_sentences):
+    """
+    So sánh F1 (khớp chính xác vị trí và nhãn entity) của cách dự đoán mặc định và cache theo câu
+    trên các văn bản dài ghép từ doc_sentences câu test liên tiếp.
+
+    Args:
+        doc_sentences (int): Số câu test trong mỗi văn bản ghép.
+    """
+    from src.inference import NERPredictor
+
+    test_dataset = NerDataset(
+        file_path=config.TEST_FILE,
+        tokenizer=None,
+        max_len=config.MAX_LEN,
+        tags_to_ids=config.TAGS_TO_IDS
+    )
+
+    # Dữ liệu test đã được tách từ nên không cần VnCoreNLP
+    documents = []
+    for first in range(0, len(test_dataset), doc_sentences):
+        text = ""
+        gold = set()
+        for words, tags in zip(test_dataset.sentences[first:first + doc_sentences],
+                               test_dataset.tags[first:first + doc_sentences]):
+            offset = len(text) + 1 if text else 0
+            gold.update((start + offset, end + offset, tag) for start, end, tag in bio_entity_spans(words, tags))
+            text = f"{text} {' '.join(words)}" if text else ' '.join(words)
+        documents.append((text, gold))
+
+    long_documents = sum(len(text) >= config.SENTENCE_CACHE_MIN_CHARS for text, _ in documents)
+    print(f"{len(documents)} văn bản ghép từ {doc_sentences} câu, {long_documents} văn bản đi qua cache theo câu "
+          f"(>= {config.SENTENCE_CACHE_MIN_CHARS} ký tự)")
+
+    rows = []
+    for name, sentence_cache in (("document", False), ("sentence_cache", True)):
+        predictor = NERPredictor(config.MODEL_OUTPUT_DIR, use_word_segmentation=False, verbose=False,
+                                 result_cache=False, sentence_cache=sentence_cache)
+        start = time.perf_counter()
+        results = predictor.predict_batch([text for text, _ in documents])
+        elapsed = time.perf_counter() - start
+        predicted = [{(e['start'], e['end'], e['tag']) for e in entities} for entities in results]
+        rows.append((name, predicted, elapsed))
+
+    baseline = rows[0]
+    print("\n--- Sentence Cache Report on Test Set ---")
+    print(f"{'Mode':<16} {'Precision':>9} {'Recall':>8} {'F1':>8} {'ΔF1':>8} {'Agree':>8} {'Seconds':>8}")
+    for name, predicted, elapsed in rows:
+        correct = sum(len(p & gold) for p, (_, gold) in zip(predicted, documents))
+        num_predicted = sum(len(p) for p in predicted)
+        num_gold = sum(len(gold) for _, gold in documents)
+        precision = correct / max(num_predicted, 1)
+        recall = correct / max(num_gold, 1)
+        f1 = 2 * precision * recall / max(precision + recall, 1e-12)
+        if name == baseline[0]:
+            baseline_f1 = f1
+        # Tỉ lệ entity giống hệt cách dự đoán mặc định
+        agree = sum(len(p & b) for p, b in zip(predicted, baseline[1])) / \
+            max(sum(len(p | b) for p, b in zip(predicted, baseline[1])), 1)
+        print(f"{name:<16} {precision:>9.4f} {recall:>8.4f} {f1:>8.4f} {f1 - baseline_f1:>+8.4f} "
+              f"{agree:>8.2%} {elapsed:>8.2f}")
 
 
 if __name__ == "__main__":
-    run_evaluation()
+    parser = argparse.ArgumentParser(description="Đánh giá mô hình NER trên tập test.")
+    parser.add_argument("--compare", nargs="*", default=None, metavar="MODEL_DIR",
+                        help="So sánh F1/độ trễ của các model (mặc định: teacher và student)")
+    parser.add_argument("--early-exit-report", nargs="*", type=float, default=None, metavar="THRESHOLD",
+                        help="Mô phỏng early exit với các ngưỡng (mặc định: config.EARLY_EXIT_REPORT_THRESHOLDS)")
+    parser.add_argument("--sentence-cache-report", nargs="?", type=int, const=0, default=None, metavar="SENTENCES",
+                        help="So sánh F1 của cache theo câu với cách dự đoán mặc định trên văn bản ghép từ "
+                             "SENTENCES câu test (mặc định: config.SENTENCE_CACHE_REPORT_DOC_SENTENCES)")
+    args = parser.parse_args()
+
+    if args.sentence_cache_report is not None:
+        run_sentence_cache_report(args.sentence_cache_report or config.SENTENCE_CACHE_REPORT_DOC_SENTENCES)
+    elif args.early_exit_report is not None:
+        run_early_exit_report(args.early_exit_report or config.EARLY_EXIT_REPORT_THRESHOLDS)
+    elif args.compare is None:
+        run_evaluation()
+    else:
+        run_comparison(args.compare or [config.MODEL_OUTPUT_DIR, config.STUDENT_MODEL_OUTPUT_DIR])
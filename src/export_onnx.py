@@ -0,0 +1,141 @@
+# src/export_onnx.py
+#
+# Script để chuyển mô hình đã huấn luyện sang định dạng ONNX cho backend ONNX Runtime (CPU).
+# Script này sẽ:
+# 1. Tải mô hình đã lưu trong config.MODEL_OUTPUT_DIR và export sang ONNX
+#    (trục batch và độ dài chuỗi là động).
+# 2. Kiểm tra tương đương giữa backend ONNX và PyTorch trên file test của PhoNER:
+#    sai lệch logits, tỉ lệ trùng nhãn theo token và số câu có entity khác nhau.
+#
+# Cách dùng:
+#   python src/export_onnx.py                 # export + kiểm tra tương đương
+#   python src/export_onnx.py --skip-export   # chỉ kiểm tra file ONNX đã có
+#   python src/export_onnx.py --limit 200     # kiểm tra trên 200 câu đầu của tập test
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import các module tự định nghĩa
+import config
+from dataset import NerDataset
+from src.inference import NERPredictor
+
+
+def export_onnx(model_dir: str = config.MODEL_OUTPUT_DIR, opset: int = config.ONNX_OPSET) -> str:
+    """
+    Export mô hình PyTorch sang ONNX, lưu cạnh checkpoint trong model_dir.
+
+    Args:
+        model_dir (str): Thư mục chứa mô hình và tokenizer đã lưu.
+        opset (int): Phiên bản opset của ONNX.
+
+    Returns:
+        str: Đường dẫn file ONNX đã tạo.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForTokenClassification.from_pretrained(model_dir)
+    model.eval()
+    # Trả về tuple (logits,) thay vì ModelOutput để đồ thị ONNX chỉ có một output
+    model.config.return_dict = False
+
+    onnx_path = os.path.join(model_dir, config.ONNX_MODEL_FILE)
+    dummy = tokenizer(["Bệnh_nhân BN123 , nam , 35 tuổi ."], return_tensors="pt")
+
+    print(f"Exporting {model_dir} -> {onnx_path} (opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+            dynamo=False,
+        )
+    print(f"Đã lưu mô hình ONNX tại: {onnx_path}")
+    return onnx_path
+
+
+def check_parity(model_dir: str = config.MODEL_OUTPUT_DIR, test_file: str = config.TEST_FILE,
+                 limit: int = None, tolerance: float = config.ONNX_PARITY_TOLERANCE) -> bool:
+    """
+    So sánh kết quả của backend ONNX và PyTorch trên các câu của file test.
+
+    Args:
+        model_dir (str): Thư mục chứa mô hình (và file ONNX).
+        test_file (str): File JSON Lines của PhoNER (đã tách từ).
+        limit (int): Chỉ dùng `limit` câu đầu tiên (mặc định dùng toàn bộ).
+        tolerance (float): Sai lệch logits tuyệt đối tối đa cho phép.
+
+    Returns:
+        bool: True nếu sai lệch logits nằm trong ngưỡng và entity của mọi câu trùng nhau.
+    """
+    torch_predictor = NERPredictor(model_dir, use_word_segmentation=False, verbose=False, backend="pytorch")
+    onnx_predictor = NERPredictor(model_dir, use_word_segmentation=False, verbose=False, backend="onnx")
+    if onnx_predictor.backend != "onnx":
+        print("Không tải được backend ONNX, bỏ qua kiểm tra tương đương.")
+        return False
+
+    # Dữ liệu PhoNER đã được tách từ (các âm tiết nối bằng dấu _), không cần VnCoreNLP
+    test_dataset = NerDataset(test_file, torch_predictor.tokenizer, config.MAX_LEN, config.TAGS_TO_IDS)
+    texts = [" ".join(words) for words in test_dataset.sentences[:limit]]
+    max_length = config.MAX_LEN - 2
+
+    # 1. So sánh logits trên cùng các chuỗi đầu vào
+    documents = [torch_predictor._encode_document(text) for text in texts]
+    encoded_inputs = [torch_predictor._build_model_input(document, 0, min(len(document), max_length))
+                      for document in documents]
+    torch_logits = torch_predictor._run_model_batched(encoded_inputs)
+    onnx_logits = onnx_predictor._run_model_batched(encoded_inputs)
+
+    max_diff = max((float(np.abs(a - b).max()) for a, b in zip(torch_logits, onnx_logits)), default=0.0)
+    same_tags = sum(int((a.argmax(-1) == b.argmax(-1)).sum()) for a, b in zip(torch_logits, onnx_logits))
+    total_tokens = sum(len(a) for a in torch_logits)
+
+    # 2. So sánh entity sau toàn bộ pipeline giải mã
+    def entity_keys(entities):
+        return [(e['start'], e['end'], e['tag']) for e in entities]
+
+    torch_entities = torch_predictor.predict_batch(texts, max_length=max_length)
+    onnx_entities = onnx_predictor.predict_batch(texts, max_length=max_length)
+    mismatched = sum(1 for a, b in zip(torch_entities, onnx_entities) if entity_keys(a) != entity_keys(b))
+
+    passed = max_diff <= tolerance and mismatched == 0
+    print("\n--- ONNX / PyTorch Parity Report ---")
+    print(f"Sentences:              {len(texts)}")
+    print(f"Max |logit diff|:       {max_diff:.2e} (tolerance {tolerance})")
+    print(f"Token tag agreement:    {same_tags / max(total_tokens, 1):.4%}")
+    print(f"Sentences w/ mismatch:  {mismatched}")
+    print(f"Result:                 {'PASS' if passed else 'FAIL'}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export mô hình NER sang ONNX và kiểm tra tương đương.")
+    parser.add_argument("--model-dir", default=config.MODEL_OUTPUT_DIR, help="Thư mục mô hình đã huấn luyện")
+    parser.add_argument("--test-file", default=config.TEST_FILE, help="File test PhoNER (JSON Lines)")
+    parser.add_argument("--limit", type=int, default=None, help="Số câu test tối đa dùng để kiểm tra")
+    parser.add_argument("--skip-export", action="store_true", help="Không export, chỉ kiểm tra file ONNX đã có")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export_onnx(args.model_dir)
+
+    passed = check_parity(args.model_dir, args.test_file, limit=args.limit)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
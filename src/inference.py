@@ -1,53 +1,386 @@
 
 import torch
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoTokenizer, AutoModelForTokenClassification, AutoConfig
 import numpy as np
 import sys
 import os
-import re
-from typing import List, Dict
+import glob
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Tuple, Iterator
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import config
-from src.text_processor import get_text_processor
+from early_exit import EarlyExitHeads
+from result_cache import ResultCache, make_cache_key
+from src.text_processor import get_text_processor, split_sentences
+
+
+@dataclass
+class EncodedDocument:
+    """
+    Văn bản đã được tách từ và token hóa, kèm bản đồ vị trí ký tự.
+
+    Mỗi subword token được ánh xạ về khoảng [start, end) trong văn bản gốc
+    (chưa segment), nhờ đó vị trí entity được suy ra trực tiếp từ chỉ số token.
+    """
+    text: str
+    segmented_text: str
+    tokens: List[str]
+    token_ids: List[int]
+    token_starts: np.ndarray
+    token_ends: np.ndarray
+    # True nếu token là BPE piece chưa kết thúc từ (hậu tố "@@")
+    open_pieces: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+
+def checkpoint_signature(model_path: str) -> Dict[str, List[int]]:
+    """
+    Tạo chữ ký (kích thước, thời gian sửa đổi) của các file trọng số trong thư mục model.
+
+    Dùng để phát hiện file model int8 đã cũ so với checkpoint fp32 hiện tại.
+
+    Args:
+        model_path (str): Thư mục chứa checkpoint fp32.
+
+    Returns:
+        Dict[str, List[int]]: Tên file trọng số -> [kích thước (byte), mtime (ns)].
+    """
+    signature = {}
+    for pattern in ("*.safetensors", "pytorch_model*.bin"):
+        for path in sorted(glob.glob(os.path.join(model_path, pattern))):
+            stat = os.stat(path)
+            signature[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Lượng tử hóa động int8 các lớp Linear của model (trọng số int8, activation lượng tử hóa lúc chạy).
+
+    Args:
+        model (torch.nn.Module): Model fp32 ở chế độ eval.
+
+    Returns:
+        torch.nn.Module: Model đã lượng tử hóa (chỉ chạy trên CPU).
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _EarlyExit(Exception):
+    """Dùng để dừng forward pass từ forward hook khi exit head đã đủ tin cậy."""
+    def __init__(self, logits: torch.Tensor, layer: int):
+        super().__init__(layer)
+        self.logits = logits
+        self.layer = layer
+
+
+@dataclass
+class InferenceTrace:
+    """
+    Thông tin thời gian và kích thước của một lần gọi predict() / predict_batch().
+
+    Mỗi giai đoạn trong stages lưu tổng thời gian thực ('wall') và thời gian CPU của
+    tiến trình ('cpu'), tính bằng giây. Các giai đoạn: segmentation (VnCoreNLP),
+    tokenization (token hóa và căn vị trí về văn bản gốc), windowing, forward,
+    fusion (ghép logits các cửa sổ), decoding (BIO), span_mapping và merge_names.
+    """
+    stages: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    num_texts: int = 0
+    num_tokens: int = 0
+    num_windows: int = 0
+    # Số chuỗi và độ dài (sau padding) của từng batch chạy qua model
+    batch_sizes: List[int] = field(default_factory=list)
+    batch_lengths: List[int] = field(default_factory=list)
+    # Số encoder layer đã chạy của từng batch (nhỏ hơn tổng số layer nếu dừng sớm)
+    exit_layers: List[int] = field(default_factory=list)
+    # Số văn bản lấy kết quả từ bộ nhớ đệm (không chạy model)
+    cache_hits: int = 0
+    # Số câu lấy kết quả từ bộ nhớ đệm theo câu
+    sentence_hits: int = 0
+    total_wall: float = 0.0
+    total_cpu: float = 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Đo thời gian của khối lệnh và cộng dồn vào giai đoạn name."""
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            timing['wall'] += time.perf_counter() - wall_start
+            timing['cpu'] += time.process_time() - cpu_start
+
+    def to_dict(self) -> Dict[str, any]:
+        """Chuyển trace thành dict (ví dụ để ghi log dạng JSON)."""
+        return asdict(self)
+
+    def summary(self) -> str:
+        """Tóm tắt trace trên một dòng, thời gian tính bằng mili giây."""
+        stages = " ".join(f"{name}={timing['wall'] * 1000:.1f}ms" for name, timing in self.stages.items())
+        return (f"total={self.total_wall * 1000:.1f}ms {stages} | texts={self.num_texts} "
+                f"tokens={self.num_tokens} windows={self.num_windows} batches={self.batch_sizes} "
+                f"cache_hits={self.cache_hits} sentence_hits={self.sentence_hits}")
+
 
 class NERPredictor:
     """
     Lớp đóng gói mô hình NER để thực hiện dự đoán trên văn bản mới.
     """
-    def __init__(self, model_path: str, use_word_segmentation: bool = True):
+    def __init__(self, model_path: str, use_word_segmentation: bool = True, verbose: bool = None,
+                 backend: str = None, compiled: bool = None, early_exit_threshold: float = None,
+                 result_cache: bool = True, sentence_cache: bool = False):
         """
         Hàm khởi tạo.
 
         Args:
             model_path (str): Đường dẫn đến thư mục chứa mô hình và tokenizer đã lưu.
             use_word_segmentation (bool): Sử dụng word segmentation hay không (mặc định True).
+            verbose (bool): In thông tin tiến trình ra console hay không
+                (mặc định config.INFERENCE_VERBOSE).
+            backend (str): "pytorch", "onnx" hoặc "int8" (mặc định config.INFERENCE_BACKEND). Nếu
+                không dùng được backend đã chọn, predictor tự chuyển về "pytorch".
+            compiled (bool): Trace model bằng TorchScript theo các bucket độ dài khi khởi động
+                (mặc định config.INFERENCE_COMPILED). Không áp dụng cho backend "onnx".
+            early_exit_threshold (float): Dừng ở exit head đầu tiên mà mọi token đạt ngưỡng độ tin
+                cậy này (mặc định config.EARLY_EXIT_THRESHOLD, None = tắt). Chỉ dùng cho backend
+                "pytorch" / "int8" không compiled.
+            result_cache (bool): Lưu kết quả vào bộ nhớ đệm LRU để trả ngay khi gặp lại cùng văn bản
+                (giới hạn theo config.RESULT_CACHE_*).
+            sentence_cache (bool): Với văn bản dài (từ config.SENTENCE_CACHE_MIN_CHARS ký tự), dự đoán theo
+                từng câu và lưu kết quả của từng câu, để các câu lặp lại giữa các văn bản không phải tách từ
+                và chạy model lại (giới hạn theo config.SENTENCE_CACHE_*). Mặc định tắt: mỗi câu mất ngữ cảnh
+                của các câu xung quanh.
         """
+        self.verbose = config.INFERENCE_VERBOSE if verbose is None else verbose
+        self.backend = config.INFERENCE_BACKEND if backend is None else backend
+        # Model đã trace theo độ dài bucket: {độ dài: module TorchScript}
+        self._compiled_models = {}
+        self.exit_heads = None
+        self.early_exit_threshold = config.EARLY_EXIT_THRESHOLD if early_exit_threshold is None else early_exit_threshold
+        # Trạng thái early exit của lượt forward hiện tại, riêng cho từng luồng
+        self._exit_state = threading.local()
+        # Tokenizer (slow, Python) được dùng chung giữa các luồng gọi predict đồng thời
+        self._tokenizer_lock = threading.Lock()
+        self.result_cache = None
+        if result_cache and config.RESULT_CACHE_MAX_ENTRIES > 0:
+            self.result_cache = ResultCache(config.RESULT_CACHE_MAX_ENTRIES, config.RESULT_CACHE_MAX_BYTES,
+                                            config.RESULT_CACHE_TTL)
+        self.sentence_cache = None
+        if sentence_cache and config.SENTENCE_CACHE_MAX_ENTRIES > 0:
+            self.sentence_cache = ResultCache(config.SENTENCE_CACHE_MAX_ENTRIES, config.SENTENCE_CACHE_MAX_BYTES,
+                                              config.SENTENCE_CACHE_TTL)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-            self.model = AutoModelForTokenClassification.from_pretrained(model_path)
-            self.model.to(self.device)
-            self.model.eval()
-            
-            self.ids_to_tags = self.model.config.id2label
-            print(f"Model loaded successfully from {model_path} on device {self.device}")
+
+            # Với backend "onnx", self.model là phiên ONNX Runtime thay cho model PyTorch
+            session = self._load_onnx_session(model_path) if self.backend == "onnx" else None
+            quantized_model = self._load_quantized_model(model_path) if self.backend == "int8" else None
+            if session is not None:
+                self.model = session
+                self.device = torch.device("cpu")
+                self.ids_to_tags = AutoConfig.from_pretrained(model_path).id2label
+            elif quantized_model is not None:
+                self.model = quantized_model
+                self.device = torch.device("cpu")
+                self.ids_to_tags = self.model.config.id2label
+            else:
+                self.backend = "pytorch"
+                self.model = AutoModelForTokenClassification.from_pretrained(model_path)
+                self.model.to(self.device)
+                self.model.eval()
+                self.ids_to_tags = self.model.config.id2label
+
+            self._build_tag_arrays()
+            if self.verbose:
+                print(f"Model loaded successfully from {model_path} on device {self.device} ({self.backend})")
+
+            if (config.INFERENCE_COMPILED if compiled is None else compiled) and self.backend != "onnx":
+                self._compile_buckets()
+            elif self.early_exit_threshold is not None and self.backend != "onnx":
+                self._load_exit_heads(model_path)
+
+            # Định danh model trong khóa cache: đổi checkpoint, backend hay early exit thì khóa cũng đổi
+            self._model_identity = (os.path.abspath(model_path), self.backend,
+                                    sorted(checkpoint_signature(model_path).items()),
+                                    self.early_exit_threshold if self.exit_heads is not None else None)
         except OSError:
             print(f"Lỗi: Không tìm thấy model tại '{model_path}'.")
             self.model = None
         
+        self.init_word_segmentation(use_word_segmentation)
+
+    def init_word_segmentation(self, use_word_segmentation: bool = True) -> None:
+        """
+        Khởi tạo (hoặc tắt) VnCoreNLP để tách từ.
+
+        Tách riêng khỏi __init__ để tiến trình con (fork từ tiến trình đã tải model) tự khởi tạo
+        VnCoreNLP của nó, vì JVM của VnCoreNLP không dùng được sau khi fork.
+
+        Args:
+            use_word_segmentation (bool): Sử dụng word segmentation hay không.
+        """
         self.use_word_segmentation = use_word_segmentation
         self.text_processor = get_text_processor() if use_word_segmentation else None
         
         if use_word_segmentation:
             if self.text_processor and self.text_processor.is_available():
-                print("VnCoreNLP word segmentation đã sẵn sàng")
+                if self.verbose:
+                    print("VnCoreNLP word segmentation đã sẵn sàng")
             else:
                 print("Cảnh báo: VnCoreNLP không khả dụng. Word segmentation sẽ bị vô hiệu hóa.")
                 self.use_word_segmentation = False
     
+    def _load_onnx_session(self, model_path: str):
+        """
+        Tạo phiên ONNX Runtime (CPU) từ file ONNX đã export trong thư mục model.
+
+        Args:
+            model_path (str): Thư mục model chứa file config.ONNX_MODEL_FILE.
+
+        Returns:
+            onnxruntime.InferenceSession, hoặc None nếu onnxruntime chưa được cài đặt
+            hoặc chưa có file ONNX.
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            print("Cảnh báo: onnxruntime chưa được cài đặt. Chuyển sang backend PyTorch.")
+            print("Cài đặt bằng lệnh: pip install onnxruntime")
+            return None
+
+        onnx_path = os.path.join(model_path, config.ONNX_MODEL_FILE)
+        if not os.path.exists(onnx_path):
+            print(f"Cảnh báo: Không tìm thấy {onnx_path}. Chuyển sang backend PyTorch.")
+            print("Tạo file ONNX bằng lệnh: python src/export_onnx.py")
+            return None
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = config.ONNX_INTRA_OP_THREADS
+        return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def _load_quantized_model(self, model_path: str):
+        """
+        Tải model int8 (lượng tử hóa động các lớp Linear) đã lưu cạnh checkpoint fp32.
+
+        Cấu trúc model được tạo từ config.json rồi lượng tử hóa, sau đó nạp trọng số int8
+        đã lưu, nên không cần đọc trọng số fp32 từ đĩa.
+
+        Args:
+            model_path (str): Thư mục model chứa file config.QUANTIZED_MODEL_FILE.
+
+        Returns:
+            Model int8 ở chế độ eval, hoặc None nếu chưa có file int8 hoặc file đã cũ
+            so với checkpoint fp32.
+        """
+        quantized_path = os.path.join(model_path, config.QUANTIZED_MODEL_FILE)
+        if not os.path.exists(quantized_path):
+            print(f"Cảnh báo: Không tìm thấy {quantized_path}. Chuyển sang backend PyTorch.")
+            print("Tạo model int8 bằng lệnh: python src/quantize.py")
+            return None
+
+        # File do src/quantize.py tạo ra trên máy cục bộ (chứa packed params, không phải tensor thuần)
+        artifact = torch.load(quantized_path, map_location="cpu", weights_only=False)
+        if artifact.get("checkpoint_signature") != checkpoint_signature(model_path):
+            print(f"Cảnh báo: {quantized_path} đã cũ so với checkpoint fp32. Chuyển sang backend PyTorch.")
+            print("Tạo lại model int8 bằng lệnh: python src/quantize.py")
+            return None
+
+        model = AutoModelForTokenClassification.from_config(AutoConfig.from_pretrained(model_path))
+        model.eval()
+        model = quantize_dynamic_int8(model)
+        model.load_state_dict(artifact["state_dict"])
+        return model
+
+    def _compile_buckets(self) -> None:
+        """
+        Trace model bằng TorchScript cho từng độ dài trong config.COMPILE_LENGTH_BUCKETS và warm-up.
+
+        Mỗi bucket có một đồ thị riêng vì transformers tính một số giá trị phụ thuộc độ dài
+        chuỗi bằng Python lúc trace; trục batch vẫn là động. Chi phí trace và warm-up chỉ
+        trả một lần khi khởi động.
+        """
+        start = time.perf_counter()
+        return_dict = self.model.config.return_dict
+        # Trace với đầu ra dạng tuple; model eager vẫn trả về ModelOutput như cũ
+        self.model.config.return_dict = False
+        try:
+            for bucket in sorted(config.COMPILE_LENGTH_BUCKETS):
+                input_ids = torch.full((1, bucket), self.tokenizer.pad_token_id, dtype=torch.long, device=self.device)
+                input_ids[0, 0] = self.tokenizer.cls_token_id
+                input_ids[0, 1] = self.tokenizer.sep_token_id
+                attention_mask = torch.zeros_like(input_ids)
+                attention_mask[0, :2] = 1
+
+                with torch.no_grad():
+                    traced = torch.jit.trace(self.model, (input_ids, attention_mask), strict=False)
+                    traced = torch.jit.freeze(traced)
+                    # Chạy vài lần để profiling executor tối ưu đồ thị trước khi nhận request
+                    for _ in range(3):
+                        traced(input_ids, attention_mask)
+                self._compiled_models[bucket] = traced
+        finally:
+            self.model.config.return_dict = return_dict
+
+        if self.verbose:
+            print(f"Compiled {len(self._compiled_models)} length buckets {sorted(self._compiled_models)} "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+    def _load_exit_heads(self, model_path: str) -> None:
+        """
+        Tải exit heads và gắn forward hook sau các encoder layer tương ứng.
+
+        Hook chỉ hoạt động khi luồng hiện tại đang chạy _forward() với early exit; khi mọi
+        token thật của batch đạt ngưỡng, hook dừng forward pass bằng ngoại lệ _EarlyExit.
+        """
+        self.exit_heads = EarlyExitHeads.load(model_path, checkpoint_signature(model_path))
+        if self.exit_heads is None:
+            return
+        self.exit_heads.to(self.device)
+
+        encoder_layers = self.model.base_model.encoder.layer
+        for layer in self.exit_heads.exit_layers:
+            if layer < len(encoder_layers):
+                encoder_layers[layer - 1].register_forward_hook(self._make_exit_hook(layer))
+
+        if self.verbose:
+            print(f"Early exit enabled at layers {self.exit_heads.exit_layers} "
+                  f"(threshold {self.early_exit_threshold})")
+
+    def _make_exit_hook(self, layer: int):
+        """Tạo forward hook kiểm tra exit head sau encoder layer `layer`."""
+        def hook(module, inputs, output):
+            token_mask = getattr(self._exit_state, 'token_mask', None)
+            if token_mask is None:
+                return None
+            hidden_states = output[0] if isinstance(output, tuple) else output
+            logits = self.exit_heads(layer, hidden_states)
+            confidence = torch.softmax(logits, dim=-1).max(dim=-1).values
+            if bool((confidence[token_mask] >= self.early_exit_threshold).all()):
+                raise _EarlyExit(logits, layer)
+            return None
+        return hook
+
+    def _bucket_length(self, length: int) -> int:
+        """
+        Độ dài padding của một batch: bucket nhỏ nhất chứa length nếu đang dùng model compiled,
+        ngược lại giữ nguyên length (padding động).
+        """
+        for bucket in sorted(self._compiled_models):
+            if bucket >= length:
+                return bucket
+        return length
+
     def segment_text(self, text: str) -> str:
         """
         Tách từ tiếng Việt sử dụng VnCoreNLP.
@@ -64,7 +397,8 @@ class NERPredictor:
         segmented = self.text_processor.segment_text(text)
         return segmented if segmented is not None else text
 
-    def predict(self, sentence: str, max_length: int = 220, show_debug: bool = False):
+    def predict(self, sentence: str, max_length: int = 220, show_debug: bool = False,
+                min_confidence: float = None, stride: int = None, return_trace: bool = False):
         """
         Dự đoán các thực thể trong một câu. Tự động xử lý văn bản dài hơn giới hạn của model.
 
@@ -72,319 +406,821 @@ class NERPredictor:
             sentence (str): Câu văn bản đầu vào (chưa segment).
             max_length (int): Độ dài tối đa của mỗi chunk (mặc định 220 tokens).
             show_debug (bool): Hiển thị thông tin debug hay không.
+            min_confidence (float): Loại bỏ entity có độ tin cậy trung bình thấp hơn ngưỡng này
+                (mặc định config.MIN_ENTITY_CONFIDENCE).
+            stride (int): Bước trượt giữa các cửa sổ khi chia câu quá dài (mặc định config.WINDOW_STRIDE).
+            return_trace (bool): Trả về thêm InferenceTrace (thời gian từng giai đoạn, số token,
+                số cửa sổ, kích thước batch).
 
         Returns:
-            list: Một danh sách các dictionary, mỗi dictionary chứa thông tin về một thực thể (text, tag, start, end).
+            list: Một danh sách các dictionary, mỗi dictionary chứa thông tin về một thực thể
+            (text, tag, start, end, confidence, min_confidence). Nếu return_trace=True,
+            trả về tuple (entities, trace).
         """
+        trace = InferenceTrace(num_texts=1)
         if not self.model:
             print("Model chưa được tải. Không thể dự đoán.")
-            return []
-        
-        # KIỂM TRA VĂN BẢN ĐẦU VÀO
-        print(f"\n{'='*80}")
-        print(f" VĂN BẢN ĐẦU VÀO:")
-        print(f"   - Độ dài: {len(sentence)} ký tự")
-        print(f"   - Số từ: {len(sentence.split())} từ")
-        print(f"   - 100 ký tự đầu: {sentence[:100]}...")
-        print(f"   - 100 ký tự cuối: ...{sentence[-100:]}")
-        print(f"{'='*80}\n")
-        
-        # Lưu văn bản gốc (chưa segment) để tìm vị trí entities
-        original_text = sentence
-        
-        # Áp dụng word segmentation nếu được bật
-        if self.use_word_segmentation:
-            if show_debug:
-                print(f" Original text: {sentence[:100]}...")
-            sentence_segmented = self.segment_text(sentence)
-            if show_debug:
-                print(f" Segmented text: {sentence_segmented[:100]}...")
-        else:
-            sentence_segmented = sentence
+            return ([], trace) if return_trace else []
 
-        # Kiểm tra độ dài văn bản
-        tokens = self.tokenizer.tokenize(sentence_segmented)
-        
-        print(f"\n Thông tin xử lý:")
-        print(f"   - Độ dài văn bản gốc: {len(original_text)} ký tự")
-        print(f"   - Độ dài văn bản đã segment: {len(sentence_segmented)} ký tự")
-        print(f"   - Số tokens: {len(tokens)}")
-        print(f"   - Max length: {max_length}")
-        
-        if len(tokens) <= max_length:
-            # Văn bản ngắn - predict trực tiếp
-            print(f"    Xử lý trực tiếp (văn bản ngắn)")
-            return self._predict_single(sentence_segmented, show_debug=show_debug, 
-                                       original_text=original_text, text_offset=0)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+        cache_key = self._cache_key(sentence, max_length, stride)
+        cached = self.result_cache.get(cache_key) if self.result_cache is not None else None
+        if cached is not None:
+            if self.verbose:
+                print(f" Cache hit: trả kết quả đã lưu ({len(cached)} entities).")
+            trace.cache_hits = 1
+            entities = self._filter_by_confidence(cached, min_confidence)
+            trace.total_wall = time.perf_counter() - wall_start
+            trace.total_cpu = time.process_time() - cpu_start
+            return (entities, trace) if return_trace else entities
+
+        if self._uses_sentence_cache(sentence):
+            # Văn bản dài, cache theo câu: chỉ các câu chưa gặp mới được tách từ và chạy model
+            entities = self._predict_sentences([sentence], max_length, stride=stride,
+                                               show_debug=show_debug, trace=trace)[0]
         else:
-            # Văn bản dài - chia nhỏ và predict
-            print(f"     Chia thành chunks (văn bản dài: {len(tokens)} > {max_length} tokens)")
-            return self._predict_long_text(sentence_segmented, max_length, show_debug=show_debug,
-                                          original_text=original_text)
+            # KIỂM TRA VĂN BẢN ĐẦU VÀO
+            if self.verbose:
+                print(f"\n{'='*80}")
+                print(f" VĂN BẢN ĐẦU VÀO:")
+                print(f"   - Độ dài: {len(sentence)} ký tự")
+                print(f"   - Số từ: {len(sentence.split())} từ")
+                print(f"   - 100 ký tự đầu: {sentence[:100]}...")
+                print(f"   - 100 ký tự cuối: ...{sentence[-100:]}")
+                print(f"{'='*80}\n")
+
+            # Tách từ, token hóa và lập bản đồ vị trí về văn bản gốc (chưa segment)
+            document = self._encode_document(sentence, trace=trace)
+            if show_debug and self.use_word_segmentation:
+                print(f" Original text: {sentence[:100]}...")
+                print(f" Segmented text: {document.segmented_text[:100]}...")
+
+            if self.verbose:
+                print(f"\n Thông tin xử lý:")
+                print(f"   - Độ dài văn bản gốc: {len(document.text)} ký tự")
+                print(f"   - Độ dài văn bản đã segment: {len(document.segmented_text)} ký tự")
+                print(f"   - Số tokens: {len(document)}")
+                print(f"   - Max length: {max_length}")
+
+                if len(document) <= max_length:
+                    # Văn bản ngắn - predict trực tiếp
+                    print(f"    Xử lý trực tiếp (văn bản ngắn)")
+                else:
+                    # Văn bản dài - chia thành các cửa sổ, ghép logits rồi giải mã một lần
+                    print(f"     Chia thành chunks (văn bản dài: {len(document)} > {max_length} tokens)")
+
+            entities = self._predict_documents([document], max_length, stride=stride,
+                                               show_debug=show_debug, trace=trace)[0]
+
+            if self.verbose and len(document) > max_length:
+                print(f" Completed! Found {len(entities)} entities.\n")
 
-    def _predict_single(self, sentence: str, show_debug: bool = False, original_text: str = None, text_offset: int = 0):
+        if self.result_cache is not None:
+            self.result_cache.put(cache_key, entities)
+
+        entities = self._filter_by_confidence(entities, min_confidence)
+        trace.total_wall = time.perf_counter() - wall_start
+        trace.total_cpu = time.process_time() - cpu_start
+        return (entities, trace) if return_trace else entities
+
+    def predict_batch(self, texts: List[str], max_length: int = 220, batch_size: int = None,
+                      show_debug: bool = False, min_confidence: float = None,
+                      stride: int = None, return_trace: bool = False):
         """
-        Dự đoán các thực thể cho văn bản ngắn (≤ max_length tokens).
+        Dự đoán thực thể cho nhiều văn bản cùng lúc.
+
+        Các văn bản được token hóa rồi gom vào các batch (sắp xếp theo độ dài,
+        padding động) để chạy model một lần cho nhiều văn bản. Văn bản dài hơn
+        max_length được chia cửa sổ như predict() và các cửa sổ được gom chung batch.
 
         Args:
-            sentence (str): Câu văn bản đầu vào.
+            texts (List[str]): Danh sách văn bản đầu vào (chưa segment).
+            max_length (int): Độ dài tối đa của mỗi chunk (mặc định 220 tokens).
+            batch_size (int): Số chuỗi mỗi batch (mặc định config.INFERENCE_BATCH_SIZE).
             show_debug (bool): Hiển thị thông tin debug hay không.
-            original_text (str): Văn bản gốc để tìm vị trí chính xác (cho văn bản dài).
-            text_offset (int): Offset của sentence trong original_text.
+            min_confidence (float): Ngưỡng độ tin cậy tối thiểu của entity (như predict()).
+            stride (int): Bước trượt giữa các cửa sổ khi chia câu quá dài (như predict()).
+            return_trace (bool): Trả về thêm InferenceTrace cho cả lượt dự đoán.
 
         Returns:
-            list: Danh sách các entity với thông tin text, tag, start, end.
-        """
-        # 1. Tokenization - KHÔNG TRUNCATE để tránh mất dữ liệu
-        encoding = self.tokenizer(
-            sentence, 
-            return_tensors="pt",
-            truncation=False,  # QUAN TRỌNG: Không cắt văn bản
-            padding=False
-        )
-        input_ids = encoding["input_ids"].to(self.device)
-        attention_mask = encoding["attention_mask"].to(self.device)
-        
-        # Kiểm tra độ dài và cảnh báo nếu quá dài
-        actual_length = input_ids.shape[1]
-        if actual_length > 256:
-            print(f"\n  CẢNH BÁO: Sentence có {actual_length} tokens, vượt quá max_length của model (256)!")
-            print(f"   Đang CẮT BỎ phần còn lại. Hãy dùng _predict_long_text() thay thế!")
-            # Truncate thủ công
-            input_ids = input_ids[:, :256]
-            attention_mask = attention_mask[:, :256]
-
-        # 2. Inference
-        with torch.no_grad():
-            outputs = self.model(input_ids, attention_mask=attention_mask)
-            logits = outputs.logits
+            List[List[Dict]]: Danh sách entity cho từng văn bản, cùng định dạng và
+            cùng thứ tự với kết quả của predict(). Nếu return_trace=True, trả về
+            tuple (results, trace).
+        """
+        trace = InferenceTrace(num_texts=len(texts))
+        if not self.model:
+            print("Model chưa được tải. Không thể dự đoán.")
+            results = [[] for _ in texts]
+            return (results, trace) if return_trace else results
 
-        predictions = torch.argmax(logits, dim=2)[0].cpu().numpy()
-        
-        # Lấy các token và dự đoán tương ứng
-        tokens = self.tokenizer.convert_ids_to_tokens(input_ids[0].cpu().numpy())
-        predicted_tags = [self.ids_to_tags[p] for p in predictions]
-        
-        # Debug: In ra tokens và predicted tags để kiểm tra
-        if show_debug:
-            print("\n=== DEBUG INFO ===")
-            print(f"Sentence: {sentence}")
-            print(f"Number of tokens: {len(tokens)}")
-            print("Tokens and Tags:")
-            for i, (token, tag) in enumerate(zip(tokens, predicted_tags)):
-                print(f"  {i}: '{token}' -> {tag}")
-            print("==================\n")
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
 
-        # 3. Post-processing: Nhóm các sub-word token thành thực thể hoàn chỉnh
-        # Xử lý đúng với PhoBERT BPE tokenizer (@@)
-        entities = []
-        current_entity_tokens = []
-        current_entity_token_indices = []  # Lưu vị trí của các token
-        current_entity_tag = ""
-
-        def merge_tokens_to_text(token_list):
-            """
-            Ghép các BPE tokens thành text gốc sử dụng tokenizer.
-            Đây là cách ĐÚNG để xử lý PhoBERT tokens.
-            """
-            if not token_list:
-                return ""
-            
-            # Sử dụng tokenizer để convert chính xác
-            # Tạo một chuỗi giả để tokenizer xử lý
-            text = self.tokenizer.convert_tokens_to_string(token_list)
-            
-            return text.strip()
+        # Lấy kết quả đã lưu trong cache; các văn bản trùng nhau trong batch chỉ chạy model một lần
+        results = [[] for _ in texts]
+        pending = {}  # khóa cache -> chỉ số các văn bản cần chạy model
+        for doc_index, text in enumerate(texts):
+            if not text:
+                continue
+            cache_key = self._cache_key(text, max_length, stride)
+            cached = None
+            if self.result_cache is not None and cache_key not in pending:
+                cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                trace.cache_hits += 1
+                results[doc_index] = self._filter_by_confidence(cached, min_confidence)
+            else:
+                pending.setdefault(cache_key, []).append(doc_index)
 
-        # Bỏ qua token [CLS] ở đầu và [SEP] ở cuối
-        for i in range(1, len(predicted_tags) - 1):
-            token = tokens[i]
-            tag = predicted_tags[i]
-            
-            # Kiểm tra xem token hiện tại có phải là phần tiếp theo của BPE không
-            # PhoBERT BPE: token trước kết thúc bằng @@ thì token hiện tại là phần tiếp theo
-            is_bpe_continuation = (i > 1 and tokens[i-1].endswith("@@"))
-
-            if tag.startswith("B-"):
-                # TRƯỜNG HỢP ĐẶC BIỆT: Nếu token này là phần tiếp theo của BPE 
-                # và đang có entity, thì ưu tiên merge vào entity hiện tại
-                if is_bpe_continuation and current_entity_tokens:
-                    current_entity_tokens.append(token)
-                    current_entity_token_indices.append(i)
-                    if show_debug:
-                        print(f"  [BPE-FIX] Merged '{token}' (B-{tag[2:]}) into current entity '{current_entity_tag}' due to BPE continuation")
-                else:
-                    # Nếu đang có một thực thể, lưu nó lại trước khi bắt đầu thực thể mới
-                    if current_entity_tokens:
-                        entity_text = merge_tokens_to_text(current_entity_tokens)
-                        if entity_text:
-                            entities.append({
-                                "text": entity_text, 
-                                "tag": current_entity_tag,
-                                "token_indices": current_entity_token_indices.copy()
-                            })
-                    
-                    # Bắt đầu một thực thể mới
-                    current_entity_tokens = [token]
-                    current_entity_token_indices = [i]
-                    current_entity_tag = tag[2:]  # Lấy tên tag (ví dụ: LOCATION từ B-LOCATION)
-            
-            elif tag.startswith("I-"):
-                # TRƯỜNG HỢP 1: Khớp với tag hiện tại
-                if current_entity_tag == tag[2:]:
-                    current_entity_tokens.append(token)
-                    current_entity_token_indices.append(i)
-                # TRƯỜNG HỢP 2: Token này là phần tiếp theo của BPE
-                elif is_bpe_continuation and current_entity_tokens:
-                    # Thêm vào entity hiện tại ngay cả khi tag không khớp (sửa lỗi mô hình)
-                    current_entity_tokens.append(token)
-                    current_entity_token_indices.append(i)
-                    if show_debug:
-                        print(f"  [BPE-FIX] Merged '{token}' (I-{tag[2:]}) into current entity '{current_entity_tag}' due to BPE continuation")
+        document_entities = self._predict_texts([texts[doc_indices[0]] for doc_indices in pending.values()],
+                                                max_length, stride=stride, batch_size=batch_size,
+                                                show_debug=show_debug, trace=trace)
+
+        for (cache_key, doc_indices), entities in zip(pending.items(), document_entities):
+            if self.result_cache is not None:
+                self.result_cache.put(cache_key, entities)
+            for i, doc_index in enumerate(doc_indices):
+                copies = entities if i == 0 else [dict(entity) for entity in entities]
+                results[doc_index] = self._filter_by_confidence(copies, min_confidence)
+
+        if self.verbose:
+            print(f" Batch completed: {len(texts)} văn bản ({trace.cache_hits} lấy từ cache, "
+                  f"{trace.num_windows} cửa sổ).")
+
+        trace.total_wall = time.perf_counter() - wall_start
+        trace.total_cpu = time.process_time() - cpu_start
+        return (results, trace) if return_trace else results
+
+    def predict_iter(self, text: str, max_length: int = 220, batch_size: int = None,
+                     min_confidence: float = None, stride: int = None,
+                     trace: InferenceTrace = None) -> Iterator[Tuple[List[Dict[str, any]], int]]:
+        """
+        Dự đoán thực thể của một văn bản dài theo từng khối, trả kết quả dần dần.
+
+        Văn bản được chia thành các khối gồm các câu liên tiếp (khoảng config.STREAM_BLOCK_CHARS
+        ký tự). Mỗi khối được tách từ, chạy model và giải mã xong thì entity của khối được yield
+        ngay, với vị trí tính trên văn bản gốc. Vì ranh giới khối trùng ranh giới câu, kết quả
+        ghép lại gần như giống predict() (chỉ khác cách gom câu vào cửa sổ ở ranh giới khối),
+        nên được cache với khóa riêng, không dùng lẫn với kết quả của predict().
+
+        Args:
+            text (str): Văn bản đầu vào (chưa segment).
+            max_length (int): Độ dài tối đa của mỗi chunk (mặc định 220 tokens).
+            batch_size (int): Số chuỗi mỗi batch (mặc định config.INFERENCE_BATCH_SIZE).
+            min_confidence (float): Ngưỡng độ tin cậy tối thiểu của entity (như predict()).
+            stride (int): Bước trượt giữa các cửa sổ khi chia câu quá dài (như predict()).
+            trace (InferenceTrace): Trace được cập nhật dần sau mỗi khối (tùy chọn).
+
+        Yields:
+            Tuple[List[Dict], int]: Entity của từng khối theo thứ tự trong văn bản (có thể rỗng,
+            cùng định dạng với kết quả của predict()) và vị trí ký tự đã xử lý tới.
+        """
+        trace = trace if trace is not None else InferenceTrace()
+        trace.num_texts += 1
+        if not self.model:
+            print("Model chưa được tải. Không thể dự đoán.")
+            return
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        cache_key = self._cache_key(text, max_length, stride, scope=f"stream:{config.STREAM_BLOCK_CHARS}")
+        cached = self.result_cache.get(cache_key) if self.result_cache is not None else None
+        if cached is not None:
+            trace.cache_hits += 1
+            yield self._filter_by_confidence(cached, min_confidence), len(text)
+            return
+
+        # Gom các câu liên tiếp thành khối
+        blocks = []
+        for start, end in split_sentences(text):
+            if blocks and end - blocks[-1][0] <= config.STREAM_BLOCK_CHARS:
+                blocks[-1] = (blocks[-1][0], end)
+            else:
+                blocks.append((start, end))
+
+        all_entities = []
+        for block_start, block_end in blocks:
+            entities = self._predict_texts([text[block_start:block_end]], max_length, stride=stride,
+                                           batch_size=batch_size, trace=trace)[0]
+            for entity in entities:
+                entity['start'] += block_start
+                entity['end'] += block_start
+            all_entities.extend(entities)
+            trace.total_wall += time.perf_counter() - wall_start
+            trace.total_cpu += time.process_time() - cpu_start
+            yield self._filter_by_confidence([dict(entity) for entity in entities], min_confidence), block_end
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+        if self.result_cache is not None:
+            self.result_cache.put(cache_key, all_entities)
+
+    def _predict_texts(self, texts: List[str], max_length: int, stride: int = None, batch_size: int = None,
+                       show_debug: bool = False, trace: InferenceTrace = None) -> List[List[Dict[str, any]]]:
+        """
+        Tách từ, token hóa và dự đoán entity cho các văn bản (văn bản dài theo câu nếu bật self.sentence_cache).
+
+        Returns:
+            List[List[Dict]]: Danh sách entity (chưa lọc theo độ tin cậy) của từng văn bản.
+        """
+        long_indices = [i for i, text in enumerate(texts) if self._uses_sentence_cache(text)]
+        results = [None] * len(texts)
+        if long_indices:
+            for i, entities in zip(long_indices, self._predict_sentences(
+                    [texts[i] for i in long_indices], max_length, stride=stride, batch_size=batch_size,
+                    show_debug=show_debug, trace=trace)):
+                results[i] = entities
+
+        short_indices = [i for i, entities in enumerate(results) if entities is None]
+        documents = [self._encode_document(texts[i], trace=trace) for i in short_indices]
+        for i, entities in zip(short_indices, self._predict_documents(documents, max_length, stride=stride,
+                                                                      batch_size=batch_size, show_debug=show_debug,
+                                                                      trace=trace)):
+            results[i] = entities
+        return results
+
+    def _uses_sentence_cache(self, text: str) -> bool:
+        """
+        Văn bản có đi qua cache theo câu không: chỉ văn bản dài (từ config.SENTENCE_CACHE_MIN_CHARS ký tự,
+        vốn được chia thành nhiều cửa sổ theo ranh giới câu); văn bản ngắn giữ ngữ cảnh của cả văn bản.
+        """
+        return self.sentence_cache is not None and len(text) >= config.SENTENCE_CACHE_MIN_CHARS
+
+    def _cache_key(self, text: str, max_length: int, stride: int = None, scope: str = "document") -> str:
+        """Khóa cache của một văn bản (scope "document"), một câu ("sentence") hoặc kết quả theo khối của predict_iter ("stream:...")."""
+        stride = config.WINDOW_STRIDE if stride is None else stride
+        return make_cache_key(text, scope, self._model_identity, self.use_word_segmentation, max_length, stride)
+
+    def _predict_sentences(self, texts: List[str], max_length: int, stride: int = None,
+                           batch_size: int = None, show_debug: bool = False,
+                           trace: InferenceTrace = None) -> List[List[Dict[str, any]]]:
+        """
+        Dự đoán entity theo từng câu, dùng lại kết quả của các câu đã gặp (self.sentence_cache).
+
+        Các câu mẫu lặp lại giữa các bản tin (tiêu đề, câu thông báo ca bệnh...) lấy entity
+        đã lưu và dời vị trí theo offset của câu trong văn bản mới. Chỉ các câu chưa gặp
+        mới được tách từ (VnCoreNLP) và chạy model, gom chung batch cho mọi văn bản.
+        Mỗi câu được dự đoán độc lập, không có ngữ cảnh của các câu xung quanh.
+
+        Args:
+            texts (List[str]): Các văn bản gốc (chưa segment).
+            max_length (int): Độ dài tối đa của mỗi cửa sổ (câu dài hơn được chia cửa sổ).
+            stride (int): Bước trượt giữa các cửa sổ của câu quá dài.
+            batch_size (int): Số chuỗi mỗi batch (mặc định config.INFERENCE_BATCH_SIZE).
+            show_debug (bool): Hiển thị thông tin debug hay không.
+            trace (InferenceTrace): Trace để ghi thời gian và số liệu (tùy chọn).
+
+        Returns:
+            List[List[Dict]]: Danh sách entity của từng văn bản, vị trí tính trên văn bản gốc.
+        """
+        trace = trace if trace is not None else InferenceTrace()
+
+        # Kết quả theo câu: khóa -> entities (vị trí tính từ đầu câu)
+        sentence_entities = {}
+        novel = {}  # khóa -> nội dung câu chưa có trong cache
+        text_sentences = []
+        for text in texts:
+            sentences = []
+            for start, end in split_sentences(text):
+                key = self._cache_key(text[start:end], max_length, stride, scope="sentence")
+                sentences.append((key, start))
+                if key in sentence_entities or key in novel:
+                    continue
+                cached = self.sentence_cache.get(key)
+                if cached is not None:
+                    trace.sentence_hits += 1
+                    sentence_entities[key] = cached
                 else:
-                    # Tag không khớp và không phải phần tiếp theo, lưu entity cũ
-                    if current_entity_tokens:
-                        entity_text = merge_tokens_to_text(current_entity_tokens)
-                        if entity_text:
-                            entities.append({
-                                "text": entity_text, 
-                                "tag": current_entity_tag,
-                                "token_indices": current_entity_token_indices.copy()
-                            })
-                    # Bắt đầu entity mới với tag I- này (xử lý trường hợp thiếu B-)
-                    current_entity_tokens = [token]
-                    current_entity_token_indices = [i]
-                    current_entity_tag = tag[2:]
-            
-            else: # Tag là 'O'
-                # TRƯỜNG HỢP ĐẶC BIỆT: Nếu token này là phần tiếp theo của BPE và đang trong entity
-                # thì ưu tiên merge vào entity (vì model có thể tag sai)
-                if is_bpe_continuation and current_entity_tokens:
-                    current_entity_tokens.append(token)
-                    current_entity_token_indices.append(i)
-                    if show_debug:
-                        print(f"  [BPE-FIX] Merged '{token}' (O) into current entity '{current_entity_tag}' due to BPE continuation")
+                    novel[key] = text[start:end]
+            text_sentences.append(sentences)
+
+        if self.verbose:
+            total = sum(len(sentences) for sentences in text_sentences)
+            print(f"    Cache theo câu: {total} câu, {len(novel)} câu mới cần chạy model")
+
+        documents = [self._encode_document(sentence, trace=trace) for sentence in novel.values()]
+        for key, entities in zip(novel, self._predict_documents(documents, max_length, stride=stride,
+                                                                batch_size=batch_size, show_debug=show_debug,
+                                                                trace=trace)):
+            self.sentence_cache.put(key, entities)
+            sentence_entities[key] = entities
+
+        results = []
+        for sentences in text_sentences:
+            entities = []
+            for key, offset in sentences:
+                for entity in sentence_entities[key]:
+                    entity = dict(entity)
+                    entity['start'] += offset
+                    entity['end'] += offset
+                    entities.append(entity)
+            results.append(entities)
+        return results
+
+    @staticmethod
+    def _filter_by_confidence(entities: List[Dict[str, any]], min_confidence: float = None) -> List[Dict[str, any]]:
+        """
+        Loại bỏ các entity có độ tin cậy trung bình thấp hơn ngưỡng.
+
+        Args:
+            entities (list): Danh sách entity có trường 'confidence'.
+            min_confidence (float): Ngưỡng tối thiểu (mặc định config.MIN_ENTITY_CONFIDENCE).
+
+        Returns:
+            list: Danh sách entity đạt ngưỡng.
+        """
+        if min_confidence is None:
+            min_confidence = config.MIN_ENTITY_CONFIDENCE
+        if min_confidence <= 0:
+            return entities
+        return [entity for entity in entities if entity.get('confidence', 1.0) >= min_confidence]
+
+    def _predict_documents(self, documents: List[EncodedDocument], max_length: int, stride: int = None,
+                           batch_size: int = None, show_debug: bool = False,
+                           trace: InferenceTrace = None) -> List[List[Dict[str, any]]]:
+        """
+        Chạy model trên các cửa sổ token của nhiều văn bản và giải mã entity cho từng văn bản.
+
+        Văn bản ngắn là một cửa sổ duy nhất, văn bản dài được chia bằng _plan_long_text().
+        Cửa sổ của mọi văn bản chạy chung các batch có padding; logits của từng văn bản được
+        ghép lại theo chỉ số token (xem _fuse_window_logits()) rồi giải mã BIO một lần trên
+        chuỗi đã ghép, nên entity ở vùng chồng lấn không bị dự đoán hai lần.
+
+        Args:
+            documents (List[EncodedDocument]): Các văn bản đã token hóa kèm bản đồ vị trí.
+            max_length (int): Độ dài tối đa của mỗi cửa sổ.
+            stride (int): Bước trượt giữa các cửa sổ khi chia câu quá dài.
+            batch_size (int): Số chuỗi mỗi batch (mặc định config.INFERENCE_BATCH_SIZE).
+            show_debug (bool): Hiển thị thông tin debug hay không.
+            trace (InferenceTrace): Trace để ghi thời gian và số liệu (tùy chọn).
+
+        Returns:
+            List[List[Dict]]: Danh sách entity của từng văn bản (cùng thứ tự với documents).
+        """
+        trace = trace if trace is not None else InferenceTrace()
+
+        with trace.stage('windowing'):
+            windows = []  # (vị trí trong documents, token_start, token_end)
+            for doc_index, document in enumerate(documents):
+                if len(document) <= max_length:
+                    windows.append((doc_index, 0, len(document)))
                 else:
-                    # Nếu đang có một thực thể, lưu nó lại
-                    if current_entity_tokens:
-                        entity_text = merge_tokens_to_text(current_entity_tokens)
-                        if entity_text:
-                            entities.append({
-                                "text": entity_text, 
-                                "tag": current_entity_tag,
-                                "token_indices": current_entity_token_indices.copy()
-                            })
-                    
-                    # Reset
-                    current_entity_tokens = []
-                    current_entity_token_indices = []
-                    current_entity_tag = ""
-        
-        # Lưu lại thực thể cuối cùng nếu nó kéo dài đến hết câu
-        if current_entity_tokens:
-            entity_text = merge_tokens_to_text(current_entity_tokens)
-            if entity_text:
-                entities.append({
-                    "text": entity_text, 
-                    "tag": current_entity_tag,
-                    "token_indices": current_entity_token_indices.copy()
-                })
+                    for window in self._plan_long_text(document, max_length, stride=stride, show_debug=show_debug):
+                        windows.append((doc_index, window['token_start'], window['token_end']))
 
-        # Thêm thông tin vị trí (start, end) cho mỗi entity bằng cách tìm trong câu gốc
-        entities_with_positions = []
-        used_positions = []  # Theo dõi vị trí đã sử dụng để tránh trùng lặp
-        
-        # Xác định text để search
-        search_text = original_text if original_text else sentence
-        base_offset = text_offset if original_text else 0
-        
-        for entity in entities:
-            entity_text = entity["text"]
-            entity_tag = entity["tag"]
-            
-            # Convert entity_text từ dạng segmented về dạng original
-            # Ví dụ: "Trung_tâm" -> "Trung tâm"
-            entity_text_original = entity_text.replace('_', ' ')
-            
-            # Chiến lược tìm kiếm entity trong text gốc:
-            # 1. Tìm trong vùng hiện tại (sentence) với offset
-            # 2. Mở rộng vùng tìm kiếm nếu không thấy
-            
-            # Bước 1: Tìm trong vùng gần text_offset (ưu tiên)
-            search_start = max(0, base_offset)
-            search_end = min(len(search_text), base_offset + len(sentence) + 100)
-            search_region = search_text[search_start:search_end]
-            
-            found = False
-            # Tìm tất cả các vị trí xuất hiện của entity_text_original trong search_region
-            search_pos = 0
-            while True:
-                pos = search_region.find(entity_text_original, search_pos)
-                if pos == -1:
-                    break
-                
-                # Tính vị trí tuyệt đối
-                absolute_pos = search_start + pos
-                absolute_end = absolute_pos + len(entity_text_original)
-                
-                # Kiểm tra xem vị trí này đã được sử dụng chưa
-                is_used = any(absolute_pos < used_end and absolute_end > used_start 
-                             for used_start, used_end in used_positions)
-                
-                if not is_used:
-                    entities_with_positions.append({
-                        "text": entity_text_original,  # Sử dụng text gốc (không có _)
-                        "tag": entity_tag,
-                        "start": absolute_pos,
-                        "end": absolute_end
+            encoded_windows = [self._build_model_input(documents[doc_index], token_start, token_end)
+                               for doc_index, token_start, token_end in windows]
+        trace.num_windows += len(windows)
+
+        window_logits = self._run_model_batched(encoded_windows, batch_size=batch_size, trace=trace)
+
+        with trace.stage('fusion'):
+            document_windows = [[] for _ in documents]
+            for (doc_index, token_start, _), logits in zip(windows, window_logits):
+                document_windows[doc_index].append((token_start, logits))
+
+            fused_outputs = [self._logits_to_outputs(self._fuse_window_logits(document, parts))
+                             for document, parts in zip(documents, document_windows)]
+        return self._decode_windows([(document, 0) for document in documents], fused_outputs,
+                                    show_debug=show_debug, trace=trace)
+
+    def _encode_document(self, text: str, trace: InferenceTrace = None) -> EncodedDocument:
+        """
+        Tách từ và token hóa văn bản, đồng thời ánh xạ từng subword về văn bản gốc.
+
+        Mỗi từ (sau khi segment) được căn về vị trí của nó trong văn bản gốc bằng một
+        lượt quét tuyến tính, sau đó được token hóa riêng. Vì BPE của PhoBERT tách theo
+        khoảng trắng, ghép token của từng từ cho kết quả giống token hóa cả văn bản.
+
+        Args:
+            text (str): Văn bản gốc (chưa segment).
+            trace (InferenceTrace): Trace để ghi thời gian và số liệu (tùy chọn).
+
+        Returns:
+            EncodedDocument: Văn bản đã token hóa kèm vị trí ký tự của từng token.
+        """
+        trace = trace if trace is not None else InferenceTrace()
+
+        with trace.stage('segmentation'):
+            segmented = self.segment_text(text) if self.use_word_segmentation else text
+
+        with trace.stage('tokenization'), self._tokenizer_lock:
+            tokens = []
+            token_starts = []
+            token_ends = []
+            cursor = 0
+            for word in segmented.split():
+                char_map, cursor = self._align_word(text, word, cursor)
+                pieces = self.tokenizer.tokenize(word)
+
+                for piece, (piece_start, piece_end) in zip(pieces, self._piece_spans(word, pieces)):
+                    tokens.append(piece)
+                    token_starts.append(char_map[piece_start])
+                    token_ends.append(char_map[piece_end - 1] + 1)
+
+            document = EncodedDocument(
+                text=text,
+                segmented_text=segmented,
+                tokens=tokens,
+                token_ids=self.tokenizer.convert_tokens_to_ids(tokens),
+                token_starts=np.array(token_starts, dtype=np.int64),
+                token_ends=np.array(token_ends, dtype=np.int64),
+                open_pieces=np.array([token.endswith("@@") for token in tokens], dtype=bool)
+            )
+
+        trace.num_tokens += len(document)
+        return document
+
+    @staticmethod
+    def _align_word(text: str, word: str, cursor: int) -> Tuple[List[int], int]:
+        """
+        Căn một từ đã segment về vị trí các ký tự của nó trong văn bản gốc.
+
+        Dấu '_' do VnCoreNLP thêm vào được khớp với khoảng trắng giữa các âm tiết.
+        Nếu VnCoreNLP đã chuẩn hóa ký tự khiến không khớp từng ký tự, thử tìm từ
+        trong một vùng lân cận; nếu vẫn thất bại thì ước lượng từ vị trí hiện tại.
+
+        Args:
+            text (str): Văn bản gốc.
+            word (str): Từ đã segment (ví dụ: "Bệnh_viện").
+            cursor (int): Vị trí bắt đầu quét trong văn bản gốc.
+
+        Returns:
+            Tuple[List[int], int]: Vị trí trong văn bản gốc của từng ký tự của từ,
+            và vị trí quét tiếp theo.
+        """
+        text_length = len(text)
+        position = cursor
+        while position < text_length and text[position].isspace():
+            position += 1
+        word_start = position
+
+        char_map = []
+        for char in word:
+            if position < text_length and text[position] == char:
+                char_map.append(position)
+                position += 1
+            elif char == '_' and position < text_length and text[position].isspace():
+                char_map.append(position)
+                while position < text_length and text[position].isspace():
+                    position += 1
+            else:
+                break
+        else:
+            return char_map, position
+
+        # Không khớp từng ký tự: tìm dạng có khoảng trắng của từ ở vùng lân cận
+        surface = word.replace('_', ' ')
+        found = text.find(surface, cursor, word_start + len(surface) + config.ALIGNMENT_LOOKAHEAD)
+        if found != -1:
+            return list(range(found, found + len(surface))), found + len(surface)
+
+        last_index = max(text_length - 1, 0)
+        char_map = [min(word_start + i, last_index) for i in range(len(word))]
+        return char_map, min(word_start + len(word), text_length)
+
+    @staticmethod
+    def _piece_spans(word: str, pieces: List[str]) -> List[Tuple[int, int]]:
+        """
+        Tính khoảng ký tự [start, end) trong từ cho từng BPE piece.
+
+        Args:
+            word (str): Từ đã segment.
+            pieces (List[str]): Các BPE piece của từ (piece chưa kết thúc có hậu tố "@@").
+
+        Returns:
+            List[Tuple[int, int]]: Khoảng ký tự của từng piece. Nếu độ dài các piece
+            không khớp với từ, mọi piece nhận khoảng của cả từ.
+        """
+        lengths = [len(piece) - 2 if piece.endswith("@@") else len(piece) for piece in pieces]
+        if sum(lengths) != len(word) or min(lengths, default=1) <= 0:
+            return [(0, len(word))] * len(pieces)
+
+        spans = []
+        piece_start = 0
+        for length in lengths:
+            spans.append((piece_start, piece_start + length))
+            piece_start += length
+        return spans
+
+    def _build_model_input(self, document: EncodedDocument, token_start: int, token_end: int) -> List[int]:
+        """
+        Tạo input_ids (có [CLS] và [SEP]) cho một cửa sổ token của văn bản.
+
+        Args:
+            document (EncodedDocument): Văn bản đã token hóa.
+            token_start (int): Chỉ số token bắt đầu của cửa sổ.
+            token_end (int): Chỉ số token kết thúc (không bao gồm) của cửa sổ.
+
+        Returns:
+            List[int]: Danh sách input_ids, đã cắt về giới hạn của model nếu quá dài.
+        """
+        input_ids = ([self.tokenizer.cls_token_id] + document.token_ids[token_start:token_end]
+                     + [self.tokenizer.sep_token_id])
+
+        actual_length = len(input_ids)
+        if actual_length > config.MAX_LEN:
+            print(f"\n  CẢNH BÁO: Cửa sổ có {actual_length} tokens, vượt quá max_length của model ({config.MAX_LEN})!")
+            print(f"   Đang CẮT BỎ phần còn lại. Hãy giảm max_length!")
+            input_ids = input_ids[:config.MAX_LEN - 1] + [self.tokenizer.sep_token_id]
+        return input_ids
+
+    def _run_model_batched(self, encoded_inputs: List[List[int]], batch_size: int = None,
+                           trace: InferenceTrace = None) -> List[np.ndarray]:
+        """
+        Chạy model trên nhiều chuỗi input_ids theo batch với padding động.
+
+        Các chuỗi được sắp xếp theo độ dài trước khi chia batch để mỗi batch chỉ
+        padding tới độ dài lớn nhất của chính nó, giảm lượng tính toán thừa. Ở chế độ
+        compiled, độ dài này được làm tròn lên bucket gần nhất (xem _bucket_length()).
+
+        Args:
+            encoded_inputs (List[List[int]]): Các chuỗi input_ids (đã có [CLS]/[SEP]).
+            batch_size (int): Số chuỗi mỗi batch (mặc định config.INFERENCE_BATCH_SIZE).
+            trace (InferenceTrace): Trace để ghi thời gian và kích thước batch (tùy chọn).
+
+        Returns:
+            List[np.ndarray]: Logits (số token x số nhãn) của từng chuỗi, đúng thứ tự đầu vào.
+        """
+        batch_size = batch_size or config.INFERENCE_BATCH_SIZE
+        trace = trace if trace is not None else InferenceTrace()
+        order = sorted(range(len(encoded_inputs)), key=lambda i: len(encoded_inputs[i]))
+        results = [None] * len(encoded_inputs)
+        pad_token_id = self.tokenizer.pad_token_id
+
+        for batch_start in range(0, len(order), batch_size):
+            batch_indices = order[batch_start:batch_start + batch_size]
+            batch_max_len = self._bucket_length(max(len(encoded_inputs[i]) for i in batch_indices))
+            trace.batch_sizes.append(len(batch_indices))
+            trace.batch_lengths.append(batch_max_len)
+
+            input_ids = np.full((len(batch_indices), batch_max_len), pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(batch_indices), batch_max_len), dtype=np.int64)
+            for row, i in enumerate(batch_indices):
+                length = len(encoded_inputs[i])
+                input_ids[row, :length] = encoded_inputs[i]
+                attention_mask[row, :length] = 1
+
+            with trace.stage('forward'):
+                logits = self._forward(input_ids, attention_mask, trace=trace)
+
+            for row, i in enumerate(batch_indices):
+                results[i] = logits[row, :len(encoded_inputs[i])]
+
+        return results
+
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray,
+                 trace: InferenceTrace = None) -> np.ndarray:
+        """
+        Chạy một batch đã padding qua backend đang dùng.
+
+        Nếu early exit được bật, batch dừng ở exit head đầu tiên mà mọi token thật của
+        mọi chuỗi trong batch đều đạt ngưỡng độ tin cậy.
+
+        Args:
+            input_ids (np.ndarray): Ma trận input_ids (batch x độ dài), kiểu int64.
+            attention_mask (np.ndarray): Ma trận attention mask cùng kích thước.
+            trace (InferenceTrace): Trace để ghi số layer đã chạy (tùy chọn).
+
+        Returns:
+            np.ndarray: Logits (batch x độ dài x số nhãn), kiểu float32.
+        """
+        if self.backend == "onnx":
+            return self.model.run(["logits"], {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+
+        input_tensor = torch.from_numpy(input_ids).to(self.device)
+        mask_tensor = torch.from_numpy(attention_mask).to(self.device)
+        compiled_model = self._compiled_models.get(input_ids.shape[1])
+        exit_layer = self.model.config.num_hidden_layers
+        with torch.no_grad():
+            if compiled_model is not None:
+                logits = compiled_model(input_tensor, mask_tensor)[0]
+            elif self.exit_heads is not None:
+                self._exit_state.token_mask = mask_tensor.bool()
+                try:
+                    logits = self.model(input_tensor, attention_mask=mask_tensor).logits
+                except _EarlyExit as early_exit:
+                    logits, exit_layer = early_exit.logits, early_exit.layer
+                finally:
+                    self._exit_state.token_mask = None
+            else:
+                logits = self.model(input_tensor, attention_mask=mask_tensor).logits
+
+        if trace is not None:
+            trace.exit_layers.append(exit_layer)
+        return logits.float().cpu().numpy()
+
+    def _fuse_window_logits(self, document: EncodedDocument,
+                            window_logits: List[Tuple[int, np.ndarray]]) -> np.ndarray:
+        """
+        Ghép logits của các cửa sổ thành một chuỗi logits cho toàn văn bản.
+
+        Token nằm trong nhiều cửa sổ (vùng chồng lấn) nhận trung bình logits của các
+        cửa sổ đó. Vị trí [CLS]/[SEP] và token không thuộc cửa sổ nào (bị cắt bởi
+        giới hạn của model) được gán nhãn O.
+
+        Args:
+            document (EncodedDocument): Văn bản đã token hóa.
+            window_logits (List[Tuple[int, np.ndarray]]): Mỗi phần tử gồm chỉ số token bắt đầu
+                của cửa sổ và logits của cửa sổ (gồm cả [CLS] và [SEP]).
+
+        Returns:
+            np.ndarray: Logits dạng [CLS] + tokens của văn bản + [SEP].
+        """
+        if len(window_logits) == 1 and window_logits[0][0] == 0 and len(window_logits[0][1]) == len(document) + 2:
+            return window_logits[0][1]
+
+        num_tags = window_logits[0][1].shape[1]
+        fused = np.zeros((len(document) + 2, num_tags), dtype=np.float32)
+        counts = np.zeros(len(document) + 2, dtype=np.float32)
+        for token_start, logits in window_logits:
+            # Vị trí i của cửa sổ (bỏ [CLS]) là token token_start + i của văn bản
+            covered = len(logits) - 2
+            fused[token_start + 1:token_start + 1 + covered] += logits[1:-1]
+            counts[token_start + 1:token_start + 1 + covered] += 1
+
+        uncovered = counts == 0
+        fused[uncovered, self._outside_tag_id] = 1.0
+        counts[uncovered] = 1
+        return fused / counts[:, None]
+
+    @staticmethod
+    def _logits_to_outputs(logits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Chuyển logits thành nhãn dự đoán (argmax) và xác suất softmax của nhãn đó.
+
+        Args:
+            logits (np.ndarray): Logits (số token x số nhãn).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Id nhãn dự đoán và độ tin cậy của từng token.
+        """
+        probabilities = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        probabilities /= probabilities.sum(axis=-1, keepdims=True)
+        predictions = probabilities.argmax(axis=-1)
+        return predictions, probabilities[np.arange(len(predictions)), predictions]
+
+    def _build_tag_arrays(self) -> None:
+        """
+        Tạo các bảng tra NumPy từ id nhãn sang tiền tố BIO và loại entity.
+
+        Các bảng này cho phép giải mã BIO trên mảng dự đoán của cả batch mà
+        không phải duyệt chuỗi nhãn trong Python.
+        """
+        num_tags = len(self.ids_to_tags)
+        self._tag_prefix = np.zeros(num_tags, dtype=np.int8)  # 0: O, 1: B-, 2: I-
+        self._tag_type = np.full(num_tags, -1, dtype=np.int64)
+        self._entity_types = []
+
+        for tag_id, tag in self.ids_to_tags.items():
+            if not tag.startswith(("B-", "I-")):
+                continue
+            entity_type = tag[2:]
+            if entity_type not in self._entity_types:
+                self._entity_types.append(entity_type)
+            self._tag_prefix[int(tag_id)] = 1 if tag.startswith("B-") else 2
+            self._tag_type[int(tag_id)] = self._entity_types.index(entity_type)
+
+        self._outside_tag_id = int(np.flatnonzero(self._tag_prefix == 0)[0])
+
+    def _bio_spans(self, predictions: np.ndarray, continuation: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Nhóm nhãn BIO thành các span entity bằng các phép toán vector hóa.
+
+        Áp dụng cùng quy tắc sửa lỗi BPE của PhoBERT (@@): token là phần tiếp theo
+        của một từ đang nằm trong entity luôn được gộp vào entity đó, bất kể nhãn
+        dự đoán là B-, I- hay O. Token I- khác loại (không phải phần tiếp theo BPE)
+        hoặc thiếu B- mở đầu sẽ bắt đầu một entity mới.
+
+        Args:
+            predictions (np.ndarray): Id nhãn dự đoán của chuỗi token (có thể ghép nhiều cửa sổ).
+            continuation (np.ndarray): True nếu token trước đó (cùng cửa sổ) kết thúc bằng "@@".
+                Các token đặc biệt ([CLS], [SEP]) phải có nhãn O và continuation False.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Chỉ số token đầu, chỉ số token cuối
+            và chỉ số các token thành viên (đã sắp xếp) của từng entity.
+        """
+        prefix = self._tag_prefix[predictions]
+        types = self._tag_type[predictions]
+        index = np.arange(len(predictions))
+        labeled = prefix != 0
+
+        # Token nằm trong entity: có nhãn B-/I-, hoặc là token O nối với token có nhãn
+        # gần nhất phía trước bằng một chuỗi liên tục các phần tiếp theo BPE.
+        last_labeled = np.maximum.accumulate(np.where(labeled, index, -1))
+        last_break = np.maximum.accumulate(np.where(~continuation, index, -1))
+        inside = labeled | ((last_labeled >= 0) & (last_break <= last_labeled))
+        inside_prev = np.concatenate(([False], inside[:-1]))
+
+        # Token tiếp theo BPE trong entity: gộp vào entity hiện tại, giữ nguyên loại
+        bpe_attached = continuation & inside_prev
+        # Các token còn lại có nhãn sẽ đặt lại loại entity hiện tại thành loại của chính nó
+        resets = labeled & ~bpe_attached
+        last_reset = np.maximum.accumulate(np.where(resets, index, -1))
+        previous_reset = np.concatenate(([-1], last_reset[:-1]))
+        previous_type = np.where(previous_reset >= 0, types[np.maximum(previous_reset, 0)], -1)
+
+        # I- cùng loại với entity đang mở thì nối tiếp, ngược lại mở entity mới
+        same_type_continuation = (prefix == 2) & inside_prev & (previous_type == types)
+        starts = resets & ~same_type_continuation
+
+        members = np.flatnonzero(inside)
+        member_entity = np.cumsum(starts)[members]
+        is_last = np.ones(len(members), dtype=bool)
+        is_last[:-1] = member_entity[1:] != member_entity[:-1]
+
+        return np.flatnonzero(starts), members[is_last], members
+
+    def _decode_windows(self, windows: List[Tuple[EncodedDocument, int]],
+                        window_outputs: List[Tuple[np.ndarray, np.ndarray]],
+                        show_debug: bool = False, trace: InferenceTrace = None) -> List[List[Dict[str, any]]]:
+        """
+        Chuyển kết quả dự đoán của nhiều cửa sổ thành danh sách entity có vị trí.
+
+        Kết quả của mọi cửa sổ được ghép thành một mảng duy nhất và giải mã BIO một
+        lần. Vị trí (start, end) lấy trực tiếp từ bản đồ vị trí của token đầu và
+        token cuối; độ tin cậy là trung bình và nhỏ nhất của xác suất các token.
+
+        Args:
+            windows (List[Tuple[EncodedDocument, int]]): Mỗi cửa sổ gồm văn bản và chỉ số
+                token (trong văn bản) của token đầu tiên sau [CLS].
+            window_outputs (List[Tuple[np.ndarray, np.ndarray]]): Nhãn dự đoán và xác suất
+                của từng cửa sổ, gồm cả [CLS] và [SEP].
+            show_debug (bool): Hiển thị thông tin debug hay không.
+            trace (InferenceTrace): Trace để ghi thời gian (tùy chọn).
+
+        Returns:
+            List[List[Dict]]: Danh sách entity (text, tag, start, end, confidence,
+            min_confidence) cho từng cửa sổ.
+        """
+        if not windows:
+            return []
+        trace = trace if trace is not None else InferenceTrace()
+
+        with trace.stage('decoding'):
+            lengths = np.array([len(predictions) for predictions, _ in window_outputs])
+            window_offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            predictions = np.concatenate([predictions for predictions, _ in window_outputs])
+            confidences = np.concatenate([confidences for _, confidences in window_outputs])
+
+            # [CLS]/[SEP] luôn là O; token đầu cửa sổ không phải phần tiếp theo BPE
+            continuation = np.zeros(len(predictions), dtype=bool)
+            for (document, token_start), offset, length in zip(windows, window_offsets, lengths):
+                predictions[offset] = predictions[offset + length - 1] = self._outside_tag_id
+                open_pieces = document.open_pieces[token_start:token_start + length - 2]
+                continuation[offset + 2:offset + length - 1] = open_pieces[:-1]
+
+            if show_debug:
+                self._print_debug_windows(windows, window_offsets, lengths, predictions, continuation)
+
+            first, last, members = self._bio_spans(predictions, continuation)
+
+            # Độ tin cậy trung bình / nhỏ nhất trên các token thành viên của từng entity
+            group_starts = np.searchsorted(members, first)
+            member_confidences = confidences[members]
+            group_sizes = np.diff(np.append(group_starts, len(members)))
+            mean_confidences = np.add.reduceat(member_confidences, group_starts) / group_sizes if len(first) else []
+            min_confidences = np.minimum.reduceat(member_confidences, group_starts) if len(first) else []
+            entity_types = self._tag_type[predictions[first]]
+
+        with trace.stage('span_mapping'):
+            window_of_entity = np.searchsorted(window_offsets, first, side='right') - 1
+            results = [[] for _ in windows]
+            for k, window_index in enumerate(window_of_entity):
+                document, token_start = windows[window_index]
+                # Vị trí i trong cửa sổ tương ứng token token_start + i - 1 của văn bản
+                base = token_start - 1 - window_offsets[window_index]
+                start = int(document.token_starts[first[k] + base])
+                end = int(document.token_ends[last[k] + base])
+                entity_text = document.text[start:end]
+                if entity_text.strip():
+                    results[window_index].append({
+                        "text": entity_text,
+                        "tag": self._entity_types[entity_types[k]],
+                        "start": start,
+                        "end": end,
+                        "confidence": float(mean_confidences[k]),
+                        "min_confidence": float(min_confidences[k])
                     })
-                    used_positions.append((absolute_pos, absolute_end))
-                    found = True
-                    break
-                
-                # Tiếp tục tìm ở vị trí tiếp theo
-                search_pos = pos + 1
-            
-            if not found:
-                # Bước 2: Mở rộng tìm kiếm trong toàn bộ văn bản
-                search_pos = 0
-                while True:
-                    pos = search_text.find(entity_text_original, search_pos)
-                    if pos == -1:
-                        break
-                    
-                    absolute_end = pos + len(entity_text_original)
-                    is_used = any(pos < used_end and absolute_end > used_start 
-                                 for used_start, used_end in used_positions)
-                    
-                    if not is_used:
-                        entities_with_positions.append({
-                            "text": entity_text_original,  # Sử dụng text gốc (không có _)
-                            "tag": entity_tag,
-                            "start": pos,
-                            "end": absolute_end
-                        })
-                        used_positions.append((pos, absolute_end))
-                        found = True
-                        break
-                    
-                    search_pos = pos + 1
-            
-            if not found:
-                # Vẫn không tìm thấy - thêm vào nhưng không có vị trí
-                if show_debug:
-                    print(f"    Could not find position for entity: '{entity_text_original}' ({entity_tag})")
-                entities_with_positions.append({
-                    "text": entity_text_original,  # Sử dụng text gốc (không có _)
-                    "tag": entity_tag,
-                    "start": -1,
-                    "end": -1
-                })
 
         # Gộp các NAME entities liên tiếp lại với nhau (post-processing)
-        entities_with_positions = self._merge_consecutive_names(entities_with_positions, search_text)
-        
-        return entities_with_positions
+        with trace.stage('merge_names'):
+            return [self._merge_consecutive_names(entities, document.text)
+                    for entities, (document, _) in zip(results, windows)]
+
+    def _print_debug_windows(self, windows: List[Tuple[EncodedDocument, int]], window_offsets: np.ndarray,
+                             lengths: np.ndarray, predictions: np.ndarray, continuation: np.ndarray) -> None:
+        """In token, nhãn dự đoán và các token được gộp do BPE của từng cửa sổ (chế độ debug)."""
+        for (document, token_start), offset, length in zip(windows, window_offsets, lengths):
+            tokens = document.tokens[token_start:token_start + length - 2]
+            print("\n=== DEBUG INFO ===")
+            print(f"Window: tokens {token_start}-{token_start + length - 2}")
+            print(f"Number of tokens: {length}")
+            print("Tokens and Tags:")
+            for i, token in enumerate(tokens, start=1):
+                tag = self.ids_to_tags[int(predictions[offset + i])]
+                marker = "  [BPE]" if continuation[offset + i] else ""
+                print(f"  {i}: '{token}' -> {tag}{marker}")
+            print("==================\n")
 
     def _merge_consecutive_names(self, entities: List[Dict[str, any]], text: str) -> List[Dict[str, any]]:
         """
@@ -456,7 +1292,9 @@ class NERPredictor:
                     'text': full_name,
                     'tag': 'NAME',
                     'start': start_pos,
-                    'end': start_pos + len(full_name)
+                    'end': start_pos + len(full_name),
+                    'confidence': sum(e.get('confidence', 1.0) for e in consecutive_names) / len(consecutive_names),
+                    'min_confidence': min(e.get('min_confidence', 1.0) for e in consecutive_names)
                 })
             else:
                 # Chỉ có 1 NAME, giữ nguyên (nhưng loại bỏ dấu phẩy nếu có)
@@ -465,235 +1303,111 @@ class NERPredictor:
                     'text': name_text,
                     'tag': 'NAME',
                     'start': current['start'],
-                    'end': current['start'] + len(name_text)
+                    'end': current['start'] + len(name_text),
+                    'confidence': current.get('confidence', 1.0),
+                    'min_confidence': current.get('min_confidence', 1.0)
                 })
             
             i = j
         
         return merged
     
-    def _split_sentences(self, text: str) -> List[Dict[str, any]]:
+    def _sentence_bounds(self, document: EncodedDocument) -> np.ndarray:
         """
-        Chia văn bản thành các câu với thông tin offset.
+        Tính ranh giới câu theo chỉ số token, dưới dạng prefix sum số token của các câu.
+
+        Một câu kết thúc sau token cuối của một từ kết thúc bằng dấu chấm, chấm hỏi
+        hoặc chấm than.
 
         Args:
-            text (str): Văn bản đầu vào.
+            document (EncodedDocument): Văn bản đã token hóa.
 
         Returns:
-            list: Danh sách các dict chứa {'text': câu, 'start': vị trí bắt đầu, 'end': vị trí kết thúc}
+            np.ndarray: Mảng tăng dần [0, b1, ..., n]; câu thứ k gồm các token
+            [bounds[k], bounds[k+1]).
         """
-        # Regex để chia câu theo dấu chấm, chấm hỏi, chấm than
-        # Giữ lại dấu câu
-        sentence_pattern = r'([^.!?]*[.!?]+)|([^.!?]+$)'
-        matches = re.finditer(sentence_pattern, text)
-        
-        sentences = []
-        for match in matches:
-            sentence_text = match.group(0).strip()
-            if sentence_text:
-                sentences.append({
-                    'text': sentence_text,
-                    'start': match.start(),
-                    'end': match.end()
-                })
-        
-        # Nếu không tìm thấy câu nào, trả về toàn bộ text
-        if not sentences:
-            sentences = [{'text': text, 'start': 0, 'end': len(text)}]
-        
-        return sentences
+        ends_sentence = np.array([token.endswith(('.', '!', '?')) for token in document.tokens], dtype=bool)
+        ends_sentence &= ~document.open_pieces
+        boundaries = np.flatnonzero(ends_sentence[:-1]) + 1
+        return np.concatenate(([0], boundaries, [len(document)])).astype(np.int64)
 
-    def _create_chunks(self, text: str, max_length: int, overlap: int = 30) -> List[Dict[str, any]]:
+    def _create_chunks(self, token_start: int, token_end: int, max_length: int,
+                       stride: int) -> List[Dict[str, int]]:
         """
-        Chia văn bản thành các chunks với overlap.
+        Chia một đoạn token thành các cửa sổ trượt với bước stride.
+
+        Hai cửa sổ liên tiếp chồng lấn max_length - stride tokens; cửa sổ cuối cùng
+        kết thúc đúng tại token_end.
 
         Args:
-            text (str): Văn bản đầu vào.
+            token_start (int): Chỉ số token bắt đầu của đoạn.
+            token_end (int): Chỉ số token kết thúc (không bao gồm) của đoạn.
             max_length (int): Độ dài tối đa của mỗi chunk (tính theo tokens).
-            overlap (int): Số tokens overlap giữa các chunks.
+            stride (int): Bước trượt giữa hai cửa sổ (tính theo tokens, 1 <= stride <= max_length).
 
         Returns:
-            list: Danh sách các dict chứa {'text': chunk text, 'start': offset bắt đầu}
+            list: Danh sách các dict chứa {'token_start': chỉ số token đầu, 'token_end': chỉ số token cuối}
         """
-        # Tokenize toàn bộ văn bản
-        tokens = self.tokenizer.tokenize(text)
-        
         chunks = []
-        start_idx = 0
-        char_position = 0  # Theo dõi vị trí ký tự trong text gốc
-        
-        while start_idx < len(tokens):
-            # Lấy chunk từ start_idx đến start_idx + max_length
-            end_idx = min(start_idx + max_length, len(tokens))
-            chunk_tokens = tokens[start_idx:end_idx]
-            
-            # Convert tokens về text
-            chunk_text = self.tokenizer.convert_tokens_to_string(chunk_tokens)
-            
-            # Tìm vị trí chính xác của chunk_text trong text gốc bắt đầu từ char_position
-            chunk_start = text.find(chunk_text.strip(), char_position)
-            
-            # Nếu không tìm thấy chính xác, sử dụng char_position hiện tại
-            if chunk_start == -1:
-                chunk_start = char_position
-            
-            chunks.append({
-                'text': chunk_text.strip(),
-                'start': chunk_start,
-                'token_start': start_idx,
-                'token_end': end_idx
-            })
-            
-            # Cập nhật char_position cho chunk tiếp theo
-            char_position = chunk_start + len(chunk_text.strip())
-            
-            # Di chuyển start_idx, trừ đi overlap để tạo vùng chồng lấn
-            if end_idx >= len(tokens):
+        start_idx = token_start
+
+        while True:
+            end_idx = min(start_idx + max_length, token_end)
+            chunks.append({'token_start': start_idx, 'token_end': end_idx})
+
+            if end_idx >= token_end:
                 break
-            start_idx = end_idx - overlap
-        
+            start_idx += stride
+
         return chunks
 
-    def _predict_long_text(self, text: str, max_length: int, show_debug: bool = False, 
-                          original_text: str = None) -> List[Dict[str, any]]:
+    def _plan_long_text(self, document: EncodedDocument, max_length: int, stride: int = None,
+                        show_debug: bool = False) -> List[Dict[str, any]]:
         """
-        Dự đoán các thực thể cho văn bản dài bằng cách chia thành chunks.
+        Chia văn bản dài thành các cửa sổ token để đưa vào model.
+
+        Các câu liên tiếp được gom vào một cửa sổ miễn là tổng số token không vượt
+        max_length. Việc gom câu chỉ dựa trên prefix sum số token của các câu (văn bản
+        đã được token hóa một lần), không tạo chuỗi trung gian hay token hóa lại.
+        Câu quá dài được chia thành các cửa sổ trượt chồng lấn nhau (xem _create_chunks()).
 
         Args:
-            text (str): Văn bản đầu vào (đã được segment).
-            max_length (int): Độ dài tối đa của mỗi chunk.
+            document (EncodedDocument): Văn bản đã token hóa kèm bản đồ vị trí.
+            max_length (int): Độ dài tối đa của mỗi cửa sổ.
+            stride (int): Bước trượt giữa các cửa sổ của câu quá dài (mặc định config.WINDOW_STRIDE,
+                tối đa max_length).
             show_debug (bool): Hiển thị thông tin debug hay không.
-            original_text (str): Văn bản gốc (chưa segment) để tìm vị trí chính xác.
 
         Returns:
-            list: Danh sách các entity đã được gộp và loại bỏ trùng lặp.
+            list: Danh sách các dict chứa {'token_start': chỉ số token đầu, 'token_end': chỉ số token cuối (không bao gồm)}
         """
-        # Nếu không có original_text, dùng text hiện tại
-        if original_text is None:
-            original_text = text
-        
-        # 1. Thử chia theo câu trước
-        sentences = self._split_sentences(text)
-        
-        all_entities = []
-        
-        # 2. Xử lý từng câu hoặc nhóm câu
-        current_batch = ""
-        current_batch_start = 0
-        
-        for i, sent_info in enumerate(sentences):
-            sentence = sent_info['text']
-            sent_tokens = self.tokenizer.tokenize(sentence)
-            
-            # Nếu câu này quá dài, chia thành chunks
-            if len(sent_tokens) > max_length:
-                # Xử lý batch hiện tại trước (nếu có)
-                if current_batch:
-                    print(f"  📦 Processing batch (offset: {current_batch_start})...")
-                    batch_entities = self._predict_single(
-                        current_batch, 
-                        show_debug=show_debug,
-                        original_text=original_text,  # Truyền văn bản gốc chưa segment
-                        text_offset=current_batch_start
-                    )
-                    all_entities.extend(batch_entities)
-                    current_batch = ""
-                
-                # Chia câu dài thành chunks
-                print(f"    Sentence too long ({len(sent_tokens)} tokens) - splitting into chunks...")
-                chunks = self._create_chunks(sentence, max_length, overlap=30)
-                
-                for j, chunk in enumerate(chunks):
-                    print(f"     Processing chunk {j+1}/{len(chunks)}...")
-                    # Tính offset chính xác: vị trí câu trong text + vị trí chunk trong câu
-                    chunk_offset = sent_info['start'] + chunk['start']
-                    
-                    # Debug info
-                    if show_debug:
-                        print(f"      Chunk offset: {chunk_offset}")
-                        print(f"      Chunk text: {chunk['text'][:50]}...")
-                    
-                    chunk_entities = self._predict_single(
-                        chunk['text'], 
-                        show_debug=show_debug,
-                        original_text=original_text,  # Truyền văn bản gốc chưa segment
-                        text_offset=chunk_offset
-                    )
-                    all_entities.extend(chunk_entities)
-                
-                current_batch_start = sent_info['end']
-            else:
-                # Thử thêm câu này vào batch
-                test_batch = current_batch + " " + sentence if current_batch else sentence
-                test_tokens = self.tokenizer.tokenize(test_batch)
-                
-                if len(test_tokens) <= max_length:
-                    # Còn chỗ, thêm vào batch
-                    if not current_batch:
-                        current_batch_start = sent_info['start']
-                    current_batch = test_batch
-                else:
-                    # Batch đầy, xử lý batch hiện tại
-                    if current_batch:
-                        print(f"   Processing batch (offset: {current_batch_start})...")
-                        batch_entities = self._predict_single(
-                            current_batch, 
-                            show_debug=show_debug,
-                            original_text=original_text,  # Truyền văn bản gốc
-                            text_offset=current_batch_start
-                        )
-                        all_entities.extend(batch_entities)
-                    
-                    # Bắt đầu batch mới với câu hiện tại
-                    current_batch = sentence
-                    current_batch_start = sent_info['start']
-        
-        # Xử lý batch cuối cùng
-        if current_batch:
-            print(f"   Processing final batch (offset: {current_batch_start})...")
-            batch_entities = self._predict_single(
-                current_batch, 
-                show_debug=show_debug,
-                original_text=original_text,  # Truyền văn bản gốc
-                text_offset=current_batch_start
-            )
-            all_entities.extend(batch_entities)
-        
-        # 3. Loại bỏ entities trùng lặp (từ vùng overlap)
-        unique_entities = self._remove_duplicates(all_entities)
-        
-        print(f" Completed! Found {len(unique_entities)} unique entities.\n")
-        
-        return unique_entities
+        stride = max(1, min(stride or config.WINDOW_STRIDE, max_length))
+        bounds = self._sentence_bounds(document)
+        num_sentences = len(bounds) - 1
 
-    def _remove_duplicates(self, entities: List[Dict[str, any]]) -> List[Dict[str, any]]:
-        """
-        Loại bỏ các entities trùng lặp dựa trên vị trí và text.
+        windows = []
+        sentence = 0
+        while sentence < num_sentences:
+            window_start = int(bounds[sentence])
+            # Câu cuối cùng có thể gom vào cửa sổ mà tổng số token không vượt max_length
+            last = int(np.searchsorted(bounds, window_start + max_length, side='right')) - 1
 
-        Args:
-            entities (list): Danh sách các entities.
+            if last > sentence:
+                windows.append({'token_start': window_start, 'token_end': int(bounds[last])})
+                sentence = last
+            else:
+                # Câu quá dài: chia thành chunks
+                sentence_end = int(bounds[sentence + 1])
+                if self.verbose:
+                    print(f"    Sentence too long ({sentence_end - window_start} tokens) - splitting into chunks...")
+                chunks = self._create_chunks(window_start, sentence_end, max_length, stride)
+                if show_debug:
+                    for chunk in chunks:
+                        print(f"      Chunk tokens: {chunk['token_start']}-{chunk['token_end']}")
+                windows.extend(chunks)
+                sentence += 1
 
-        Returns:
-            list: Danh sách entities đã loại bỏ trùng lặp.
-        """
-        if not entities:
-            return []
-        
-        # Sắp xếp theo vị trí start
-        sorted_entities = sorted(entities, key=lambda x: (x.get('start', -1), x.get('end', -1)))
-        
-        unique = []
-        seen = set()
-        
-        for entity in sorted_entities:
-            # Tạo key duy nhất cho entity
-            key = (entity['text'].strip(), entity['tag'], entity.get('start', -1))
-            
-            if key not in seen:
-                seen.add(key)
-                unique.append(entity)
-        
-        return unique
+        return windows
 
 def main():
     """Hàm main để demo cách sử dụng class NERPredictor."""
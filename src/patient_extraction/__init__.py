@@ -8,11 +8,13 @@
 # - manual_extractor: MODULE - Trích xuất thủ công (1 bệnh nhân)
 
 from .entity_structures import Entity, PatientRecord
-from .manual_extractor import ManualPatientExtractor, extract_single_patient
+from .manual_extractor import ManualPatientExtractor, extract_single_patient, predict_segments, extract_patients
 
 __all__ = [
     'Entity',
     'PatientRecord',
     'ManualPatientExtractor',
     'extract_single_patient',
+    'predict_segments',
+    'extract_patients',
 ]
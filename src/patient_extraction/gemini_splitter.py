@@ -4,46 +4,283 @@ Module sử dụng Gemini API để tách văn bản thành các đoạn,
 mỗi đoạn tương ứng với thông tin của 1 bệnh nhân.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from collections import OrderedDict
 from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+import os
 import re
+import json
+import time
+import queue
 import logging
+import tempfile
+import threading
+
+from src import config as ner_config
+from src.text_processor import split_sentences
+from src.result_cache import ResultCache, make_cache_key
 
 # Get logger
 logger = logging.getLogger("ner_api")
 
 
+class GeminiAPIError(Exception):
+    """Lỗi khi gọi Gemini API (sau khi đã thử lại)"""
+    pass
+
+
+class GeminiClient:
+    """
+    Client REST dùng lâu dài cho Gemini API (mỗi API key một instance, xem get_gemini_client)
+
+    Giữ các kết nối HTTP keep-alive để dùng lại giữa các request; mỗi request có timeout và
+    được thử lại với backoff khi lỗi mạng, HTTP 429 hoặc 5xx.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key: str, endpoint: str = None, timeout: float = None,
+                 max_retries: int = None, pool_size: int = None):
+        """
+        Khởi tạo client
+
+        Args:
+            api_key: Google Gemini API key
+            endpoint: URL gốc của API (mặc định GEMINI_API_ENDPOINT)
+            timeout: Timeout (giây) cho kết nối và mỗi lần đọc (mặc định GEMINI_TIMEOUT_SECONDS)
+            max_retries: Số lần thử lại tối đa (mặc định GEMINI_MAX_RETRIES)
+            pool_size: Số kết nối keep-alive được giữ lại (mặc định GEMINI_POOL_SIZE)
+        """
+        self.api_key = api_key
+        self.endpoint = endpoint or ner_config.GEMINI_API_ENDPOINT
+        self.timeout = ner_config.GEMINI_TIMEOUT_SECONDS if timeout is None else timeout
+        self.max_retries = ner_config.GEMINI_MAX_RETRIES if max_retries is None else max_retries
+        url = urlsplit(self.endpoint)
+        self._connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        self._host = url.netloc
+        self._base_path = url.path.rstrip("/")
+        self._idle = queue.LifoQueue(maxsize=ner_config.GEMINI_POOL_SIZE if pool_size is None else pool_size)
+        self._closed = False
+
+    def generate(self, prompt: str, model_name: str, json_response: bool = False) -> str:
+        """
+        Gọi generateContent và trả về văn bản của kết quả
+
+        Args:
+            prompt: Prompt
+            model_name: Tên model (ví dụ "gemini-2.5-flash")
+            json_response: Yêu cầu model trả về JSON (responseMimeType=application/json)
+
+        Returns:
+            str: Văn bản do model sinh ra
+
+        Raises:
+            GeminiAPIError: Nếu request thất bại sau khi đã thử lại
+        """
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if json_response:
+            body["generationConfig"] = {"responseMimeType": "application/json"}
+        path = f"{self._base_path}/v1beta/models/{model_name}:generateContent"
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+        for attempt in range(self.max_retries + 1):
+            delay = 0.5 * 2 ** attempt
+            try:
+                status, headers, data = self._post(path, payload)
+            except (OSError, HTTPException) as e:
+                error = GeminiAPIError(f"Lỗi kết nối Gemini API: {type(e).__name__}: {e}")
+            else:
+                if status == 200:
+                    return self._response_text(data)
+                error = GeminiAPIError(f"Gemini API trả về HTTP {status}: {data[:300].decode('utf-8', 'replace')}")
+                if status not in self.RETRY_STATUSES:
+                    raise error
+                retry_after = headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = min(float(retry_after), 30.0)
+
+            if attempt < self.max_retries:
+                logger.warning(f"{error} - thử lại sau {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+        raise error
+
+    def close(self) -> None:
+        """Đóng các kết nối đang giữ (kết nối của request đang chạy được đóng khi request xong)"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _post(self, path: str, payload: bytes):
+        """Gửi POST trên một kết nối của pool (kết nối keep-alive đã bị server đóng được mở lại)"""
+        try:
+            connection, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            connection, reused = self._connection_class(self._host, timeout=self.timeout), False
+
+        headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+        try:
+            connection.request("POST", path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (ConnectionError, HTTPException):
+            connection.close()
+            if not reused:
+                raise
+            return self._post(path, payload)
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close or self._closed:
+            connection.close()
+        else:
+            try:
+                self._idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        return response.status, response.headers, data
+
+    @staticmethod
+    def _response_text(data: bytes) -> str:
+        """Lấy văn bản từ response JSON của generateContent"""
+        try:
+            response = json.loads(data)
+        except ValueError as e:
+            raise GeminiAPIError(f"Response của Gemini API không phải JSON: {e}")
+        candidates = response.get("candidates") or []
+        if not candidates:
+            raise GeminiAPIError(f"Gemini API không trả về kết quả: {response.get('promptFeedback')}")
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+
+class SplitCache:
+    """
+    Cache kết quả tách văn bản theo nội dung: LRU trong bộ nhớ, và (tùy chọn) mỗi kết quả
+    một file JSON trong cache_dir để dùng lại sau khi khởi động lại
+    """
+
+    def __init__(self, max_entries: int, cache_dir: str = None):
+        """
+        Args:
+            max_entries: Số kết quả tối đa giữ trong bộ nhớ
+            cache_dir: Thư mục cache trên đĩa (None = chỉ cache trong bộ nhớ)
+        """
+        self.memory = ResultCache(max_entries)
+        self.cache_dir = cache_dir
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Các đoạn đã lưu theo khóa, hoặc None"""
+        segments = self.memory.get(key)
+        if segments is None and self.cache_dir:
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    segments = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self.memory.put(key, segments)
+        return segments
+
+    def put(self, key: str, segments: List[str]) -> None:
+        """Lưu các đoạn (ghi file tạm riêng rồi đổi tên để không để lại file dở dang)"""
+        self.memory.put(key, segments)
+        if self.cache_dir:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(segments, f, ensure_ascii=False)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+
+# Client và cache dùng chung trong tiến trình
+_clients: "OrderedDict[Tuple[str, str], GeminiClient]" = OrderedDict()
+_split_cache: Optional[SplitCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_gemini_client(api_key: str) -> GeminiClient:
+    """
+    Client dùng chung cho mỗi API key (và endpoint), tạo lần đầu khi cần
+
+    Chỉ giữ GEMINI_CLIENT_CACHE_SIZE client dùng gần nhất; client bị loại được đóng kết nối.
+    """
+    key = (api_key, ner_config.GEMINI_API_ENDPOINT)
+    evicted = []
+    with _shared_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = GeminiClient(api_key)
+        _clients.move_to_end(key)
+        while len(_clients) > max(1, ner_config.GEMINI_CLIENT_CACHE_SIZE):
+            evicted.append(_clients.popitem(last=False)[1])
+    for old_client in evicted:
+        old_client.close()
+    return client
+
+
+def close() -> None:
+    """Đóng mọi client dùng chung (gọi khi tắt server)"""
+    with _shared_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def get_split_cache() -> SplitCache:
+    """Cache kết quả tách dùng chung (GEMINI_CACHE_MAX_ENTRIES, GEMINI_CACHE_DIR)"""
+    global _split_cache
+    with _shared_lock:
+        if _split_cache is None:
+            _split_cache = SplitCache(ner_config.GEMINI_CACHE_MAX_ENTRIES, ner_config.GEMINI_CACHE_DIR)
+        return _split_cache
+
+
 class GeminiTextSplitter:
     """
     Class sử dụng Gemini API để tách văn bản về nhiều bệnh nhân
     thành các đoạn văn bản riêng biệt.
     """
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, mode: str = None, use_cache: bool = True):
         """
         Khởi tạo splitter với API key
         
         Args:
             api_key: Google Gemini API key
+            mode: "boundaries" (Gemini chỉ trả về khoảng câu của từng bệnh nhân) hoặc
+                "full_text" (Gemini chép lại văn bản theo từng bệnh nhân); mặc định GEMINI_SPLIT_MODE
+            use_cache: Dùng cache kết quả tách theo nội dung văn bản
         """
         self.api_key = api_key
         self.client = None
-        self.model_name = "gemini-2.5-flash"
+        self.model_name = ner_config.GEMINI_MODEL_NAME
+        self.mode = mode or ner_config.GEMINI_SPLIT_MODE
+        if self.mode not in ("boundaries", "full_text"):
+            raise ValueError(f"Chế độ tách không hợp lệ: {self.mode}")
+        self.cache = get_split_cache() if use_cache else None
         self._initialize_client()
     
     def _initialize_client(self):
-        """Khởi tạo Gemini client"""
-        try:
-            import google.generativeai as genai
-            genai.configure(api_key=self.api_key)
-            self.client = genai
-            logger.info("Gemini API client initialized successfully")
-        except ImportError as ie:
-            error_msg = f"Lỗi: Chưa cài đặt google-generativeai. Chạy: pip install google-generativeai"
-            logger.error(f"{error_msg} | Chi tiết: {ie}")
-            self.client = None
-        except Exception as e:
-            logger.error(f"Lỗi khởi tạo Gemini client: {e}", exc_info=True)
+        """Lấy Gemini client dùng chung cho API key"""
+        if not self.api_key:
+            logger.error("Lỗi: Chưa có Gemini API key")
             self.client = None
+            return
+        self.client = get_gemini_client(self.api_key)
     
     def is_available(self) -> bool:
         """Kiểm tra xem Gemini API có sẵn sàng không"""
@@ -68,20 +305,32 @@ class GeminiTextSplitter:
         if not self.is_available():
             raise RuntimeError("Gemini API không khả dụng. Kiểm tra API key và cài đặt.")
         
-        logger.info(f"Calling Gemini API to split text (length: {len(text)} chars)...")
+        cache_key = make_cache_key(text, "gemini_split", self.model_name, self.mode,
+                                   ner_config.GEMINI_WINDOW_CHARS, ner_config.GEMINI_WINDOW_OVERLAP_SENTENCES)
+        if self.cache is not None:
+            segments = self.cache.get(cache_key)
+            if segments is not None:
+                logger.info(f"Gemini split cache hit: {len(segments)} segment(s)")
+                metadata = {
+                    'original_length': len(text),
+                    'num_segments': len(segments),
+                    'mode': self.mode,
+                    'cached': True
+                }
+                if return_metadata:
+                    return segments, metadata
+                return segments
         
-        # Tạo prompt cho Gemini
-        prompt = self._create_splitting_prompt(text)
+        logger.info(f"Calling Gemini API to split text (length: {len(text)} chars, mode: {self.mode})...")
         
         try:
-            # Gọi API
-            model = self.client.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
-            
-            logger.info(f"Gemini API response received (length: {len(response.text)} chars)")
+            mode = self.mode
+            segments, response_text = self._request_segments(text, mode)
             
-            # Parse response
-            segments = self._parse_response(response.text)
+            if not segments and mode == "boundaries":
+                logger.warning("Không đọc được ranh giới bệnh nhân từ Gemini, thử lại ở chế độ full_text")
+                mode = "full_text"
+                segments, response_text = self._request_segments(text, mode)
             
             # Validate segments
             if not segments:
@@ -93,11 +342,14 @@ class GeminiTextSplitter:
                     logger.info(f"--- FULL SEGMENT {i}/{len(segments)} ({len(seg)} chars) ---")
                     logger.info(f"{seg}")
                     logger.info(f"--- END SEGMENT {i} ---")
+                if self.cache is not None:
+                    self.cache.put(cache_key, segments)
             
             metadata = {
                 'original_length': len(text),
                 'num_segments': len(segments),
-                'api_response': response.text[:500]  # Lưu 500 ký tự đầu
+                'mode': mode,
+                'api_response': response_text[:500]  # Lưu 500 ký tự đầu
             }
             
             if return_metadata:
@@ -111,6 +363,198 @@ class GeminiTextSplitter:
                 return [text], {'error': str(e)}
             return [text]
     
+    def _request_segments(self, text: str, mode: str) -> Tuple[List[str], str]:
+        """
+        Gọi Gemini theo chế độ mode và đọc các đoạn từ response
+        
+        Ở chế độ "boundaries", văn bản dài hơn GEMINI_WINDOW_CHARS được gửi theo từng cửa sổ câu song song.
+        
+        Args:
+            text: Văn bản cần tách
+            mode: "boundaries" hoặc "full_text"
+            
+        Returns:
+            Tuple (segments, response text) - segments rỗng nếu không đọc được response
+        """
+        if mode == "boundaries":
+            sentences = split_sentences(text)
+            if len(text) > ner_config.GEMINI_WINDOW_CHARS and len(sentences) > 1:
+                return self._request_windowed(text, sentences)
+            
+            response_text = self.client.generate(
+                self._create_boundary_prompt(text, sentences), self.model_name, json_response=True
+            )
+            logger.info(f"Gemini API response received (length: {len(response_text)} chars)")
+            ranges = self._parse_boundaries(response_text, 0, len(sentences) - 1)
+            windows = [(0, len(sentences) - 1)]
+            return self._cut_segments(text, sentences, windows, [ranges]), response_text
+        
+        response_text = self.client.generate(self._create_splitting_prompt(text), self.model_name)
+        logger.info(f"Gemini API response received (length: {len(response_text)} chars)")
+        return self._parse_response(response_text), response_text
+    
+    def _request_windowed(self, text: str, sentences: List[Tuple[int, int]]) -> Tuple[List[str], str]:
+        """
+        Tách văn bản dài: gửi song song các cửa sổ câu chồng lên nhau, rồi ghép kết quả (xem _cut_segments)
+        
+        Returns:
+            Tuple (segments, response text của các cửa sổ) - segments rỗng nếu một cửa sổ không đọc được
+        """
+        windows = self._sentence_windows(sentences)
+        logger.info(f"Text too long for one prompt: {len(windows)} window(s)")
+        
+        def request_window(window):
+            first, last = window
+            response_text = self.client.generate(
+                self._create_boundary_prompt(text, sentences[first:last + 1], first_index=first),
+                self.model_name, json_response=True
+            )
+            return self._parse_boundaries(response_text, first, last), response_text
+        
+        with ThreadPoolExecutor(max_workers=min(ner_config.GEMINI_MAX_PARALLEL_WINDOWS, len(windows))) as executor:
+            results = list(executor.map(request_window, windows))
+        
+        for index, ((first, last), (ranges, _)) in enumerate(zip(windows, results)):
+            if not ranges:
+                logger.warning(f"Window {index + 1} ({first}-{last}) returned no valid sentence ranges")
+                return [], "\n".join(response_text for _, response_text in results)
+        segments = self._cut_segments(text, sentences, windows, [ranges for ranges, _ in results])
+        return segments, "\n".join(response_text for _, response_text in results)
+    
+    @staticmethod
+    def _cut_segments(text: str, sentences: List[Tuple[int, int]], windows: List[Tuple[int, int]],
+                      window_ranges: List[List[Tuple[int, int]]]) -> List[str]:
+        """
+        Cắt các đoạn từ văn bản gốc theo khoảng câu Gemini trả về cho từng cửa sổ
+        
+        Dùng chung cho cả văn bản ngắn (một cửa sổ) và văn bản dài, nên hai chế độ cắt giống nhau:
+        mỗi đoạn đi từ câu đầu tới câu cuối của bệnh nhân, câu không thuộc khoảng nào bị bỏ.
+        Với nhiều cửa sổ, mỗi câu do cửa sổ có "lõi" chứa nó quyết định (phần chồng lấn được chia
+        đôi cho hai cửa sổ kề nhau); khoảng bắt đầu trước lõi là phần tiếp của bệnh nhân đã gặp ở
+        cửa sổ trước, nên bệnh nhân nằm vắt qua biên cửa sổ không bị tách đôi.
+        
+        Args:
+            text: Văn bản gốc
+            sentences: Khoảng [start, end) của từng câu trong text
+            windows: Các cửa sổ [câu đầu, câu cuối], theo thứ tự
+            window_ranges: Các khoảng câu [đầu, cuối] của từng cửa sổ
+            
+        Returns:
+            List[str]: Các đoạn theo thứ tự xuất hiện
+        """
+        # owner[i]: câu đầu của bệnh nhân chứa câu i (None = câu không thuộc bệnh nhân nào)
+        owner = [None] * len(sentences)
+        for index, ((first, last), ranges) in enumerate(zip(windows, window_ranges)):
+            core_start = 0 if index == 0 else (first + windows[index - 1][1] + 1) // 2
+            core_end = last if index == len(windows) - 1 else (windows[index + 1][0] + last + 1) // 2 - 1
+            for range_first, range_last in ranges:
+                patient = range_first
+                if range_first < core_start:
+                    # Bắt đầu trước lõi: các câu trước lõi đã được cửa sổ trước quyết định
+                    patient = owner[range_first] if owner[range_first] is not None else range_first
+                elif index > 0 and range_first == first and range_first > 0 and any(
+                        previous_first < range_first <= previous_last
+                        for previous_first, previous_last in window_ranges[index - 1]):
+                    # Câu đầu cửa sổ luôn mở một khoảng; cửa sổ trước (thấy cả câu phía trước) coi là phần tiếp
+                    patient = owner[range_first - 1] if owner[range_first - 1] is not None else range_first
+                for sentence in range(max(range_first, core_start), min(range_last, core_end) + 1):
+                    owner[sentence] = patient
+        
+        bounds = OrderedDict()
+        for sentence, patient in enumerate(owner):
+            if patient is not None:
+                bounds.setdefault(patient, [sentence, sentence])[1] = sentence
+        return [text[sentences[first][0]:sentences[last][1]] for first, last in bounds.values()]
+    
+    @staticmethod
+    def _sentence_windows(sentences: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Chia các câu thành cửa sổ [câu đầu, câu cuối] dài tối đa GEMINI_WINDOW_CHARS ký tự,
+        hai cửa sổ kề nhau chồng lên nhau GEMINI_WINDOW_OVERLAP_SENTENCES câu
+        """
+        windows = []
+        first = 0
+        while True:
+            last = first
+            while last + 1 < len(sentences) and \
+                    sentences[last + 1][1] - sentences[first][0] <= ner_config.GEMINI_WINDOW_CHARS:
+                last += 1
+            windows.append((first, last))
+            if last == len(sentences) - 1:
+                return windows
+            first = max(last + 1 - ner_config.GEMINI_WINDOW_OVERLAP_SENTENCES, first + 1)
+    
+    def _create_boundary_prompt(self, text: str, sentences: List[Tuple[int, int]], first_index: int = 0) -> str:
+        """
+        Tạo prompt yêu cầu Gemini chỉ trả về khoảng câu của từng bệnh nhân
+        
+        Args:
+            text: Văn bản cần tách
+            sentences: Khoảng [start, end) của từng câu trong text (có thể là một cửa sổ)
+            first_index: Số thứ tự của câu đầu tiên
+            
+        Returns:
+            str: Prompt (văn bản được đánh số theo câu)
+        """
+        numbered_text = "\n".join(
+            f"[{index}] {text[start:end]}" for index, (start, end) in enumerate(sentences, start=first_index)
+        )
+        prompt = f"""
+Nhiệm vụ: Văn bản sau đã được chia thành các câu đánh số [{first_index}], [{first_index + 1}], ... Hãy xác định các đoạn câu liên tiếp, trong đó MỖI ĐOẠN chỉ chứa thông tin về MỘT bệnh nhân duy nhất.
+
+Hướng dẫn:
+1. Đọc kỹ văn bản và xác định có bao nhiêu bệnh nhân được nhắc đến
+2. Với mỗi bệnh nhân, trả về số thứ tự câu đầu tiên và câu cuối cùng của đoạn nói về bệnh nhân đó
+3. Mỗi đoạn nên bao gồm TẤT CẢ các câu liên quan đến bệnh nhân đó (ID, tên, tuổi, giới tính, địa điểm, ngày tháng, triệu chứng, v.v.)
+4. Các đoạn không được chồng lên nhau, theo thứ tự xuất hiện trong văn bản
+5. KHÔNG chép lại nội dung văn bản
+
+Format trả về (chỉ JSON, không giải thích): một mảng các cặp [câu đầu, câu cuối], ví dụ:
+[[0, 3], [4, 7], [8, 8]]
+
+Văn bản cần phân tích:
+{numbered_text}
+"""
+        return prompt
+    
+    def _parse_boundaries(self, response_text: str, first_index: int, last_index: int) -> List[Tuple[int, int]]:
+        """
+        Đọc các khoảng câu từ response
+        
+        Args:
+            response_text: Response từ Gemini API (mảng JSON [[câu đầu, câu cuối], ...])
+            first_index: Số thứ tự câu nhỏ nhất hợp lệ
+            last_index: Số thứ tự câu lớn nhất hợp lệ
+            
+        Returns:
+            List[Tuple[int, int]]: Các khoảng câu, rỗng nếu response không hợp lệ
+        """
+        logger.info("Parsing Gemini response to extract patient boundaries...")
+        
+        match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        try:
+            ranges = json.loads(match.group()) if match else None
+        except ValueError:
+            ranges = None
+        
+        if not isinstance(ranges, list) or not ranges:
+            logger.warning("Gemini response is not a JSON list of sentence ranges")
+            return []
+        
+        result = []
+        for item in ranges:
+            if not (isinstance(item, list) and len(item) == 2 and all(isinstance(index, int) for index in item)):
+                logger.warning(f"Invalid sentence range in Gemini response: {item}")
+                return []
+            first, last = item
+            if not first_index <= first <= last <= last_index:
+                logger.warning(f"Sentence range out of bounds in Gemini response: {item}")
+                return []
+            result.append((first, last))
+        
+        logger.info(f"Found {len(result)} patient segments from sentence ranges")
+        return result
+    
     def _create_splitting_prompt(self, text: str) -> str:
         """
         Tạo prompt cho Gemini để tách văn bản
@@ -199,7 +643,8 @@ Kết quả (chỉ trả về các đoạn đã tách, không giải thích):
 def split_text_with_gemini(
     text: str, 
     api_key: str,
-    return_metadata: bool = False
+    return_metadata: bool = False,
+    mode: str = None
 ) -> List[str] | Tuple[List[str], dict]:
     """
     Helper function để tách văn bản sử dụng Gemini API
@@ -208,10 +653,11 @@ def split_text_with_gemini(
         text: Văn bản cần tách
         api_key: Gemini API key
         return_metadata: Có trả về metadata không
+        mode: "boundaries" hoặc "full_text" (mặc định GEMINI_SPLIT_MODE)
         
     Returns:
         List[str]: Danh sách các đoạn văn bản
         hoặc Tuple[List[str], dict] nếu return_metadata=True
     """
-    splitter = GeminiTextSplitter(api_key=api_key)
+    splitter = GeminiTextSplitter(api_key=api_key, mode=mode)
     return splitter.split_text_by_patients(text, return_metadata=return_metadata)
@@ -0,0 +1,159 @@
+# src/patient_extraction/local_splitter.py
+"""
+Module tách văn bản nhiều bệnh nhân tại chỗ (không gọi Gemini), dựa trên entity PATIENT_ID.
+Chạy NER một lần trên toàn văn bản; câu mở đầu bằng mã bệnh nhân mới bắt đầu một đoạn,
+các câu còn lại thuộc về bệnh nhân gần nhất phía trước. Khi cấu trúc không rõ ràng,
+trả về None để gọi Gemini thay thế.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import re
+import logging
+
+from src import config as ner_config
+from src.text_processor import split_sentences
+
+# Get logger
+logger = logging.getLogger("ner_api")
+
+# Phần đứng trước PATIENT_ID trong câu để mã đó là mốc bắt đầu bệnh nhân mới
+# ("BN101, nam...", "2. Bệnh nhân 567:", "- Ca bệnh thứ 3 (BN103)"); ở vị trí khác
+# mã bệnh nhân chỉ là nhắc tới người khác ("là F1 của BN55")
+_ANCHOR_PREFIX = re.compile(
+    r'^[\W\d_]*((bệnh nhân|ca bệnh|ca|trường hợp)(\s+(số|thứ))?\s*\d*)?[\s:(\-–]*$',
+    re.IGNORECASE
+)
+
+
+class LocalPatientSplitter:
+    """
+    Splitter dùng PATIENT_ID làm mốc: nhanh (chỉ một lần NER), không cần mạng,
+    áp dụng cho bản tin mà mỗi bệnh nhân mở đầu bằng mã của mình ("BN1234", "Bệnh nhân 567").
+    """
+
+    def __init__(self, predictor, min_confidence: float = None):
+        """
+        Khởi tạo splitter
+
+        Args:
+            predictor: NERPredictor (hoặc object có predict tương tự)
+            min_confidence: Độ tin cậy tối thiểu của mỗi PATIENT_ID (mặc định LOCAL_SPLITTER_MIN_CONFIDENCE)
+        """
+        self.predictor = predictor
+        self.min_confidence = ner_config.LOCAL_SPLITTER_MIN_CONFIDENCE if min_confidence is None else min_confidence
+
+    def split_text_by_patients(self, text: str, entities: List[Dict] = None, return_metadata: bool = False):
+        """
+        Tách văn bản thành các đoạn, mỗi đoạn cho 1 bệnh nhân
+
+        Args:
+            text: Văn bản đầu vào
+            entities: NER results của text nếu đã có (None = chạy predictor.predict)
+            return_metadata: Có trả về metadata không
+
+        Returns:
+            List[str] (hoặc Tuple[List[str], dict] nếu return_metadata=True);
+            segments là None nếu cấu trúc không rõ ràng (metadata['reason'] ghi lý do)
+        """
+        if entities is None:
+            entities = self.predictor.predict(text)
+        spans, reason = self.find_segments(text, entities)
+
+        if spans is None:
+            logger.info(f"Local splitter: ambiguous structure ({reason})")
+            segments = None
+        else:
+            segments = [text[start:end].strip() for start, end in spans]
+            logger.info(f"Local splitter: {len(segments)} segment(s) from PATIENT_ID anchors")
+
+        if return_metadata:
+            metadata = {
+                'original_length': len(text),
+                'num_segments': len(segments) if segments else 0,
+                'method': 'local'
+            }
+            if reason:
+                metadata['reason'] = reason
+            return segments, metadata
+        return segments
+
+    def find_segments(self, text: str, entities: List[Dict]) -> Tuple[Optional[List[Tuple[int, int]]], Optional[str]]:
+        """
+        Xác định khoảng [start, end) của từng bệnh nhân từ entities của toàn văn bản
+
+        Args:
+            text: Văn bản gốc
+            entities: NER results của text
+
+        Returns:
+            Tuple (spans, reason): spans là None nếu không tách được, reason mô tả lý do
+        """
+        patient_ids = sorted((e for e in entities if e['tag'] == 'PATIENT_ID'), key=lambda e: e['start'])
+        if not patient_ids:
+            return None, "không có PATIENT_ID"
+
+        uncertain = [e['text'] for e in patient_ids if e.get('confidence', 1.0) < self.min_confidence]
+        if uncertain:
+            return None, f"PATIENT_ID có độ tin cậy thấp: {uncertain}"
+
+        starts = []  # Vị trí bắt đầu đoạn của từng bệnh nhân
+        seen = set()
+        current = None
+        lead_start = None  # Bắt đầu chuỗi "câu" chỉ gồm số thứ tự / ký hiệu ngay trước câu hiện tại ("2.")
+        for sentence_start, sentence_end in split_sentences(text):
+            sentence = text[sentence_start:sentence_end]
+            if not any(char.isalpha() for char in sentence):
+                lead_start = sentence_start if lead_start is None else lead_start
+                continue
+            anchor_start = sentence_start if lead_start is None else lead_start
+            lead_start = None
+
+            mentions = [e for e in patient_ids if sentence_start <= e['start'] < sentence_end]
+            if not mentions or not _ANCHOR_PREFIX.match(text[sentence_start:mentions[0]['start']]):
+                continue  # Câu thuộc về bệnh nhân hiện tại
+
+            patient = self._normalize_id(mentions[0]['text'])
+            if patient == current:
+                continue
+            if patient in seen:
+                # Văn bản quay lại bệnh nhân đã có đoạn riêng (thông tin xen kẽ)
+                return None, f"thông tin của {mentions[0]['text']} nằm ở nhiều đoạn"
+            seen.add(patient)
+            current = patient
+            starts.append(anchor_start)
+
+        if not starts:
+            return None, "không có câu nào mở đầu bằng PATIENT_ID"
+
+        # Phần mở đầu trước mốc đầu tiên thuộc về bệnh nhân đầu tiên
+        starts[0] = 0
+        return list(zip(starts, starts[1:] + [len(text)])), None
+
+    @staticmethod
+    def _normalize_id(patient_id: str) -> str:
+        """Chuẩn hóa mã bệnh nhân để so sánh ("BN1234", "bệnh nhân 1234" -> "1234")"""
+        digits = re.sub(r'\D', '', patient_id)
+        return digits or patient_id.strip().lower()
+
+
+def split_text_locally(
+    text: str,
+    predictor,
+    entities: List[Dict] = None,
+    return_metadata: bool = False
+):
+    """
+    Helper function để tách văn bản theo PATIENT_ID (không gọi Gemini)
+
+    Args:
+        text: Văn bản cần tách
+        predictor: NERPredictor
+        entities: NER results của text nếu đã có
+        return_metadata: Có trả về metadata không
+
+    Returns:
+        List[str] hoặc None nếu cấu trúc không rõ ràng (khi đó nên dùng split_text_with_gemini);
+        Tuple (segments, metadata) nếu return_metadata=True
+    """
+    splitter = LocalPatientSplitter(predictor)
+    return splitter.split_text_by_patients(text, entities=entities, return_metadata=return_metadata)
@@ -4,9 +4,13 @@ Module xử lý trích xuất thông tin bệnh nhân từ NER results (Manual M
 Không sử dụng rule-based anchors/zones, chỉ đơn giản group entities theo loại
 """
 
-from typing import List, Dict
+from typing import List, Dict, Union
+import logging
 from .entity_structures import Entity, PatientRecord
 
+# Get logger
+logger = logging.getLogger("ner_api")
+
 
 class ManualPatientExtractor:
     """
@@ -480,3 +484,60 @@ def extract_single_patient(ner_results: List[Dict], raw_text: str = "") -> Patie
     """
     extractor = ManualPatientExtractor()
     return extractor.extract_from_ner_results(ner_results, raw_text)
+
+
+def predict_segments(predictor, segments: List[str]) -> List[Union[List[Dict], Exception]]:
+    """
+    NER cho nhiều segment bằng một lần predictor.predict_batch (thay vì predict từng segment)
+    
+    Nếu cả batch lỗi, chạy lại từng segment để lỗi chỉ ảnh hưởng segment gây lỗi.
+    
+    Args:
+        predictor: NERPredictor (hoặc object có predict / predict_batch tương tự)
+        segments: Danh sách văn bản
+        
+    Returns:
+        List cùng thứ tự với segments: NER results, hoặc Exception nếu segment đó lỗi
+    """
+    try:
+        return predictor.predict_batch(segments)
+    except Exception:
+        logger.warning(f"Batch NER failed for {len(segments)} segment(s), retrying one segment at a time",
+                       exc_info=True)
+    
+    results = []
+    for segment in segments:
+        try:
+            results.append(predictor.predict(segment))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def extract_patients(
+    ner_results_list: List[Union[List[Dict], Exception]],
+    raw_texts: List[str]
+) -> List[Union[PatientRecord, Exception]]:
+    """
+    Trích xuất bệnh nhân cho nhiều segment, lần lượt từng segment
+    
+    Trích xuất là Python thuần (giữ GIL) và chỉ mất vài mili giây mỗi segment, nên chạy tuần tự;
+    lỗi của một segment không ảnh hưởng các segment khác.
+    
+    Args:
+        ner_results_list: NER results của từng segment (Exception nếu NER của segment đó lỗi)
+        raw_texts: Văn bản gốc của từng segment
+        
+    Returns:
+        List cùng thứ tự với raw_texts: PatientRecord, hoặc Exception nếu segment đó lỗi
+    """
+    results = []
+    for ner_results, raw_text in zip(ner_results_list, raw_texts):
+        if isinstance(ner_results, Exception):
+            results.append(ner_results)
+            continue
+        try:
+            results.append(extract_single_patient(ner_results, raw_text))
+        except Exception as e:
+            results.append(e)
+    return results
@@ -0,0 +1,82 @@
+# src/patient_extraction/segment_alignment.py
+"""
+Module căn các đoạn văn bản (do Gemini / splitter trả về) về vị trí ký tự trong văn bản gốc,
+để dùng lại NER results của toàn văn bản cho từng đoạn thay vì chạy NER lại.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+
+def _collapse_whitespace(text: str) -> Tuple[str, List[int]]:
+    """
+    Gộp các khoảng trắng liên tiếp thành một dấu cách
+
+    Returns:
+        Tuple (văn bản đã gộp, vị trí trong văn bản gốc của từng ký tự)
+    """
+    chars = []
+    positions = []
+    for index, char in enumerate(text):
+        if char.isspace():
+            if not chars or chars[-1] == ' ':
+                continue
+            char = ' '
+        chars.append(char)
+        positions.append(index)
+    return ''.join(chars), positions
+
+
+def align_segments(text: str, segments: List[str]) -> List[Optional[Tuple[int, int]]]:
+    """
+    Tìm khoảng [start, end) trong văn bản gốc của từng đoạn
+
+    Đoạn được tìm nguyên văn (ưu tiên sau đoạn trước, rồi trên toàn văn bản), sau đó bỏ qua
+    khác biệt về khoảng trắng / xuống dòng. Đoạn đã bị viết lại không khớp được.
+
+    Args:
+        text: Văn bản gốc
+        segments: Các đoạn văn bản
+
+    Returns:
+        List cùng thứ tự với segments: (start, end), hoặc None nếu không khớp được
+    """
+    collapsed_text, positions = _collapse_whitespace(text)
+    spans = []
+    cursor = 0
+    for segment in segments:
+        segment = segment.strip()
+        span = None
+        if segment:
+            start = text.find(segment, cursor)
+            if start < 0:
+                start = text.find(segment)
+            if start >= 0:
+                span = (start, start + len(segment))
+            else:
+                collapsed_segment = _collapse_whitespace(segment)[0]
+                start = collapsed_text.find(collapsed_segment)
+                if start >= 0:
+                    span = (positions[start], positions[start + len(collapsed_segment) - 1] + 1)
+        if span is not None:
+            cursor = span[1]
+        spans.append(span)
+    return spans
+
+
+def entities_in_span(entities: List[Dict], start: int, end: int) -> List[Dict]:
+    """
+    Lấy các entity nằm trọn trong [start, end) của văn bản gốc, vị trí tính lại theo đoạn
+
+    Args:
+        entities: NER results của văn bản gốc
+        start: Vị trí bắt đầu của đoạn
+        end: Vị trí kết thúc của đoạn
+
+    Returns:
+        List of NER result dicts (bản sao) với start/end tương đối so với đoạn
+    """
+    return [
+        {**entity, 'start': entity['start'] - start, 'end': entity['end'] - start}
+        for entity in entities
+        if entity['start'] >= start and entity['end'] <= end
+    ]
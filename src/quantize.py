@@ -0,0 +1,125 @@
+# src/quantize.py
+#
+# Script để tạo model int8 (lượng tử hóa động các lớp Linear của PhoBERT) cho suy luận trên CPU.
+# Script này sẽ:
+# 1. Tải model fp32 đã huấn luyện và lượng tử hóa động sang int8.
+# 2. Đánh giá cả hai model bằng seqeval trên cùng một tập dữ liệu (như src/evaluate.py).
+# 3. Chỉ lưu file int8 cạnh checkpoint fp32 nếu F1 giảm không quá config.QUANTIZATION_MAX_F1_DROP.
+#
+# Cách dùng:
+#   python src/quantize.py
+#   python src/quantize.py --eval-file data/raw/PhoNER_COVID19/dev_word.json --max-f1-drop 0.005
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import torch
+from torch.utils.data import DataLoader
+from transformers import AutoTokenizer, AutoModelForTokenClassification
+from seqeval.metrics import f1_score
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import các module tự định nghĩa
+import config
+from dataset import NerDataset
+from evaluate import predict_tags
+from src.inference import checkpoint_signature, quantize_dynamic_int8
+
+
+def state_dict_size(model: torch.nn.Module) -> int:
+    """Kích thước (byte) của state_dict khi serialize - xấp xỉ bộ nhớ trọng số của model."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def score_model(model: torch.nn.Module, dataloader: DataLoader) -> tuple:
+    """
+    Tính F1 (micro, seqeval) và thời gian chạy của model trên CPU.
+
+    Returns:
+        tuple: (f1, số giây chạy hết dataloader)
+    """
+    start = time.perf_counter()
+    all_labels, all_preds = predict_tags(model, dataloader, torch.device("cpu"))
+    return f1_score(all_labels, all_preds), time.perf_counter() - start
+
+
+def run_quantization(model_dir: str = config.MODEL_OUTPUT_DIR, eval_file: str = config.TEST_FILE,
+                     max_f1_drop: float = config.QUANTIZATION_MAX_F1_DROP) -> bool:
+    """
+    Lượng tử hóa model, kiểm tra F1 và lưu file int8 nếu đạt ngưỡng.
+
+    Args:
+        model_dir (str): Thư mục chứa checkpoint fp32.
+        eval_file (str): File JSON Lines dùng để đánh giá.
+        max_f1_drop (float): Mức giảm F1 tối đa cho phép.
+
+    Returns:
+        bool: True nếu file int8 đã được lưu.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForTokenClassification.from_pretrained(model_dir)
+    model.eval()
+
+    eval_dataset = NerDataset(
+        file_path=eval_file,
+        tokenizer=tokenizer,
+        max_len=config.MAX_LEN,
+        tags_to_ids=config.TAGS_TO_IDS
+    )
+    eval_dataloader = DataLoader(eval_dataset, batch_size=config.VALID_BATCH_SIZE)
+
+    print("Đánh giá model fp32...")
+    fp32_f1, fp32_seconds = score_model(model, eval_dataloader)
+    fp32_size = state_dict_size(model)
+
+    print("Lượng tử hóa động int8 các lớp Linear...")
+    quantized_model = quantize_dynamic_int8(model)
+    print("Đánh giá model int8...")
+    int8_f1, int8_seconds = score_model(quantized_model, eval_dataloader)
+    int8_size = state_dict_size(quantized_model)
+
+    f1_drop = fp32_f1 - int8_f1
+    passed = f1_drop <= max_f1_drop
+
+    print("\n--- Quantization Report ---")
+    print(f"Eval file:    {eval_file} ({len(eval_dataset)} câu)")
+    print(f"F1 fp32:      {fp32_f1:.4f}")
+    print(f"F1 int8:      {int8_f1:.4f} (giảm {f1_drop:.4f}, tối đa {max_f1_drop})")
+    print(f"Weights:      {fp32_size / 2**20:.1f} MB -> {int8_size / 2**20:.1f} MB")
+    print(f"Eval time:    {fp32_seconds:.2f}s -> {int8_seconds:.2f}s")
+
+    quantized_path = os.path.join(model_dir, config.QUANTIZED_MODEL_FILE)
+    if not passed:
+        print(f"Result:       FAIL - không lưu {quantized_path}")
+        return False
+
+    torch.save({
+        "state_dict": quantized_model.state_dict(),
+        "checkpoint_signature": checkpoint_signature(model_dir),
+        "f1_fp32": fp32_f1,
+        "f1_int8": int8_f1,
+    }, quantized_path)
+    print(f"Result:       PASS - đã lưu model int8 tại: {quantized_path}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lượng tử hóa int8 model NER với ngưỡng F1.")
+    parser.add_argument("--model-dir", default=config.MODEL_OUTPUT_DIR, help="Thư mục model fp32")
+    parser.add_argument("--eval-file", default=config.TEST_FILE, help="File JSON Lines dùng để đánh giá")
+    parser.add_argument("--max-f1-drop", type=float, default=config.QUANTIZATION_MAX_F1_DROP,
+                        help="Mức giảm F1 tối đa cho phép")
+    args = parser.parse_args()
+
+    passed = run_quantization(args.model_dir, args.eval_file, args.max_f1_drop)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# src/result_cache.py
+#
+# Module này định nghĩa bộ nhớ đệm LRU cho kết quả NER của NERPredictor.
+# Crawler và Chrome Extension thường gửi lại đúng cùng một bài báo / trang web, bộ nhớ đệm
+# giúp bỏ qua toàn bộ bước tách từ và chạy model cho các văn bản đã xử lý.
+
+import copy
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def make_cache_key(text: str, *parts) -> str:
+    """
+    Tạo khóa cache từ văn bản và các thông tin khác ảnh hưởng tới kết quả (model, tham số).
+
+    Văn bản được dùng nguyên dạng (không chuẩn hóa khoảng trắng / Unicode) vì vị trí
+    start/end của entity được tính trên chính văn bản đó.
+
+    Args:
+        text (str): Văn bản đầu vào.
+        *parts: Các giá trị khác cần đưa vào khóa (chuyển sang str).
+
+    Returns:
+        str: Mã SHA-256 dạng hex.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def approximate_size(entities: List[Dict[str, any]]) -> int:
+    """Ước lượng bộ nhớ (byte) của một danh sách entity (dict) hoặc chuỗi."""
+    size = sys.getsizeof(entities)
+    for entity in entities:
+        size += sys.getsizeof(entity)
+        if isinstance(entity, dict):
+            size += sum(sys.getsizeof(value) for value in entity.values())
+    return size
+
+
+class ResultCache:
+    """
+    Bộ nhớ đệm LRU (an toàn đa luồng) giới hạn theo số phần tử, dung lượng ước lượng và TTL.
+    """
+    def __init__(self, max_entries: int, max_bytes: int = None, ttl: float = None):
+        """
+        Hàm khởi tạo.
+
+        Args:
+            max_entries (int): Số kết quả tối đa được giữ.
+            max_bytes (int): Tổng dung lượng ước lượng tối đa (None = không giới hạn).
+            ttl (float): Thời gian sống của mỗi kết quả, tính bằng giây (None = không hết hạn).
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # khóa -> (entities, dung lượng, thời điểm lưu)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[List[Dict[str, any]]]:
+        """
+        Lấy kết quả đã lưu (bản sao) theo khóa.
+
+        Returns:
+            Danh sách entity, hoặc None nếu không có hoặc đã hết hạn.
+        """
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[2] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(item[0])
+
+    def put(self, key: str, entities: List[Dict[str, any]]) -> None:
+        """Lưu kết quả (bản sao) và loại các kết quả ít dùng nhất nếu vượt giới hạn."""
+        size = approximate_size(entities)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        entities = copy.deepcopy(entities)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (entities, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Xóa toàn bộ kết quả đã lưu (giữ nguyên các bộ đếm)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, any]:
+        """Các bộ đếm của cache để theo dõi (hit/miss/eviction, số phần tử, dung lượng)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def _remove(self, key: str) -> None:
+        """Xóa một phần tử (gọi khi đang giữ lock)."""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
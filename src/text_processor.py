@@ -4,7 +4,9 @@
 # bao gồm tách từ (word segmentation) sử dụng VnCoreNLP.
 
 import os
-from typing import Optional
+import re
+import threading
+from typing import List, Optional, Tuple
 import sys
 
 # Thêm thư mục src vào sys.path
@@ -12,6 +14,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import config
 
+# Ranh giới câu trong văn bản gốc: xuống dòng, hoặc khoảng trắng sau dấu kết thúc câu
+_SENTENCE_BREAK = re.compile(r'\s*\n\s*|(?<=[.!?])\s+')
+
 
 class VietnameseTextProcessor:
     """
@@ -20,6 +25,8 @@ class VietnameseTextProcessor:
     """
     
     _instance = None
+    # VnCoreNLP (JVM) không an toàn khi gọi đồng thời từ nhiều luồng
+    _segment_lock = threading.Lock()
     
     def __new__(cls):
         """
@@ -95,7 +102,8 @@ class VietnameseTextProcessor:
             return text
         
         try:
-            segmented_result = self.word_segmenter.word_segment(text)
+            with self._segment_lock:
+                segmented_result = self.word_segmenter.word_segment(text)
             
             if not segmented_result:
                 return text
@@ -145,3 +153,43 @@ def segment_vietnamese_text(text: str) -> Optional[str]:
     """
     processor = get_text_processor()
     return processor.segment_text(text)
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """
+    Chia văn bản gốc (chưa segment) thành các câu theo ký tự.
+
+    Câu kết thúc tại dấu xuống dòng, hoặc tại dấu chấm / chấm hỏi / chấm than theo sau bởi
+    khoảng trắng, trừ khi từ đứng trước là chữ viết tắt viết hoa tối đa 3 chữ cái (ví dụ "TP.", "Q.", "BS.").
+    Chỉ dùng regex và thư viện chuẩn, nên các module khác (splitter bệnh nhân...) dùng được
+    mà không cần tải model.
+
+    Args:
+        text (str): Văn bản gốc.
+
+    Returns:
+        List[Tuple[int, int]]: Khoảng [start, end) của từng câu (đã bỏ khoảng trắng hai đầu).
+    """
+    spans = []
+    start = 0
+    for match in _SENTENCE_BREAK.finditer(text):
+        if '\n' not in match.group() and text[match.start() - 1] == '.':
+            # Từ đứng ngay trước dấu ngắt: quét ngược tới khoảng trắng gần nhất (không sao chép phần đầu văn bản)
+            word_start = match.start()
+            while word_start > 0 and not text[word_start - 1].isspace():
+                word_start -= 1
+            abbreviation = text[word_start:match.start() - 1]
+            if abbreviation.isalpha() and abbreviation.isupper() and len(abbreviation) <= 3:
+                continue
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+
+    sentences = []
+    for span_start, span_end in spans:
+        sentence = text[span_start:span_end]
+        stripped = sentence.strip()
+        if stripped:
+            span_start += len(sentence) - len(sentence.lstrip())
+            sentences.append((span_start, span_start + len(stripped)))
+    return sentences
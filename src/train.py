@@ -7,19 +7,33 @@
 # 3. Tải mô hình PhoBERT đã được huấn luyện trước.
 # 4. Thực hiện vòng lặp huấn luyện và đánh giá.
 # 5. Lưu lại checkpoint của mô hình tốt nhất.
+#
+# Chế độ distillation (`python src/train.py --distill`) huấn luyện một student nhỏ hơn
+# khớp với logits của model đã fine-tune (teacher) trên PhoNER và văn bản bản tin không nhãn.
+# Chế độ early exit (`python src/train.py --early-exit`) huấn luyện các exit head sau một số
+# encoder layer của model đã fine-tune (backbone giữ nguyên).
 
 import os
+import sys
+import copy
+import argparse
 import torch
+import torch.nn.functional as F
 import numpy as np
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, ConcatDataset
 from torch.optim import AdamW
 from transformers import AutoTokenizer, AutoModelForTokenClassification, get_linear_schedule_with_warmup
 from tqdm import tqdm
 from seqeval.metrics import f1_score, precision_score, recall_score
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # Import các module tự định nghĩa
 import config
-from dataset import NerDataset
+from dataset import NerDataset, UnlabeledTextDataset, DistillationDataset
+from early_exit import EarlyExitHeads
+from text_processor import get_text_processor
+from src.inference import checkpoint_signature
 
 def set_seed(seed_value):
     """Set seed for reproducibility."""
@@ -172,5 +186,370 @@ def run_training():
     print(f"Model saved to {config.MODEL_OUTPUT_DIR}")
 
 
+def file_signature(paths):
+    """Chữ ký (kích thước, thời gian sửa đổi) của các file, dùng để kiểm tra cache còn hợp lệ."""
+    signature = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def compute_teacher_logits(teacher, dataset, device):
+    """
+    Tính logits của teacher cho từng câu của dataset.
+
+    Returns:
+        list: Logits (float16) của từng câu, chỉ gồm các token thật (bỏ padding).
+    """
+    teacher.eval()
+    dataloader = DataLoader(dataset, batch_size=config.VALID_BATCH_SIZE)
+    all_logits = []
+
+    with torch.no_grad():
+        for batch in tqdm(dataloader, desc="Teacher logits"):
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+
+            logits = teacher(input_ids=input_ids, attention_mask=attention_mask).logits.cpu().half()
+            for row, length in enumerate(attention_mask.sum(dim=1).tolist()):
+                all_logits.append(logits[row, :length].clone())
+
+    return all_logits
+
+
+def load_or_compute_teacher_logits(teacher, datasets, signature, device):
+    """
+    Đọc logits của teacher từ cache, hoặc tính mới và lưu cache nếu teacher/dữ liệu đã thay đổi.
+
+    Args:
+        teacher: Model teacher.
+        datasets (dict): Tên -> dataset cần tính logits.
+        signature (dict): Chữ ký của checkpoint teacher và các file dữ liệu.
+        device (torch.device): Thiết bị chạy teacher.
+
+    Returns:
+        dict: Tên dataset -> danh sách logits của từng câu.
+    """
+    if os.path.exists(config.TEACHER_LOGITS_CACHE):
+        cached = torch.load(config.TEACHER_LOGITS_CACHE)
+        if cached.get('signature') == signature and set(cached['logits']) == set(datasets):
+            print(f"Loaded teacher logits from cache: {config.TEACHER_LOGITS_CACHE}")
+            return cached['logits']
+        print("Teacher logits cache is stale, recomputing...")
+
+    teacher_logits = {name: compute_teacher_logits(teacher, dataset, device) for name, dataset in datasets.items()}
+    os.makedirs(os.path.dirname(config.TEACHER_LOGITS_CACHE), exist_ok=True)
+    torch.save({'signature': signature, 'logits': teacher_logits}, config.TEACHER_LOGITS_CACHE)
+    print(f"Saved teacher logits to {config.TEACHER_LOGITS_CACHE}")
+    return teacher_logits
+
+
+def build_student(teacher):
+    """
+    Tạo student nhỏ hơn teacher theo cấu hình STUDENT_* trong config.py.
+
+    Nếu student giữ hidden size của teacher, embeddings, classifier và các layer của student
+    được khởi tạo từ các layer cách đều của teacher; ngược lại student được khởi tạo ngẫu nhiên.
+    """
+    student_config = copy.deepcopy(teacher.config)
+    student_config.num_hidden_layers = config.STUDENT_NUM_LAYERS
+
+    same_width = config.STUDENT_HIDDEN_SIZE in (None, teacher.config.hidden_size)
+    if not same_width:
+        student_config.hidden_size = config.STUDENT_HIDDEN_SIZE
+        student_config.num_attention_heads = config.STUDENT_NUM_ATTENTION_HEADS or max(1, config.STUDENT_HIDDEN_SIZE // 64)
+        student_config.intermediate_size = config.STUDENT_INTERMEDIATE_SIZE or 4 * config.STUDENT_HIDDEN_SIZE
+
+    student = AutoModelForTokenClassification.from_config(student_config)
+
+    if same_width:
+        teacher_layers = teacher.base_model.encoder.layer
+        picked = np.linspace(0, len(teacher_layers) - 1, config.STUDENT_NUM_LAYERS).round().astype(int)
+        print(f"Initializing student layers from teacher layers {picked.tolist()}")
+        student.base_model.embeddings.load_state_dict(teacher.base_model.embeddings.state_dict())
+        for student_index, teacher_index in enumerate(picked):
+            student.base_model.encoder.layer[student_index].load_state_dict(teacher_layers[teacher_index].state_dict())
+        student.classifier.load_state_dict(teacher.classifier.state_dict())
+
+    return student
+
+
+def distillation_loss(student_logits, teacher_logits, labels, attention_mask,
+                      temperature=config.DISTILL_TEMPERATURE, alpha=config.DISTILL_ALPHA):
+    """
+    Loss distillation: KL giữa phân phối đã làm mềm của student và teacher trên mọi token thật,
+    cộng cross-entropy với nhãn thật trên các token có nhãn (câu không nhãn chỉ có phần KL).
+    """
+    mask = attention_mask.bool()
+    soft_loss = F.kl_div(
+        F.log_softmax(student_logits[mask] / temperature, dim=-1),
+        F.softmax(teacher_logits[mask] / temperature, dim=-1),
+        reduction='batchmean'
+    ) * temperature ** 2
+
+    labeled = labels != config.SUBWORD_TAG_ID
+    if labeled.any():
+        hard_loss = F.cross_entropy(student_logits[labeled], labels[labeled])
+    else:
+        hard_loss = student_logits.new_zeros(())
+
+    return alpha * soft_loss + (1 - alpha) * hard_loss
+
+
+def distill_one_epoch(student, dataloader, optimizer, scheduler, device):
+    """Thực hiện distillation trong một epoch."""
+    student.train()
+    total_loss = 0
+
+    for batch in tqdm(dataloader, desc="Distilling"):
+        input_ids = batch['input_ids'].to(device)
+        attention_mask = batch['attention_mask'].to(device)
+        labels = batch['labels'].to(device)
+        teacher_logits = batch['teacher_logits'].to(device)
+
+        optimizer.zero_grad()
+
+        student_logits = student(input_ids=input_ids, attention_mask=attention_mask).logits
+        loss = distillation_loss(student_logits, teacher_logits, labels, attention_mask)
+        total_loss += loss.item()
+
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(student.parameters(), 1.0) # Gradient clipping
+        optimizer.step()
+        scheduler.step()
+
+    return total_loss / len(dataloader)
+
+
+def run_distillation():
+    """Hàm chính để huấn luyện student model bằng knowledge distillation."""
+    # --- 1. Thiết lập ---
+    set_seed(config.RANDOM_SEED)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+
+    os.makedirs(config.STUDENT_MODEL_OUTPUT_DIR, exist_ok=True)
+
+    # --- 2. Tải Tokenizer và Teacher (model đã fine-tune) ---
+    tokenizer = AutoTokenizer.from_pretrained(config.MODEL_OUTPUT_DIR)
+    teacher = AutoModelForTokenClassification.from_pretrained(config.MODEL_OUTPUT_DIR)
+    teacher.to(device)
+
+    # --- 3. Chuẩn bị Dữ liệu (PhoNER + bản tin không nhãn nếu có) ---
+    datasets = {
+        'train': NerDataset(
+            file_path=config.TRAIN_FILE,
+            tokenizer=tokenizer,
+            max_len=config.MAX_LEN,
+            tags_to_ids=config.TAGS_TO_IDS
+        )
+    }
+    dev_dataset = NerDataset(
+        file_path=config.DEV_FILE,
+        tokenizer=tokenizer,
+        max_len=config.MAX_LEN,
+        tags_to_ids=config.TAGS_TO_IDS
+    )
+
+    if os.path.exists(config.UNLABELED_TEXT_FILE):
+        text_processor = get_text_processor()
+        segment_fn = None
+        if text_processor.is_available():
+            segment_fn = lambda line: text_processor.segment_text(line) or line
+        datasets['unlabeled'] = UnlabeledTextDataset(
+            file_path=config.UNLABELED_TEXT_FILE,
+            tokenizer=tokenizer,
+            max_len=config.MAX_LEN,
+            tags_to_ids=config.TAGS_TO_IDS,
+            segment_fn=segment_fn
+        )
+        print(f"Unlabeled sentences: {len(datasets['unlabeled'])}")
+    else:
+        print(f"Không tìm thấy {config.UNLABELED_TEXT_FILE}, chỉ dùng dữ liệu có nhãn.")
+
+    # --- 4. Logits của Teacher (tính một lần, lưu cache) ---
+    signature = {
+        'teacher': checkpoint_signature(config.MODEL_OUTPUT_DIR),
+        'data': file_signature([config.TRAIN_FILE, config.UNLABELED_TEXT_FILE]),
+        'max_len': config.MAX_LEN
+    }
+    teacher_logits = load_or_compute_teacher_logits(teacher, datasets, signature, device)
+
+    distill_dataset = ConcatDataset([DistillationDataset(dataset, teacher_logits[name])
+                                     for name, dataset in datasets.items()])
+    distill_dataloader = DataLoader(distill_dataset, batch_size=config.TRAIN_BATCH_SIZE, shuffle=True)
+    dev_dataloader = DataLoader(dev_dataset, batch_size=config.VALID_BATCH_SIZE)
+
+    # --- 5. Tạo Student ---
+    student = build_student(teacher)
+    student.to(device)
+    teacher_params = sum(p.numel() for p in teacher.parameters())
+    student_params = sum(p.numel() for p in student.parameters())
+    print(f"Teacher: {teacher_params / 1e6:.1f}M params | Student: {student_params / 1e6:.1f}M params")
+    del teacher
+
+    # --- 6. Optimizer và Scheduler ---
+    optimizer = AdamW(student.parameters(), lr=config.DISTILL_LEARNING_RATE)
+    num_training_steps = len(distill_dataloader) * config.DISTILL_EPOCHS
+    scheduler = get_linear_schedule_with_warmup(
+        optimizer,
+        num_warmup_steps=0,
+        num_training_steps=num_training_steps
+    )
+
+    # --- 7. Vòng lặp Distillation ---
+    best_f1 = 0
+    for epoch in range(config.DISTILL_EPOCHS):
+        print(f"\n--- Epoch {epoch + 1}/{config.DISTILL_EPOCHS} ---")
+
+        train_loss = distill_one_epoch(student, distill_dataloader, optimizer, scheduler, device)
+        print(f"Distillation Loss: {train_loss:.4f}")
+
+        val_loss, val_f1, val_precision, val_recall = evaluate(student, dev_dataloader, device, config.IDS_TO_TAGS)
+        print(f"Validation Loss: {val_loss:.4f}")
+        print(f"Validation F1: {val_f1:.4f} | Precision: {val_precision:.4f} | Recall: {val_recall:.4f}")
+
+        # Lưu lại student tốt nhất (cùng định dạng với teacher để NERPredictor tải trực tiếp)
+        if val_f1 > best_f1:
+            best_f1 = val_f1
+            print(f"New best F1 score: {best_f1:.4f}. Saving student...")
+            student.save_pretrained(config.STUDENT_MODEL_OUTPUT_DIR)
+            tokenizer.save_pretrained(config.STUDENT_MODEL_OUTPUT_DIR)
+
+    print("\nDistillation finished!")
+    print(f"Best F1 score on validation set: {best_f1:.4f}")
+    print(f"Student saved to {config.STUDENT_MODEL_OUTPUT_DIR}")
+
+
+def exit_heads_loss(heads, hidden_states, labels):
+    """Trung bình cross-entropy của các exit head (bỏ qua token có nhãn -100)."""
+    losses = []
+    for layer in heads.exit_layers:
+        logits = heads(layer, hidden_states[layer])
+        losses.append(F.cross_entropy(logits.view(-1, logits.shape[-1]), labels.view(-1),
+                                      ignore_index=config.SUBWORD_TAG_ID))
+    return torch.stack(losses).mean()
+
+
+def evaluate_exit_heads(model, heads, dataloader, device, ids_to_tags):
+    """Tính F1 (seqeval) của từng exit head trên tập validation."""
+    heads.eval()
+    all_preds = {layer: [] for layer in heads.exit_layers}
+    all_labels = []
+
+    with torch.no_grad():
+        for batch in tqdm(dataloader, desc="Evaluating exit heads"):
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+            true_labels = batch['labels'].numpy()
+
+            hidden_states = model(input_ids=input_ids, attention_mask=attention_mask,
+                                  output_hidden_states=True).hidden_states
+
+            for i in range(len(true_labels)):
+                all_labels.append([ids_to_tags[l] for l in true_labels[i] if l != config.SUBWORD_TAG_ID])
+            for layer in heads.exit_layers:
+                predictions = torch.argmax(heads(layer, hidden_states[layer]), dim=-1).cpu().numpy()
+                for i in range(len(true_labels)):
+                    all_preds[layer].append([ids_to_tags[p] for p, l in zip(predictions[i], true_labels[i])
+                                             if l != config.SUBWORD_TAG_ID])
+
+    return {layer: f1_score(all_labels, preds) for layer, preds in all_preds.items()}
+
+
+def run_early_exit_training():
+    """Hàm chính để huấn luyện các exit head trên model đã fine-tune."""
+    # --- 1. Thiết lập ---
+    set_seed(config.RANDOM_SEED)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+
+    # --- 2. Tải Tokenizer và Model đã fine-tune (backbone được giữ nguyên) ---
+    tokenizer = AutoTokenizer.from_pretrained(config.MODEL_OUTPUT_DIR)
+    model = AutoModelForTokenClassification.from_pretrained(config.MODEL_OUTPUT_DIR)
+    model.to(device)
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad = False
+
+    exit_layers = [layer for layer in config.EARLY_EXIT_LAYERS if layer < model.config.num_hidden_layers]
+    if not exit_layers:
+        print(f"Lỗi: Không có layer nào trong EARLY_EXIT_LAYERS={config.EARLY_EXIT_LAYERS} "
+              f"nhỏ hơn số layer của model ({model.config.num_hidden_layers}).")
+        return
+    heads = EarlyExitHeads(model.config.hidden_size, model.config.num_labels, exit_layers)
+    heads.to(device)
+    print(f"Training exit heads after layers {exit_layers} (model has {model.config.num_hidden_layers} layers)")
+
+    # --- 3. Chuẩn bị Dữ liệu ---
+    train_dataset = NerDataset(
+        file_path=config.TRAIN_FILE,
+        tokenizer=tokenizer,
+        max_len=config.MAX_LEN,
+        tags_to_ids=config.TAGS_TO_IDS
+    )
+    dev_dataset = NerDataset(
+        file_path=config.DEV_FILE,
+        tokenizer=tokenizer,
+        max_len=config.MAX_LEN,
+        tags_to_ids=config.TAGS_TO_IDS
+    )
+
+    train_dataloader = DataLoader(train_dataset, batch_size=config.TRAIN_BATCH_SIZE, shuffle=True)
+    dev_dataloader = DataLoader(dev_dataset, batch_size=config.VALID_BATCH_SIZE)
+
+    # --- 4. Optimizer ---
+    optimizer = AdamW(heads.parameters(), lr=config.EARLY_EXIT_LEARNING_RATE)
+
+    # --- 5. Vòng lặp Huấn luyện ---
+    best_f1 = 0
+    for epoch in range(config.EARLY_EXIT_EPOCHS):
+        print(f"\n--- Epoch {epoch + 1}/{config.EARLY_EXIT_EPOCHS} ---")
+
+        heads.train()
+        total_loss = 0
+        for batch in tqdm(train_dataloader, desc="Training exit heads"):
+            input_ids = batch['input_ids'].to(device)
+            attention_mask = batch['attention_mask'].to(device)
+            labels = batch['labels'].to(device)
+
+            with torch.no_grad():
+                hidden_states = model(input_ids=input_ids, attention_mask=attention_mask,
+                                      output_hidden_states=True).hidden_states
+
+            optimizer.zero_grad()
+            loss = exit_heads_loss(heads, hidden_states, labels)
+            total_loss += loss.item()
+            loss.backward()
+            optimizer.step()
+        print(f"Train Loss: {total_loss / len(train_dataloader):.4f}")
+
+        layer_f1 = evaluate_exit_heads(model, heads, dev_dataloader, device, config.IDS_TO_TAGS)
+        print("Validation F1: " + " | ".join(f"layer {layer}: {f1:.4f}" for layer, f1 in layer_f1.items()))
+
+        # Lưu lại exit heads tốt nhất dựa trên F1 trung bình của các head
+        mean_f1 = sum(layer_f1.values()) / len(layer_f1)
+        if mean_f1 > best_f1:
+            best_f1 = mean_f1
+            path = heads.save(config.MODEL_OUTPUT_DIR, checkpoint_signature(config.MODEL_OUTPUT_DIR))
+            print(f"New best mean F1: {best_f1:.4f}. Saved exit heads to {path}")
+
+    print("\nExit head training finished!")
+
+
 if __name__ == "__main__":
-    run_training()
+    parser = argparse.ArgumentParser(description="Huấn luyện mô hình NER.")
+    parser.add_argument("--distill", action="store_true",
+                        help="Distill model đã fine-tune sang student nhỏ hơn (xem config.py, mục 7)")
+    parser.add_argument("--early-exit", action="store_true",
+                        help="Huấn luyện exit heads cho model đã fine-tune (xem config.py, mục 8)")
+    args = parser.parse_args()
+
+    if args.distill:
+        run_distillation()
+    elif args.early_exit:
+        run_early_exit_training()
+    else:
+        run_training()
@@ -0,0 +1,204 @@
+# tests/test_gemini_splitter.py
+"""
+Kiểm thử client Gemini và việc tách văn bản theo khoảng câu với một server giả lập cục bộ
+(không gọi Gemini thật).
+
+Chạy: python -m pytest tests  hoặc  python -m unittest discover tests
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import config as ner_config
+from src.patient_extraction import gemini_splitter
+
+
+def boundary_ranges(prompt: str):
+    """
+    Trả lời giống Gemini cho prompt đánh số câu: mỗi câu "BN..." mở một bệnh nhân mới,
+    câu "Ghi chú..." không thuộc bệnh nhân nào, câu đầu cửa sổ luôn thuộc một khoảng
+    """
+    ranges = []
+    current = None
+    for number, sentence in re.findall(r"^\[(\d+)\] (.*)$", prompt, re.M):
+        number = int(number)
+        if sentence.startswith("Ghi chú"):
+            current = None
+        elif current is None or sentence.startswith("BN"):
+            current = [number, number]
+            ranges.append(current)
+        else:
+            current[1] = number
+    return ranges
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests.append(self.client_address)
+            failing = server.failures > 0
+            server.failures -= failing
+
+        if failing:
+            self._send(503, b'{"error": "overloaded"}', {"Retry-After": "0"})
+        elif server.malformed is not None:
+            self._send(200, server.malformed)
+        else:
+            prompt = body["contents"][0]["parts"][0]["text"]
+            answer = json.dumps(boundary_ranges(prompt))
+            self._send(200, json.dumps({"candidates": [{"content": {"parts": [{"text": answer}]}}]}).encode())
+
+    def _send(self, status, data, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGeminiTestCase(unittest.TestCase):
+    """Khởi động server giả lập và trỏ GEMINI_API_ENDPOINT tới nó"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGeminiHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.failures = 0
+        self.server.malformed = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+
+        patcher = mock.patch.object(ner_config, "GEMINI_API_ENDPOINT", self.endpoint)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(gemini_splitter.close)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GeminiClientTest(FakeGeminiTestCase):
+
+    def test_retries_on_server_error(self):
+        self.server.failures = 2
+        client = gemini_splitter.GeminiClient("key", max_retries=2)
+        self.assertEqual(json.loads(client.generate("[0] BN1 nam.", "model")), [[0, 0]])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.failures = 5
+        client = gemini_splitter.GeminiClient("key", max_retries=1)
+        with self.assertRaises(gemini_splitter.GeminiAPIError):
+            client.generate("[0] BN1 nam.", "model")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_reuses_keep_alive_connection(self):
+        client = gemini_splitter.GeminiClient("key")
+        for _ in range(3):
+            client.generate("[0] BN1 nam.", "model")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set(self.server.requests)), 1)
+
+    def test_malformed_response(self):
+        client = gemini_splitter.GeminiClient("key", max_retries=0)
+        self.server.malformed = b"<html>not json</html>"
+        with self.assertRaises(gemini_splitter.GeminiAPIError):
+            client.generate("[0] BN1 nam.", "model")
+        self.server.malformed = b'{"promptFeedback": {"blockReason": "OTHER"}}'
+        with self.assertRaises(gemini_splitter.GeminiAPIError):
+            client.generate("[0] BN1 nam.", "model")
+
+    def test_shared_clients_are_bounded(self):
+        with mock.patch.object(ner_config, "GEMINI_CLIENT_CACHE_SIZE", 2):
+            first = gemini_splitter.get_gemini_client("key-1")
+            self.assertIs(gemini_splitter.get_gemini_client("key-1"), first)
+            second = gemini_splitter.get_gemini_client("key-2")
+            gemini_splitter.get_gemini_client("key-1")
+            gemini_splitter.get_gemini_client("key-3")
+            self.assertTrue(second._closed)
+            self.assertFalse(first._closed)
+            self.assertIsNot(gemini_splitter.get_gemini_client("key-2"), second)
+        gemini_splitter.close()
+        self.assertTrue(first._closed)
+
+
+class BoundarySplitTest(FakeGeminiTestCase):
+
+    def make_document(self):
+        sentences = []
+        for index in range(1, 13):
+            sentences.append(f"BN{index} nam, {20 + index} tuổi, sống tại quận {index}.")
+            sentences.append(f"Bệnh nhân tiếp xúc với ca bệnh ngày {index}/7.")
+            sentences.append(f"Hiện đang cách ly tại bệnh viện số {index}.")
+            if index % 3 == 0:
+                sentences.append(f"Ghi chú: thông tin nhóm {index // 3} do CDC cung cấp.")
+        return " ".join(sentences)
+
+    def split(self, text, window_chars):
+        with mock.patch.object(ner_config, "GEMINI_WINDOW_CHARS", window_chars):
+            splitter = gemini_splitter.GeminiTextSplitter("key", mode="boundaries", use_cache=False)
+            return splitter.split_text_by_patients(text, return_metadata=True)
+
+    def test_windowed_and_single_prompt_cut_the_same_segments(self):
+        text = self.make_document()
+        single, single_meta = self.split(text, len(text) + 1)
+        self.assertEqual(len(self.server.requests), 1)
+        windowed, windowed_meta = self.split(text, 300)
+        self.assertGreater(len(self.server.requests), 3)
+
+        self.assertNotIn("error", single_meta)
+        self.assertNotIn("error", windowed_meta)
+        self.assertEqual(windowed, single)
+        self.assertEqual(len(single), 12)
+        for index, segment in enumerate(single, 1):
+            self.assertTrue(segment.startswith(f"BN{index} "))
+            self.assertTrue(segment.endswith(f"bệnh viện số {index}."))
+            self.assertNotIn("Ghi chú", segment)
+
+
+class SplitCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_concurrent_writes_leave_one_complete_file(self):
+        cache = gemini_splitter.SplitCache(8, self.cache_dir)
+        threads = [
+            threading.Thread(target=cache.put, args=("key", [f"đoạn {index}"] * 200))
+            for index in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(os.listdir(self.cache_dir), ["key.json"])
+        segments = gemini_splitter.SplitCache(8, self.cache_dir).get("key")
+        self.assertEqual(len(segments), 200)
+        self.assertEqual(len(set(segments)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+# tests/test_local_splitter.py
+"""
+Kiểm thử tách văn bản theo PATIENT_ID (src/patient_extraction/local_splitter.py)
+với danh sách entity viết sẵn, không cần model.
+
+Chạy: python -m pytest tests  hoặc  python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.patient_extraction.local_splitter import LocalPatientSplitter, split_text_locally
+
+
+def patient_ids(text, *mentions, confidence=0.99):
+    """Entity PATIENT_ID cho từng mã trong mentions (lần xuất hiện tiếp theo trong text)"""
+    entities = []
+    cursor = 0
+    for mention in mentions:
+        start = text.index(mention, cursor)
+        cursor = start + len(mention)
+        entities.append({'text': mention, 'tag': 'PATIENT_ID', 'start': start, 'end': cursor,
+                         'confidence': confidence})
+    return entities
+
+
+class StubPredictor:
+    """Predictor giả: trả về entities cho trước và đếm số lần được gọi"""
+
+    def __init__(self, entities):
+        self.entities = entities
+        self.calls = 0
+
+    def predict(self, text):
+        self.calls += 1
+        return self.entities
+
+
+class LocalSplitterTest(unittest.TestCase):
+
+    def split(self, text, entities, **kwargs):
+        return split_text_locally(text, StubPredictor(entities), return_metadata=True, **kwargs)
+
+    def test_splits_on_patient_id_anchors(self):
+        text = "BN101, nam, 30 tuổi, ở Hà Nội. Là F1 của BN55. BN102, nữ, 25 tuổi. Đã cách ly."
+        segments, metadata = self.split(text, patient_ids(text, "BN101", "BN55", "BN102"))
+
+        self.assertEqual(segments, ["BN101, nam, 30 tuổi, ở Hà Nội. Là F1 của BN55.",
+                                    "BN102, nữ, 25 tuổi. Đã cách ly."])
+        self.assertEqual(metadata['method'], 'local')
+        self.assertEqual(metadata['num_segments'], 2)
+        self.assertNotIn('reason', metadata)
+
+    def test_preamble_belongs_to_first_patient(self):
+        text = "Bộ Y tế thông báo 2 ca mắc mới. BN101, nam, 30 tuổi. BN102, nữ, 25 tuổi."
+        segments, _ = self.split(text, patient_ids(text, "BN101", "BN102"))
+
+        self.assertEqual(segments, ["Bộ Y tế thông báo 2 ca mắc mới. BN101, nam, 30 tuổi.",
+                                    "BN102, nữ, 25 tuổi."])
+
+    def test_numbered_list_keeps_the_number_with_its_patient(self):
+        text = "1. Bệnh nhân 567: nam, 30 tuổi. 2. Bệnh nhân 568: nữ, 25 tuổi."
+        segments, _ = self.split(text, patient_ids(text, "567", "568"))
+
+        self.assertEqual(segments, ["1. Bệnh nhân 567: nam, 30 tuổi.", "2. Bệnh nhân 568: nữ, 25 tuổi."])
+
+    def test_same_patient_repeated_stays_in_one_segment(self):
+        text = "BN101, nam, 30 tuổi. BN101 đã có kết quả âm tính. BN102, nữ."
+        segments, _ = self.split(text, patient_ids(text, "BN101", "BN101", "BN102"))
+
+        self.assertEqual(segments, ["BN101, nam, 30 tuổi. BN101 đã có kết quả âm tính.", "BN102, nữ."])
+
+    def test_no_patient_id_is_ambiguous(self):
+        text = "Một người đàn ông 30 tuổi ở Hà Nội. Một phụ nữ 25 tuổi ở Huế."
+        segments, metadata = self.split(text, [])
+
+        self.assertIsNone(segments)
+        self.assertEqual(metadata['num_segments'], 0)
+        self.assertIn('reason', metadata)
+
+    def test_no_anchor_sentence_is_ambiguous(self):
+        text = "Hai ca mắc mới là F1 của BN55 và BN56."
+        segments, _ = self.split(text, patient_ids(text, "BN55", "BN56"))
+
+        self.assertIsNone(segments)
+
+    def test_interleaved_patients_are_ambiguous(self):
+        text = "BN101, nam, 30 tuổi. BN102, nữ, 25 tuổi. BN101 sống tại Hà Nội."
+        segments, metadata = self.split(text, patient_ids(text, "BN101", "BN102", "BN101"))
+
+        self.assertIsNone(segments)
+        self.assertIn("BN101", metadata['reason'])
+
+    def test_low_confidence_anchor_is_ambiguous(self):
+        text = "BN101, nam, 30 tuổi. BN102, nữ, 25 tuổi."
+        for confidence in (0.5, 0.0):
+            entities = patient_ids(text, "BN101") + patient_ids(text, "BN102", confidence=confidence)
+            segments, metadata = self.split(text, entities)
+
+            self.assertIsNone(segments, confidence)
+            self.assertIn("BN102", metadata['reason'])
+
+    def test_missing_confidence_counts_as_confident(self):
+        text = "BN101, nam, 30 tuổi. BN102, nữ."
+        entities = patient_ids(text, "BN101", "BN102")
+        for entity in entities:
+            del entity['confidence']
+
+        self.assertEqual(len(self.split(text, entities)[0]), 2)
+
+    def test_runs_predictor_only_without_entities(self):
+        text = "BN101, nam. BN102, nữ."
+        entities = patient_ids(text, "BN101", "BN102")
+        predictor = StubPredictor(entities)
+
+        self.assertEqual(len(split_text_locally(text, predictor)), 2)
+        self.assertEqual(predictor.calls, 1)
+        self.assertEqual(len(split_text_locally(text, predictor, entities=entities)), 2)
+        self.assertEqual(predictor.calls, 1)
+
+    def test_find_segments_covers_the_whole_text(self):
+        text = "Tin ngày 1/8. BN101, nam. Là F1 của BN55. BN102, nữ. Đã cách ly."
+        spans, reason = LocalPatientSplitter(StubPredictor([])).find_segments(
+            text, patient_ids(text, "BN101", "BN55", "BN102")
+        )
+
+        self.assertIsNone(reason)
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(text))
+        self.assertEqual([text[start:end] for start, end in spans],
+                         ["Tin ngày 1/8. BN101, nam. Là F1 của BN55. ", "BN102, nữ. Đã cách ly."])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# tests/test_segment_alignment.py
+"""
+Kiểm thử căn đoạn về văn bản gốc và lấy entity theo offset
+(src/patient_extraction/segment_alignment.py).
+
+Chạy: python -m pytest tests  hoặc  python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.patient_extraction.segment_alignment import align_segments, entities_in_span
+
+
+TEXT = "BN101, nam,  30 tuổi,\nở Hà Nội.\n\nBN102, nữ, 25 tuổi, ở Huế. Đã cách ly."
+
+
+def entity(text, value, tag):
+    start = text.index(value)
+    return {'text': value, 'tag': tag, 'start': start, 'end': start + len(value), 'confidence': 0.9}
+
+
+class AlignSegmentsTest(unittest.TestCase):
+
+    def test_verbatim_segments(self):
+        segments = ["BN101, nam,  30 tuổi,\nở Hà Nội.", "  BN102, nữ, 25 tuổi, ở Huế. Đã cách ly.\n"]
+        spans = align_segments(TEXT, segments)
+
+        self.assertEqual([TEXT[start:end] for start, end in spans],
+                         [segment.strip() for segment in segments])
+
+    def test_whitespace_differences(self):
+        segments = ["BN101, nam, 30 tuổi, ở Hà Nội.", "BN102, nữ, 25 tuổi,\nở Huế.  Đã cách ly."]
+        spans = align_segments(TEXT, segments)
+
+        self.assertEqual([TEXT[start:end] for start, end in spans],
+                         ["BN101, nam,  30 tuổi,\nở Hà Nội.", "BN102, nữ, 25 tuổi, ở Huế. Đã cách ly."])
+
+    def test_rewritten_segment_is_not_aligned(self):
+        segments = ["Bệnh nhân 101 là nam, 30 tuổi, sống ở Hà Nội.", "BN102, nữ, 25 tuổi, ở Huế. Đã cách ly."]
+        spans = align_segments(TEXT, segments)
+
+        self.assertIsNone(spans[0])
+        self.assertEqual(TEXT[spans[1][0]:spans[1][1]], segments[1])
+
+    def test_empty_segment_is_not_aligned(self):
+        self.assertEqual(align_segments(TEXT, ["   "]), [None])
+
+    def test_repeated_segment_prefers_the_next_occurrence(self):
+        text = "Đã cách ly. BN1, nam. Đã cách ly. BN2, nữ. Đã cách ly."
+        spans = align_segments(text, ["Đã cách ly.", "BN2, nữ.", "Đã cách ly."])
+
+        self.assertEqual(spans[0], (0, 11))
+        self.assertEqual(spans[2], (len(text) - 11, len(text)))
+
+
+class EntitiesInSpanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.entities = [
+            entity(TEXT, "BN101", "PATIENT_ID"),
+            entity(TEXT, "Hà Nội", "LOCATION"),
+            entity(TEXT, "BN102", "PATIENT_ID"),
+            entity(TEXT, "25", "AGE"),
+            entity(TEXT, "Huế", "LOCATION"),
+        ]
+
+    def test_offsets_are_rebased_to_the_segment(self):
+        for start, end in align_segments(TEXT, ["BN101, nam, 30 tuổi, ở Hà Nội.", "BN102, nữ, 25 tuổi, ở Huế."]):
+            segment = TEXT[start:end]
+            for item in entities_in_span(self.entities, start, end):
+                self.assertEqual(segment[item['start']:item['end']], item['text'])
+
+        start = TEXT.index("BN102")
+        found = entities_in_span(self.entities, start, len(TEXT))
+        self.assertEqual([item['text'] for item in found], ["BN102", "25", "Huế"])
+        self.assertEqual(found[0]['start'], 0)
+
+    def test_entities_crossing_the_span_are_dropped(self):
+        start = TEXT.index("Nội")
+        found = entities_in_span(self.entities, start, TEXT.index("25") + 1)
+
+        self.assertEqual([item['text'] for item in found], ["BN102"])
+
+    def test_returns_copies(self):
+        found = entities_in_span(self.entities, 0, len(TEXT))
+        found[0]['start'] = -1
+
+        self.assertEqual(self.entities[0]['start'], 0)
+        self.assertEqual(found[1]['confidence'], 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()